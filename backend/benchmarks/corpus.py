@@ -0,0 +1,252 @@
+"""
+Synthetic Mojify corpus for the search benchmarks.
+
+Seeded, so every run at a given size indexes the same rows: situational
+prompt titles with a sentence of context, agents, and proposals pairing an
+emoji string (ZWJ sequences, skin tones, flags, emoticons included) with a
+one-line rationale. Written to a standalone SQLite file that stands in
+for the Postgres source tables (and the search_changes log their triggers
+keep); SourcePool serves sync_search_index's queries from it.
+"""
+from __future__ import annotations
+
+import json
+import random
+import re
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+_CHUNK = 10_000  # rows per executemany
+
+_SUBJECTS = (
+    "code", "boss", "cat", "dog", "landlord", "roommate", "pizza", "coffee", "deadline",
+    "wifi", "printer", "meeting", "exam", "flight", "train", "party", "wedding", "gym",
+    "haircut", "phone", "laptop", "playlist", "group chat", "birthday", "weekend", "rain",
+    "sunset", "taco", "burrito", "sushi", "date", "interview", "promotion", "vacation",
+)
+_SITUATIONS = (
+    "When your {s} finally works", "That moment your {s} ghosts you", "Monday morning {s}",
+    "Your {s} at 3am", "Explaining the {s} to your parents", "The {s} went viral",
+    "First day with the new {s}", "Pretending to like the {s}", "Waiting for the {s}",
+    "The {s} is on fire again", "Best {s} ever", "Lost the {s} somewhere", "Surprise {s}",
+)
+_CONTEXT = (
+    "Friend texted about it", "Happened during standup", "Nobody saw it coming",
+    "Posted in the family group", "Third time this week", "Still can't believe it",
+    "Everyone reacted at once", "It was a long day", "Told the whole office", "",
+)
+_AGENT_STYLES = ("emoji", "vibe", "meme", "pun", "mood", "spark", "echo", "pixel", "glyph")
+_EMOJI = (
+    "😂", "🔥", "💀", "😭", "🙏", "✨", "🎉", "😅", "🤔", "👀", "💯", "🥲", "😤", "🫠", "🤡",
+    "🍕", "☕", "🌮", "🍣", "🐱", "🐶", "🚀", "💻", "📉", "📈", "🌧️", "🌅", "❤️", "💔", "🤝",
+    "👍🏽", "👋🏿", "🙌🏻", "👨‍💻", "👩‍🍳", "🧑‍🚀", "🏳️‍🌈", "❤️‍🔥", "🇯🇵", "🇧🇷", "1️⃣", "#️⃣",
+)
+_EMOTICONS = (":)", ":D", ";)", "<3", "\\o/", "^_^", "-_-", ":/")
+_RATIONALE = (
+    "captures the {a} perfectly", "the {a} energy is unmatched", "pure {a} vibes",
+    "because {a} says it all", "this is peak {a}", "{a} and chaos together",
+    "nothing says {a} like this", "the universal {a} reaction",
+)
+_ADJECTIVES = (
+    "panic", "joy", "regret", "relief", "chaos", "cringe", "victory", "disbelief", "comfort",
+    "hunger", "exhaustion", "nostalgia", "smugness", "confusion", "triumph", "awkward",
+)
+
+_EPOCH = datetime(2025, 1, 1)
+
+
+class SourcePool:
+    """
+    asyncpg pool stand-in over a corpus file, for sync_search_index: $n
+    placeholders and = ANY($n::text[]) are rewritten for SQLite, and every
+    logged change counts as committed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield _SourceConnection(conn)
+        finally:
+            conn.close()
+
+
+class _SourceConnection:
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def _run(self, sql: str, args: tuple) -> sqlite3.Cursor:
+        if "txid_snapshot_xmin" in sql:
+            sql = "SELECT COALESCE(MAX(txid), 0) + 1 FROM search_changes"
+        sql = re.sub(r"= ANY\(\$(\d+)::text\[\]\)", r"IN (SELECT value FROM json_each(?\1))", sql)
+        sql = re.sub(r"\$(\d+)", r"?\1", sql)
+        params = [
+            json.dumps(a) if isinstance(a, list)
+            else a.strftime("%Y-%m-%d %H:%M:%S") if isinstance(a, datetime) else a
+            for a in args
+        ]
+        return self._conn.execute(sql, params)
+
+    async def fetch(self, sql: str, *args) -> list[sqlite3.Row]:
+        return self._run(sql, args).fetchall()
+
+    async def fetchval(self, sql: str, *args):
+        row = self._run(sql, args).fetchone()
+        return row[0] if row else None
+
+    async def execute(self, sql: str, *args) -> None:
+        self._run(sql, args)
+        self._conn.commit()
+
+
+def _timestamp(i: int) -> str:
+    return (_EPOCH + timedelta(seconds=i)).isoformat()
+
+
+def _prompt(rng: random.Random, i: int) -> tuple[str, str, str, str]:
+    title = rng.choice(_SITUATIONS).format(s=rng.choice(_SUBJECTS))
+    return f"bp{i:08d}", title, rng.choice(_CONTEXT), _timestamp(2 * i)
+
+
+def _emoji_string(rng: random.Random) -> str:
+    parts = rng.sample(_EMOJI, rng.randint(1, 4))
+    if rng.random() < 0.1:
+        parts.append(" " + rng.choice(_EMOTICONS))
+    return "".join(parts)
+
+
+def _proposal(rng: random.Random, i: int, prompts: int, agents: int) -> tuple:
+    return (
+        f"br{i:08d}",
+        f"bp{rng.randrange(prompts):08d}",
+        f"ba{rng.randrange(agents):06d}",
+        _emoji_string(rng),
+        rng.choice(_RATIONALE).format(a=rng.choice(_ADJECTIVES)),
+        _timestamp(2 * i + 1),
+    )
+
+
+def create(path: str, prompts: int, proposals: int | None = None, agents: int | None = None, seed: int = 7) -> dict:
+    """
+    Write a corpus of `prompts` prompts, `proposals` proposals (default: as
+    many as prompts) and `agents` agents (default: one per 100 prompts) to
+    a new SQLite file at path. Returns the row counts.
+    """
+    proposals = prompts if proposals is None else proposals
+    agents = agents or max(10, prompts // 100)
+    rng = random.Random(seed)
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(
+            """
+            CREATE TABLE agents (id TEXT PRIMARY KEY, name TEXT, created_at TEXT);
+            CREATE TABLE prompts (id TEXT PRIMARY KEY, title TEXT, context_text TEXT,
+                                  status TEXT DEFAULT 'open', created_at TEXT);
+            CREATE TABLE proposals (id TEXT PRIMARY KEY, prompt_id TEXT, agent_id TEXT,
+                                    emoji_string TEXT, rationale TEXT, created_at TEXT);
+            CREATE TABLE search_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, txid INTEGER NOT NULL,
+                                         entity_type TEXT, entity_id TEXT, op TEXT,
+                                         changed_at TEXT DEFAULT CURRENT_TIMESTAMP);
+            CREATE INDEX idx_proposals_prompt_id ON proposals (prompt_id);
+            """
+        )
+        conn.executemany(
+            "INSERT INTO agents (id, name, created_at) VALUES (?, ?, ?)",
+            [
+                (f"ba{i:06d}", f"{rng.choice(_AGENT_STYLES).title()}{rng.choice(_SUBJECTS).title()}{i}", _timestamp(i))
+                for i in range(agents)
+            ],
+        )
+        for start in range(0, prompts, _CHUNK):
+            conn.executemany(
+                "INSERT INTO prompts (id, title, context_text, created_at) VALUES (?, ?, ?, ?)",
+                [_prompt(rng, i) for i in range(start, min(start + _CHUNK, prompts))],
+            )
+        for start in range(0, proposals, _CHUNK):
+            conn.executemany(
+                """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [_proposal(rng, i, prompts, agents) for i in range(start, min(start + _CHUNK, proposals))],
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return {"prompts": prompts, "proposals": proposals, "agents": agents}
+
+
+def add_delta(path: str, new: int, updates: int, seed: int = 8) -> dict:
+    """
+    Append `new` prompts and proposals after the existing rows and retitle
+    `updates` existing prompts, logging the inserts, the retitles and the
+    proposals they re-title as migrations 4 and 6's triggers would — the
+    work an incremental sync picks up.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        prompts = conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+        proposals = conn.execute("SELECT COUNT(*) FROM proposals").fetchone()[0]
+        agents = conn.execute("SELECT COUNT(*) FROM agents").fetchone()[0]
+        new_prompts = [_prompt(rng, i) for i in range(prompts, prompts + new)]
+        new_proposals = [_proposal(rng, i, prompts + new, agents) for i in range(proposals, proposals + new)]
+        conn.executemany(
+            "INSERT INTO prompts (id, title, context_text, created_at) VALUES (?, ?, ?, ?)", new_prompts,
+        )
+        conn.executemany(
+            """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            new_proposals,
+        )
+        txid = conn.execute("SELECT COALESCE(MAX(txid), 0) + 1 FROM search_changes").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO search_changes (txid, entity_type, entity_id, op) VALUES (?, ?, ?, 'upsert')",
+            [(txid, "prompt", row[0]) for row in new_prompts] + [(txid, "proposal", row[0]) for row in new_proposals],
+        )
+        retitles = [
+            (rng.choice(_SITUATIONS).format(s=rng.choice(_SUBJECTS)), f"bp{rng.randrange(prompts):08d}")
+            for _ in range(updates)
+        ]
+        conn.executemany("UPDATE prompts SET title = ? WHERE id = ?", retitles)
+        txid += 1
+        for _, prompt_id in retitles:
+            conn.execute(
+                "INSERT INTO search_changes (txid, entity_type, entity_id, op) VALUES (?, 'prompt', ?, 'upsert')",
+                (txid, prompt_id),
+            )
+            conn.execute(
+                """INSERT INTO search_changes (txid, entity_type, entity_id, op)
+                   SELECT ?, 'proposal', id, 'upsert' FROM proposals WHERE prompt_id = ?""",
+                (txid, prompt_id),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return {"new": 2 * new, "updates": updates}
+
+
+def queries(n: int, seed: int = 9) -> list[str]:
+    """A mix of the query shapes /api/search sees: words, phrases, prefixes, emoji, emoticons."""
+    rng = random.Random(seed)
+    out: list[str] = []
+    for _ in range(n):
+        shape = rng.random()
+        if shape < 0.35:
+            out.append(rng.choice(_SUBJECTS))
+        elif shape < 0.6:
+            out.append(f"{rng.choice(_SUBJECTS)} {rng.choice(_ADJECTIVES)}")
+        elif shape < 0.75:
+            word = rng.choice(_SUBJECTS + _ADJECTIVES)
+            out.append(word[:max(2, len(word) // 2)])  # typeahead-style prefix
+        elif shape < 0.9:
+            out.append(rng.choice(_EMOJI))
+        elif shape < 0.95:
+            out.append(rng.choice(_EMOTICONS))
+        else:
+            out.append(f"{rng.choice(_SUBJECTS)} {rng.choice(_EMOJI)}")
+    return out
@@ -0,0 +1,254 @@
+"""
+Search benchmarks: index build, incremental sync and query latency.
+
+  python -m benchmarks.search_bench --size 10k --output bench.json
+  python -m benchmarks.search_bench --size 10k --baseline bench.json   # exit 1 on regression
+
+Run from backend/. --size is the prompt count (10k, 100k, 1m or any
+integer); the corpus has as many proposals as prompts (benchmarks/corpus.py).
+Measured:
+
+  build              sync_search_index(incremental=False) over the corpus
+  incremental_sync   sync_search_index() after ~1% new rows and some retitles
+  fts_query_build    _build_fts_query, per call
+  query.bm25         hybrid_search latency (p50/p95/p99) without the vector leg
+  query.hybrid       the same queries with BM25 + vector + emoji legs
+
+--encoder picks the embedding model: "fake" (default — deterministic hashed
+vectors, so the vector path is measured without model cost and runs are
+comparable across machines), "fastembed" (the production model; slow to
+build at large sizes) or "none" (no vectors; query.hybrid is skipped).
+Every query runs with cold result caches. Results are JSON, written to
+--output or stdout.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import corpus
+from core import search
+
+FORMAT = 1
+
+# Metrics compared against a baseline: (path in results, label)
+_TRACKED = (
+    (("build", "seconds"), "build time"),
+    (("incremental_sync", "seconds"), "incremental sync time"),
+    (("fts_query_build", "ns_per_call"), "_build_fts_query"),
+    (("query", "bm25", "p95_ms"), "BM25 p95"),
+    (("query", "bm25", "p99_ms"), "BM25 p99"),
+    (("query", "hybrid", "p95_ms"), "hybrid p95"),
+    (("query", "hybrid", "p99_ms"), "hybrid p99"),
+)
+
+
+class _FakeEncoder:
+    """fastembed.TextEmbedding stand-in: a seeded random unit-ish vector per text."""
+
+    dim = 384
+
+    def embed(self, texts, batch_size=256, **kwargs):
+        import numpy as np
+
+        for text in texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+            yield np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+
+
+def _use_encoder(kind: str) -> None:
+    if kind == "fastembed":
+        if search._get_encoder() is None:
+            raise SystemExit("fastembed is not installed; use --encoder fake or none")
+        return
+    encoder = _FakeEncoder() if kind == "fake" else None
+    search._get_encoder = lambda: encoder
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _timed(fn, *args, **kwargs) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def _summary(samples: list[float]) -> dict:
+    """Latency percentiles in milliseconds for per-query samples in seconds."""
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "queries": len(samples),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "qps": round(len(samples) / sum(samples), 1) if sum(samples) else None,
+    }
+
+
+def _query_latency(db: str, queries: list[str], limit: int, warmup: int) -> dict:
+    for q in queries[:warmup]:  # loads the vector store, connections, encoder
+        search.hybrid_search(q, limit=limit, db_path=db)
+    samples = []
+    hits = 0
+    for q in queries:
+        search.clear_search_caches()
+        seconds, results = _timed(search.hybrid_search, q, limit=limit, db_path=db)
+        samples.append(seconds)
+        hits += bool(results)
+    out = _summary(samples)
+    out["hit_rate"] = round(hits / len(queries), 4)
+    return out
+
+
+def _fts_query_build(queries: list[str], calls: int = 100_000) -> dict:
+    reps = max(1, calls // len(queries))
+    started = time.perf_counter_ns()
+    for _ in range(reps):
+        for q in queries:
+            search._build_fts_query(q)
+    elapsed = time.perf_counter_ns() - started
+    return {"calls": reps * len(queries), "ns_per_call": round(elapsed / (reps * len(queries)), 1)}
+
+
+def run(
+    size: int,
+    workdir: str,
+    encoder: str = "fake",
+    n_queries: int = 500,
+    limit: int = 20,
+    warmup: int = 20,
+    sharded: bool = False,
+    seed: int = 7,
+) -> dict:
+    """Build a corpus of `size` prompts under workdir, benchmark it and return the report."""
+    _use_encoder(encoder)
+    search._SHARDED = sharded
+    db = os.path.join(workdir, f"bench-{size}.db")
+    source = os.path.join(workdir, f"bench-{size}-source.db")
+    for path in [db, source, *(search.shard_file(db, t) for t in search.ENTITY_TYPES)]:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    search.close_search_connections()
+    search.invalidate_vector_cache()
+    search.clear_search_caches()
+
+    seconds, counts = _timed(corpus.create, source, size, seed=seed)
+    pool = corpus.SourcePool(source)
+
+    async def get_pool():
+        return pool
+
+    search.get_pool = get_pool
+    report: dict = {
+        "benchmark": "search",
+        "format": FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "size": size, "encoder": encoder, "queries": n_queries, "limit": limit,
+            "sharded": sharded, "seed": seed,
+        },
+        "corpus": {**counts, "generate_seconds": round(seconds, 3)},
+        "results": {},
+    }
+    results = report["results"]
+
+    search.init_search_tables(db)
+    seconds, indexed = _timed(asyncio.run, search.sync_search_index(db, incremental=False))
+    results["build"] = {"seconds": round(seconds, 3), "rows": indexed, "rows_per_sec": round(indexed / seconds, 1)}
+
+    new = max(1, size // 100)
+    delta = corpus.add_delta(source, new, updates=max(1, new // 10), seed=seed + 1)
+    seconds, changed = _timed(asyncio.run, search.sync_search_index(db))
+    results["incremental_sync"] = {"seconds": round(seconds, 3), "rows": changed, **delta}
+
+    queries = corpus.queries(n_queries, seed=seed + 2)
+    results["fts_query_build"] = _fts_query_build(queries)
+
+    vectors = search._get_encoder()
+    search._get_encoder = lambda: None
+    results["query"] = {"bm25": _query_latency(db, queries, limit, warmup)}
+    search._get_encoder = lambda: vectors
+    if vectors is not None:
+        results["query"]["hybrid"] = _query_latency(db, queries, limit, warmup)
+    return report
+
+
+def _lookup(results: dict, path: tuple[str, ...]):
+    for key in path:
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.2) -> list[str]:
+    """Tracked metrics more than `tolerance` (fraction) slower than baseline."""
+    regressions = []
+    for path, label in _TRACKED:
+        before = _lookup(baseline.get("results", {}), path)
+        after = _lookup(current.get("results", {}), path)
+        if before and after is not None and after > before * (1 + tolerance):
+            regressions.append(f"{label}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="10k", help="prompts (and proposals) in the corpus: 10k, 100k, 1m, ...")
+    parser.add_argument("--encoder", choices=("fake", "fastembed", "none"), default="fake")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--sharded", action="store_true", help="benchmark the SEARCH_SHARDED layout")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="where the corpus and index are built (default: a temp dir)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="search-bench-") as tmp:
+        report = run(
+            parse_size(args.size), args.workdir or tmp, args.encoder, args.queries,
+            args.limit, args.warmup, args.sharded, args.seed,
+        )
+        search.close_search_connections()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print("warning: baseline was run with different parameters", file=sys.stderr)
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index for search vectors.
+
+Vectors are partitioned into `nlist` cells by spherical k-means; a query
+scores only the rows in its `nprobe` closest cells. Centroids are persisted
+to a sidecar .npz next to the search DB so restarts skip training — row
+assignments are recomputed on load (one matrix product).
+
+Knobs (env):
+  SEARCH_ANN=ivf           enable the index (default: exhaustive scan only)
+  SEARCH_ANN_MIN_ROWS      build only for entity types with at least this many rows
+  SEARCH_ANN_NLIST         number of cells (0 = ~4·sqrt(rows))
+  SEARCH_ANN_NPROBE        cells scanned per query — higher = better recall, slower
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANN_ENABLED = os.getenv("SEARCH_ANN", "").strip().lower() in ("1", "true", "yes", "ivf")
+ANN_MIN_ROWS = int(os.getenv("SEARCH_ANN_MIN_ROWS", "20000"))
+ANN_NLIST = int(os.getenv("SEARCH_ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("SEARCH_ANN_NPROBE", "8"))
+
+# Retrain once the corpus has grown this much past the rows centroids were fit on
+_RETRAIN_GROWTH = 4
+_TRAIN_SAMPLE = 50_000
+_ASSIGN_CHUNK = 8192
+
+
+def sidecar_path(db_path: str) -> str:
+    return f"{db_path}.ivf.npz"
+
+
+class IVFIndex:
+    """Unit-norm centroids plus the row count they were trained on."""
+
+    __slots__ = ("centroids", "trained_rows")
+
+    def __init__(self, centroids: np.ndarray, trained_rows: int):
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self.trained_rows = trained_rows
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int = 0, iters: int = 10, seed: int = 0) -> "IVFIndex":
+        """Spherical k-means over (a sample of) unit-norm rows."""
+        n = vectors.shape[0]
+        if nlist <= 0:
+            nlist = max(1, int(4 * math.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=min(n, _TRAIN_SAMPLE), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] < 1e-9
+            centroids = np.where(empty[:, None], centroids, sums / np.maximum(norms, 1e-9))
+        return cls(centroids, n)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest cell for each row (chunked to bound the temporary matrix)."""
+        out = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], _ASSIGN_CHUNK):
+            chunk = vectors[start:start + _ASSIGN_CHUNK]
+            out[start:start + chunk.shape[0]] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return out
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Ids of the nprobe cells closest to query."""
+        sims = self.centroids @ query
+        if nprobe >= self.nlist:
+            return np.arange(self.nlist)
+        return np.argpartition(sims, self.nlist - nprobe)[self.nlist - nprobe:]
+
+    def stale(self, rows: int) -> bool:
+        return rows > self.trained_rows * _RETRAIN_GROWTH
+
+
+def save(path: str, indexes: dict[str, IVFIndex]) -> None:
+    """Atomically write per-entity-type centroids to the sidecar file."""
+    arrays: dict[str, np.ndarray] = {}
+    for etype, index in indexes.items():
+        arrays[f"{etype}__centroids"] = index.centroids
+        arrays[f"{etype}__trained"] = np.array(index.trained_rows)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load(path: str) -> dict[str, IVFIndex]:
+    """Read the sidecar; a missing or corrupt file yields no indexes."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path) as data:
+            return {
+                key[: -len("__centroids")]: IVFIndex(
+                    data[key], int(data[key.replace("__centroids", "__trained")])
+                )
+                for key in data.files
+                if key.endswith("__centroids")
+            }
+    except Exception as exc:
+        logger.warning("Ignoring unreadable ANN sidecar %s: %s", path, exc)
+        return {}
@@ -0,0 +1,84 @@
+"""
+Reconciliation for the denormalized vote counters.
+
+proposals.net_votes and prompts.total_votes / proposal_count are kept up
+to date on write: the vote upsert in routers/votes.py and INSERT_PROPOSAL
+in core/database.py change them in the same statement as the row they
+count. reconcile() recomputes them from votes and proposals and repairs
+any drift, e.g. from rows written by hand or by older code. run_reconciler()
+runs it every VOTE_RECONCILE_INTERVAL seconds (0 = off); the admin API can
+trigger it with POST /api/admin/db/reconcile-votes.
+"""
+import asyncio
+import logging
+import os
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = int(os.getenv("VOTE_RECONCILE_INTERVAL", "3600"))
+
+_RETRIES = 3
+
+_FIX_PROPOSALS = """
+    UPDATE proposals pr SET net_votes = s.net
+    FROM (
+        SELECT pr2.id, COALESCE(SUM(v.value), 0) AS net
+        FROM proposals pr2
+        LEFT JOIN votes v ON v.proposal_id = pr2.id
+        GROUP BY pr2.id
+    ) s
+    WHERE s.id = pr.id AND pr.net_votes <> s.net
+"""
+
+_FIX_PROMPTS = """
+    UPDATE prompts p SET total_votes = s.total, proposal_count = s.n
+    FROM (
+        SELECT p2.id, COALESCE(SUM(pr.net_votes), 0) AS total, COUNT(pr.id) AS n
+        FROM prompts p2
+        LEFT JOIN proposals pr ON pr.prompt_id = p2.id
+        GROUP BY p2.id
+    ) s
+    WHERE s.id = p.id AND (p.total_votes <> s.total OR p.proposal_count <> s.n)
+"""
+
+
+def _count(status: str) -> int:
+    return int(status.split()[-1])  # "UPDATE n"
+
+
+async def reconcile(conn: asyncpg.Connection) -> dict:
+    """Recompute the counters on conn; returns how many proposals and prompts were wrong."""
+    # Repeatable read: a vote committed after the recount snapshot makes the
+    # UPDATE fail with a serialization error (then retried) instead of
+    # overwriting the newer counter with the older total.
+    for attempt in range(_RETRIES):
+        try:
+            async with conn.transaction(isolation="repeatable_read"):
+                proposals = _count(await conn.execute(_FIX_PROPOSALS))
+                prompts = _count(await conn.execute(_FIX_PROMPTS))
+            break
+        except asyncpg.SerializationError:
+            if attempt == _RETRIES - 1:
+                raise
+            await asyncio.sleep(0.1 * (attempt + 1))
+    if proposals or prompts:
+        logger.warning("Repaired vote counters: %d proposals, %d prompts", proposals, prompts)
+    return {"proposals": proposals, "prompts": prompts}
+
+
+async def run_reconciler(interval: int = RECONCILE_INTERVAL) -> None:
+    """Background loop: reconcile every interval seconds. Cancel to stop."""
+    if interval <= 0:
+        return
+    from core.database import get_pool
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await reconcile(conn)
+        except Exception:
+            logger.exception("Vote counter reconciliation failed")
@@ -1,7 +1,15 @@
+import asyncio
+import functools
+import itertools
+import logging
 import os
 import re
+import time
 import uuid
+import weakref
 import asyncpg
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from typing import AsyncGenerator
 
@@ -13,21 +21,114 @@ DATABASE_URL = os.getenv("DATABASE_URL", "")
 SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", "/tmp/search.db")
 DB_PATH = SEARCH_DB_PATH
 
+logger = logging.getLogger(__name__)
+
 _pool: asyncpg.Pool | None = None
 
 
 # ── Placeholder conversion ────────────────────────────────────────────────────
+#
+# Translations are cached per SQL text — the routers use a fixed set of
+# statements, so the regex and the statement-kind check run once each.
 
-def _to_pg(sql: str, params=()):
-    """Convert SQLite ? placeholders to PostgreSQL $1, $2, ..."""
-    i = 0
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))
+
+_PLACEHOLDER = re.compile(r"\?")
+
+
+class _Statement:
+    """A translated statement: PostgreSQL text, whether it returns rows, executions."""
+    __slots__ = ("sql", "returns_rows", "uses")
+
+    def __init__(self, sql: str, returns_rows: bool):
+        self.sql = sql
+        self.returns_rows = returns_rows
+        self.uses = 0
 
-    def repl(_):
-        nonlocal i
-        i += 1
-        return f"${i}"
 
-    return re.sub(r"\?", repl, sql), list(params)
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _translate(sql: str) -> _Statement:
+    counter = itertools.count(1)
+    pg_sql = _PLACEHOLDER.sub(lambda _: f"${next(counter)}", sql)
+    return _Statement(pg_sql, sql.lstrip()[:6].upper().startswith(("SELECT", "WITH")))
+
+
+def _to_pg(sql: str, params=()):
+    """Convert SQLite ? placeholders to PostgreSQL $1, $2, ..."""
+    return _translate(sql).sql, list(params)
+
+
+# ── Prepared statements ───────────────────────────────────────────────────────
+#
+# asyncpg keeps its own per-connection LRU of statements (100 by default), so
+# hot statements — vote upserts, API-key lookups, prompt lists — can be
+# evicted by dynamic SQL (variable-length IN lists, admin queries). Once a
+# statement has run PREPARE_AFTER times, each connection pins an explicit
+# PreparedStatement for it. DB_PREPARE_AFTER=0 turns this off (e.g. behind
+# pgbouncer in transaction mode).
+
+PREPARE_AFTER = int(os.getenv("DB_PREPARE_AFTER", "3"))
+_MAX_PREPARED = 128  # hot statements, each pinned on every connection
+
+# pg sql of hot statements, in the order they became hot (prepared up front
+# on every new pool connection by _init_connection)
+_hot: dict[str, None] = {}
+
+# underlying asyncpg.Connection -> {pg sql: PreparedStatement}
+_prepared: "weakref.WeakKeyDictionary[asyncpg.Connection, dict]" = weakref.WeakKeyDictionary()
+_prepared_stats = {"hits": 0, "prepared": 0, "invalidated": 0}
+
+
+def _raw_conn(conn):
+    """The asyncpg.Connection behind a pool proxy (or conn itself)."""
+    return getattr(conn, "_con", None) or conn
+
+
+def hot_statement(sql: str) -> str:
+    """Mark sql hot from the start, so new connections prepare it in advance. Returns sql."""
+    if PREPARE_AFTER > 0 and len(_hot) < _MAX_PREPARED:
+        _hot[_translate(sql).sql] = None
+    return sql
+
+
+async def _prepared_for(conn, stmt: _Statement):
+    """conn's PreparedStatement for a hot statement, preparing it on first use; else None."""
+    stmt.uses += 1
+    if PREPARE_AFTER <= 0:
+        return None
+    if stmt.sql not in _hot:
+        if stmt.uses < PREPARE_AFTER or len(_hot) >= _MAX_PREPARED:
+            return None
+        _hot[stmt.sql] = None
+    cache = _prepared.setdefault(_raw_conn(conn), {})
+    prepared = cache.get(stmt.sql)
+    if prepared is not None:
+        _prepared_stats["hits"] += 1
+        return prepared
+    prepared = cache[stmt.sql] = await conn.prepare(stmt.sql)
+    _prepared_stats["prepared"] += 1
+    return prepared
+
+
+def statement_stats() -> dict:
+    """Translation cache and prepared statement counters for /api/admin/db/stats."""
+    info = _translate.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "translations": {
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+        },
+        "prepared": {
+            **_prepared_stats,
+            "hot": len(_hot),
+            "connections": len(_prepared),
+            "statements": sum(len(c) for c in list(_prepared.values())),
+        },
+    }
 
 
 # ── Thin aiosqlite-compatible wrapper around asyncpg ─────────────────────────
@@ -45,6 +146,20 @@ class _Cursor:
         return self._rows
 
 
+class _Batch:
+    """Writes queued inside _Conn.batch(); see there."""
+    __slots__ = ("_items",)
+
+    def __init__(self):
+        self._items: list[tuple[str, tuple]] = []
+
+    def execute(self, sql: str, params=()) -> None:
+        self._items.append((sql, tuple(params)))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
 class _Conn:
     __slots__ = ("_conn",)
 
@@ -52,19 +167,90 @@ class _Conn:
         self._conn = conn
 
     async def execute(self, sql: str, params=()):
-        pg_sql, pg_params = _to_pg(sql, params)
-        stripped = sql.strip().upper()
-        if stripped.startswith(("SELECT", "WITH")):
-            rows = await self._conn.fetch(pg_sql, *pg_params)
+        stmt = _translate(sql)
+        # Parameterless statements go over the simple protocol (may hold several statements)
+        prepared = await _prepared_for(self._conn, stmt) if params else None
+        if prepared is not None:
+            try:
+                rows = await prepared.fetch(*params)
+                return _Cursor(list(rows) if stmt.returns_rows else [])
+            except asyncpg.InvalidCachedStatementError:
+                # Schema changed under the plan: drop it and fall through to text
+                _prepared.get(_raw_conn(self._conn), {}).pop(stmt.sql, None)
+                _prepared_stats["invalidated"] += 1
+                if self._conn.is_in_transaction():
+                    raise
+        if stmt.returns_rows:
+            rows = await self._conn.fetch(stmt.sql, *params)
             return _Cursor(list(rows))
-        await self._conn.execute(pg_sql, *pg_params)
+        await self._conn.execute(stmt.sql, *params)
         return _Cursor([])
 
+    async def executemany(self, sql: str, seq_of_params) -> None:
+        """Run one statement for each parameter tuple; asyncpg pipelines them in a single round trip."""
+        await self._conn.executemany(_translate(sql).sql, [tuple(p) for p in seq_of_params])
+
+    def transaction(self):
+        """`async with db.transaction():` — commits on exit, rolls back on error; nests as a savepoint."""
+        return self._conn.transaction()
+
+    @asynccontextmanager
+    async def batch(self):
+        """
+        `async with db.batch() as batch:` queues batch.execute() calls and sends
+        them on exit in one transaction. Consecutive runs of the same statement
+        go through executemany, so a batch costs one round trip per run rather
+        than one per row. Nothing is sent if the block raises.
+        """
+        batch = _Batch()
+        yield batch
+        if not batch:
+            return
+        async with self._conn.transaction():
+            for sql, run in itertools.groupby(batch._items, key=lambda item: item[0]):
+                rows = [params for _, params in run]
+                if len(rows) == 1:
+                    await self.execute(sql, rows[0])
+                else:
+                    await self.executemany(sql, rows)
+
     async def commit(self):
-        pass  # asyncpg auto-commits each statement
+        pass  # asyncpg auto-commits each statement; group writes with transaction() or batch()
 
 
 # ── Pool management ───────────────────────────────────────────────────────────
+#
+# Sizing and recycling come from env (asyncpg's defaults otherwise: 10/10
+# connections, no acquire timeout). Each new connection prepares the hot
+# statements in its init hook; get_db() acquires through _acquire(), which
+# records wait times, in-use connections and timeouts for
+# /api/admin/db/stats and /health/db.
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))  # recycle a connection after this many
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # seconds before an idle connection is closed
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+POOL_STATEMENT_CACHE = int(os.getenv("DB_POOL_STATEMENT_CACHE", "100"))  # asyncpg's own per-connection LRU
+COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "0")) or None
+
+_WAIT_SAMPLES = 1024  # recent acquire waits kept for percentiles
+
+_pool_stats = {"acquired": 0, "timeouts": 0, "in_use": 0, "waiting": 0, "connections_opened": 0}
+_acquire_waits: deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """asyncpg init hook: pin the hot statements on a new connection."""
+    _pool_stats["connections_opened"] += 1
+    cache = _prepared.setdefault(conn, {})
+    for sql in list(_hot):
+        try:
+            cache[sql] = await conn.prepare(sql)
+        except asyncpg.PostgresError as exc:
+            # e.g. the table doesn't exist yet on a fresh database
+            logger.debug("Could not prepare hot statement %r: %s", sql[:60], exc)
+
 
 async def get_pool() -> asyncpg.Pool:
     global _pool
@@ -73,14 +259,95 @@ async def get_pool() -> asyncpg.Pool:
         # Railway sometimes uses the legacy postgres:// scheme
         if url.startswith("postgres://"):
             url = "postgresql://" + url[len("postgres://"):]
-        _pool = await asyncpg.create_pool(url)
+        _pool = await asyncpg.create_pool(
+            url,
+            min_size=min(POOL_MIN_SIZE, POOL_MAX_SIZE),
+            max_size=POOL_MAX_SIZE,
+            max_queries=POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=POOL_MAX_IDLE,
+            statement_cache_size=POOL_STATEMENT_CACHE,
+            command_timeout=COMMAND_TIMEOUT,
+            init=_init_connection,
+        )
     return _pool
 
 
+async def warm_pool() -> float:
+    """Open min_size connections and round-trip each once. Returns seconds taken."""
+    pool = await get_pool()
+    started = time.perf_counter()
+    conns = await asyncio.gather(*(pool.acquire() for _ in range(min(POOL_MIN_SIZE, POOL_MAX_SIZE))))
+    try:
+        await asyncio.gather(*(conn.fetchval("SELECT 1") for conn in conns))
+    finally:
+        for conn in conns:
+            await pool.release(conn)
+    elapsed = time.perf_counter() - started
+    logger.info("Database pool warm: %d connections in %.0f ms", len(conns), elapsed * 1000)
+    return elapsed
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def _acquire(pool: asyncpg.Pool):
+    """pool.acquire() with wait-time, in-use and timeout accounting."""
+    started = time.perf_counter()
+    _pool_stats["waiting"] += 1
+    try:
+        conn = await pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _pool_stats["timeouts"] += 1
+        logger.warning("Timed out after %.1f s waiting for a database connection", POOL_ACQUIRE_TIMEOUT)
+        raise
+    finally:
+        _pool_stats["waiting"] -= 1
+    _acquire_waits.append(time.perf_counter() - started)
+    _pool_stats["acquired"] += 1
+    _pool_stats["in_use"] += 1
+    try:
+        yield conn
+    finally:
+        _pool_stats["in_use"] -= 1
+        await pool.release(conn)
+
+
+def pool_stats() -> dict:
+    """Pool size, in-use/waiting connections, timeouts and recent acquire wait percentiles."""
+    waits = sorted(_acquire_waits)
+
+    def pct(p: float) -> float:
+        return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3) if waits else 0.0
+
+    out = {
+        **_pool_stats,
+        "min_size": POOL_MIN_SIZE,
+        "max_size": POOL_MAX_SIZE,
+        "wait_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": pct(1.0)},
+    }
+    if _pool is not None:
+        out["size"] = _pool.get_size()
+        out["idle"] = _pool.get_idle_size()
+    return out
+
+
 async def get_db() -> AsyncGenerator[_Conn, None]:
     pool = await get_pool()
-    async with pool.acquire() as conn:
-        yield _Conn(conn)
+    acquired = False
+    try:
+        async with _acquire(pool) as conn:
+            acquired = True
+            yield _Conn(conn)
+    except asyncio.TimeoutError:
+        if acquired:
+            raise
+        from fastapi import HTTPException
+        raise HTTPException(status_code=503, detail="Database busy, retry shortly.", headers={"Retry-After": "1"})
 
 
 # ── Schema ────────────────────────────────────────────────────────────────────
@@ -140,23 +407,66 @@ _CREATE_TABLES = [
 ]
 
 
+# Inserts a proposal and bumps its prompt's proposal_count in one statement
+# (the counter columns come from migration 2 in core/migrations.py). Written
+# with $n placeholders so it runs on raw asyncpg connections and through
+# _Conn alike. Args: id, prompt_id, agent_id, emoji_string, rationale, created_at.
+INSERT_PROPOSAL = """
+    WITH ins AS (
+        INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING prompt_id
+    )
+    UPDATE prompts SET proposal_count = proposal_count + 1
+    WHERE id = (SELECT prompt_id FROM ins)
+"""
+
+
 async def init_db():
     pool = await get_pool()
+    await warm_pool()
     async with pool.acquire() as conn:
         for stmt in _CREATE_TABLES:
             await conn.execute(stmt)
-
-    import asyncio
-    from core.search import init_search_tables, sync_search_index
+        from core.migrations import MIGRATE_ON_STARTUP, MigrationLockTimeout, check_current, migrate
+        if MIGRATE_ON_STARTUP:
+            try:
+                await migrate(conn)
+            except MigrationLockTimeout:
+                # Another instance is still migrating: exit so the platform restarts us
+                logger.error("Exiting: schema migrations are held by another instance")
+                raise SystemExit(1)
+        else:
+            await check_current(conn)  # fail fast rather than serve against an old schema
+
+    from core.search import init_search_tables, start_embedding_migration, sync_search_index
+    from core.search_snapshot import apply_delta, claim_snapshots, restore_snapshot, startup_lock
     from core.house_agents import ensure_house_agents
-    init_search_tables()
+    watermark = None
+    async with startup_lock():
+        # One worker per instance restores and catches up the shared local index
+        owner = claim_snapshots()
+        if owner:
+            try:
+                watermark = await restore_snapshot()
+            except Exception:
+                pass  # fall back to a full rebuild
+        init_search_tables()
+    start_embedding_migration()
     await seed_live_battle_example()
     async with pool.acquire() as conn:
         await ensure_house_agents(conn)
+    if not owner:
+        return
     try:
-        await asyncio.to_thread(sync_search_index)
+        if watermark is not None:
+            await apply_delta(watermark)
+        else:
+            # No snapshot: build (or catch up) the local index from Postgres
+            await sync_search_index()
     except Exception:
-        pass  # search index sync is non-critical; rebuilt incrementally via index_one
+        # Non-critical: the outbox keeps indexing new writes from here on
+        logger.exception("Search index sync failed")
 
 
 # ── Seed data ─────────────────────────────────────────────────────────────────
@@ -166,6 +476,7 @@ async def seed_live_battle_example():
     if os.getenv("SKIP_SEED"):
         return
 
+    names = ("EmoticonExample", "EmojiExample")
     pool = await get_pool()
     async with pool.acquire() as conn:
         existing = await conn.fetchrow(
@@ -173,60 +484,55 @@ async def seed_live_battle_example():
         )
         if existing:
             return
+        rows = await conn.fetch("SELECT id, name FROM agents WHERE name = ANY($1::text[])", list(names))
+        agent_ids = {r["name"]: r["id"] for r in rows}
 
         now = datetime.now(timezone.utc).isoformat()
-        agent_ids = {}
-
-        for name in ("EmoticonExample", "EmojiExample"):
-            row = await conn.fetchrow("SELECT id FROM agents WHERE name = $1", name)
-            if row:
-                agent_ids[name] = row["id"]
-            else:
-                aid = str(uuid.uuid4())
-                await conn.execute(
-                    """INSERT INTO agents (id, name, api_key, claim_token, claim_status, created_at)
-                       VALUES ($1, $2, $3, $4, 'claimed', $5)""",
-                    aid, name,
-                    "seed-" + uuid.uuid4().hex,
-                    "seed-claim-" + uuid.uuid4().hex,
-                    now,
-                )
-                agent_ids[name] = aid
-
-        await conn.execute(
-            """INSERT INTO prompts (id, created_by, title, context_text, media_type, media_url, status, created_at)
-               VALUES ($1, $2, $3, $4, 'text', NULL, 'closed', $5)""",
-            "live-battle-example", None,
-            "Live Battle Example",
-            "Emoticon vs Emoji: classic text expressions face off against modern emojis.",
-            now,
-        )
-
         prop1_id = str(uuid.uuid4())
         prop2_id = str(uuid.uuid4())
+        # Counters are written directly: the seed inserts its votes in bulk
+        p1_votes, p2_votes = 5, 7
+
+        db = _Conn(conn)
+        try:
+            async with db.batch() as batch:
+                for name in names:
+                    if name not in agent_ids:
+                        agent_ids[name] = str(uuid.uuid4())
+                        batch.execute(
+                            """INSERT INTO agents (id, name, api_key, claim_token, claim_status, created_at)
+                               VALUES ($1, $2, $3, $4, 'claimed', $5)""",
+                            (agent_ids[name], name, "seed-" + uuid.uuid4().hex, "seed-claim-" + uuid.uuid4().hex, now),
+                        )
+
+                batch.execute(
+                    """INSERT INTO prompts (id, created_by, title, context_text, media_type, media_url, status,
+                                            total_votes, proposal_count, created_at)
+                       VALUES ($1, $2, $3, $4, 'text', NULL, 'closed', $5, 2, $6)""",
+                    (
+                        "live-battle-example", None,
+                        "Live Battle Example",
+                        "Emoticon vs Emoji: classic text expressions face off against modern emojis.",
+                        p1_votes + p2_votes, now,
+                    ),
+                )
 
-        await conn.execute(
-            """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
-               VALUES ($1, $2, $3, $4, $5, $6)""",
-            prop1_id, "live-battle-example", agent_ids["EmoticonExample"],
-            ":'D \\o/ ^_^", "Emoticon response", now,
-        )
-        await conn.execute(
-            """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
-               VALUES ($1, $2, $3, $4, $5, $6)""",
-            prop2_id, "live-battle-example", agent_ids["EmojiExample"],
-            "😂🎉🙌🔥", "Emoji response", now,
-        )
-
-        for i in range(5):
-            await conn.execute(
-                """INSERT INTO votes (id, proposal_id, user_fingerprint, value, created_at)
-                   VALUES ($1, $2, $3, 1, $4)""",
-                str(uuid.uuid4()), prop1_id, f"seed_voter_p1_{i}", now,
-            )
-        for i in range(7):
-            await conn.execute(
-                """INSERT INTO votes (id, proposal_id, user_fingerprint, value, created_at)
-                   VALUES ($1, $2, $3, 1, $4)""",
-                str(uuid.uuid4()), prop2_id, f"seed_voter_p2_{i}", now,
-            )
+                for prop_id, name, emoji_string, rationale, net in (
+                    (prop1_id, "EmoticonExample", ":'D \\o/ ^_^", "Emoticon response", p1_votes),
+                    (prop2_id, "EmojiExample", "😂🎉🙌🔥", "Emoji response", p2_votes),
+                ):
+                    batch.execute(
+                        """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, net_votes, created_at)
+                           VALUES ($1, $2, $3, $4, $5, $6, $7)""",
+                        (prop_id, "live-battle-example", agent_ids[name], emoji_string, rationale, net, now),
+                    )
+
+                for prop_id, count, tag in ((prop1_id, p1_votes, "p1"), (prop2_id, p2_votes, "p2")):
+                    for i in range(count):
+                        batch.execute(
+                            """INSERT INTO votes (id, proposal_id, user_fingerprint, value, created_at)
+                               VALUES ($1, $2, $3, 1, $4)""",
+                            (str(uuid.uuid4()), prop_id, f"seed_voter_{tag}_{i}", now),
+                        )
+        except asyncpg.UniqueViolationError:
+            return  # another instance seeded concurrently; its transaction won
@@ -0,0 +1,193 @@
+"""
+Out-of-process embedding server shared by every uvicorn worker.
+
+Each worker normally loads its own fastembed model (~50 MB plus warm-up).
+With SEARCH_EMBED_SOCKET set, one server process owns the model and workers
+reach it over a Unix domain socket; core/search.py's _embed_batch becomes a
+thin client. The server micro-batches requests arriving from all workers
+into single ONNX calls.
+
+Run:
+  SEARCH_EMBED_SOCKET=/tmp/mojify-embed.sock python -m core.embed_server
+
+Wire format (both directions length-prefixed, big-endian):
+  request  — u32 length + UTF-8 JSON list of texts
+  response — u8 status + u32 length + payload
+             status 0: little-endian float32 matrix, len(texts) rows
+             status 1: UTF-8 error message
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBED_SOCKET = os.getenv("SEARCH_EMBED_SOCKET", "")
+EMBED_TIMEOUT = float(os.getenv("SEARCH_EMBED_TIMEOUT", "10"))
+
+_REQ = struct.Struct(">I")
+_RESP = struct.Struct(">BI")
+_MAX_FRAME = 64 * 1024 * 1024
+
+
+class EmbedServerError(RuntimeError):
+    """The embedding server is unreachable, timed out, or reported an error."""
+
+
+# ---------------------------------------------------------------------------
+# Client — one persistent socket per thread
+# ---------------------------------------------------------------------------
+
+_local = threading.local()
+
+
+def _client_socket(socket_path: str, timeout: float) -> socket.socket:
+    sock = getattr(_local, "sock", None)
+    if sock is None or getattr(_local, "path", None) != socket_path:
+        _drop_socket()  # connected to a different server
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            raise
+        _local.sock, _local.path = sock, socket_path
+    sock.settimeout(timeout)
+    return sock
+
+
+def _drop_socket() -> None:
+    sock = getattr(_local, "sock", None)
+    if sock is not None:
+        sock.close()
+    _local.sock = None
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionResetError("embedding server closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+
+def embed_remote(texts: list[str], socket_path: str = EMBED_SOCKET, timeout: float = EMBED_TIMEOUT) -> list:
+    """Embed texts on the server; returns one float32 vector per text."""
+    body = json.dumps(texts).encode("utf-8")
+    for attempt in (0, 1):
+        try:
+            sock = _client_socket(socket_path, timeout)
+            sock.sendall(_REQ.pack(len(body)) + body)
+            status, length = _RESP.unpack(_recv_exact(sock, _RESP.size))
+            payload = _recv_exact(sock, length)
+            break
+        except socket.timeout as exc:
+            _drop_socket()
+            raise EmbedServerError(f"embedding server timed out after {timeout}s") from exc
+        except OSError as exc:
+            # Stale connection (server restarted) — reconnect once
+            _drop_socket()
+            if attempt:
+                raise EmbedServerError(f"embedding server unavailable: {exc}") from exc
+    if status != 0:
+        raise EmbedServerError(payload.decode("utf-8", "replace"))
+    return list(np.frombuffer(payload, dtype="<f4").reshape(len(texts), -1))
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+async def serve(socket_path: str, max_batch: int = 64, max_wait: float = 0.002) -> None:
+    """Load the encoder once, then answer embed requests on socket_path until cancelled."""
+    from core.search import _get_encoder
+
+    model = _get_encoder()
+    if model is None:
+        raise SystemExit("fastembed is not installed — nothing to serve")
+    list(model.embed(["warm up"]))  # keep first-inference cost off the request path
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def _run(texts: list[str]) -> np.ndarray:
+        return np.stack(list(model.embed(texts, batch_size=len(texts)))).astype("<f4")
+
+    async def batcher() -> None:
+        while True:
+            items = [await queue.get()]
+            total = len(items[0][0])
+            deadline = time.monotonic() + max_wait
+            while total < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                total += len(item[0])
+            flat = [t for texts, _ in items for t in texts]
+            try:
+                vectors = await asyncio.to_thread(_run, flat)
+            except Exception as exc:
+                for _, future in items:
+                    future.set_exception(exc)
+                continue
+            start = 0
+            for texts, future in items:
+                future.set_result(vectors[start:start + len(texts)])
+                start += len(texts)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                (length,) = _REQ.unpack(await reader.readexactly(_REQ.size))
+                if length > _MAX_FRAME:
+                    break
+                texts = json.loads(await reader.readexactly(length))
+                future = loop.create_future()
+                await queue.put((texts, future))
+                try:
+                    status, payload = 0, (await future).tobytes()
+                except Exception as exc:
+                    status, payload = 1, str(exc).encode("utf-8")
+                writer.write(_RESP.pack(status, len(payload)) + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    batch_task = asyncio.create_task(batcher())
+    logger.info("Embedding server listening on %s", socket_path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if not EMBED_SOCKET:
+        raise SystemExit("Set SEARCH_EMBED_SOCKET to the Unix socket path to listen on")
+    asyncio.run(serve(EMBED_SOCKET))
@@ -0,0 +1,138 @@
+"""
+Emoji grapheme and emoticon tokenizer for the search index.
+
+FTS5's unicode61 tokenizer treats emoji as separators, so "🔥" or "\\o/"
+never match anything in search_fts. tokens() splits text into normalised
+emoji grapheme clusters (ZWJ sequences, flags, keycaps, skin tones) and
+classic emoticons, which core/search.py keeps in the search_emoji
+inverted index.
+
+Normalisation:
+  - variation selectors (U+FE0E / U+FE0F) are dropped, so "❤️" == "❤"
+  - a cluster carrying skin-tone modifiers also yields its toneless form,
+    so searching "👍" finds "👍🏽"
+  - emoticon spellings collapse to one canonical token (":-)" -> ":)")
+"""
+from __future__ import annotations
+
+_ZWJ = 0x200D
+_KEYCAP = 0x20E3
+_VARIATION = (0xFE0E, 0xFE0F)
+
+
+def _is_regional(cp: int) -> bool:
+    return 0x1F1E6 <= cp <= 0x1F1FF
+
+
+def _is_skin_tone(cp: int) -> bool:
+    return 0x1F3FB <= cp <= 0x1F3FF
+
+
+def _is_tag(cp: int) -> bool:
+    return 0xE0020 <= cp <= 0xE007F
+
+
+def _is_emoji_base(cp: int) -> bool:
+    return (
+        0x1F000 <= cp <= 0x1FAFF    # emoticons, symbols & pictographs, transport, ...
+        or 0x2600 <= cp <= 0x27BF   # misc symbols & dingbats
+        or 0x2300 <= cp <= 0x23FF   # misc technical (⌚ ⏰ ⏩)
+        or 0x2B00 <= cp <= 0x2BFF   # arrows & shapes (⬆ ⭐ ⭕)
+        or 0x2190 <= cp <= 0x21FF   # arrows
+        or 0x25A0 <= cp <= 0x25FF   # geometric shapes
+        or cp in (0x00A9, 0x00AE, 0x203C, 0x2049, 0x2122, 0x2139, 0x2934, 0x2935,
+                  0x3030, 0x303D, 0x3297, 0x3299)
+    )
+
+
+# Classic emoticons -> canonical token
+_EMOTICONS = {
+    ":)": ":)", ":-)": ":)", "(:": ":)", "=)": ":)",
+    ":(": ":(", ":-(": ":(", "):": ":(", "=(": ":(",
+    ":D": ":D", ":-D": ":D", "=D": ":D",
+    "xD": "XD", "XD": "XD",
+    ";)": ";)", ";-)": ";)",
+    ":P": ":P", ":-P": ":P", ":p": ":P", ":-p": ":P",
+    ":O": ":O", ":-O": ":O", ":o": ":O", ":-o": ":O",
+    ":'(": ":'(", ":,(": ":'(",
+    ":'D": ":'D", ":'-D": ":'D",
+    ":|": ":|", ":-|": ":|",
+    ":/": ":/", ":-/": ":/", ":\\": ":/",
+    ":*": ":*", ":-*": ":*",
+    ":3": ":3",
+    ">:(": ">:(", ">:-(": ">:(",
+    "B)": "B)", "B-)": "B)", "8)": "B)",
+    "<3": "<3", "</3": "</3",
+    "\\o/": "\\o/", "o/": "o/", "\\o": "o/",
+    "^_^": "^_^", "^^": "^_^", "^.^": "^_^",
+    "-_-": "-_-", ">_<": ">_<", "T_T": "T_T", "o_O": "o_O", "O_o": "o_O", "o.O": "o_O",
+    "¯\\_(ツ)_/¯": "¯\\_(ツ)_/¯",
+}
+_EMOTICON_EDGE = "\"'.,!?"
+
+
+def _clusters(text: str) -> list[str]:
+    """Emoji grapheme clusters in text, in order (non-emoji characters skipped)."""
+    out: list[str] = []
+    cps = [ord(c) for c in text]
+    i, n = 0, len(cps)
+    while i < n:
+        cp = cps[i]
+        # Keycap: [0-9#*] FE0F? 20E3
+        if chr(cp) in "0123456789#*":
+            j = i + 1
+            if j < n and cps[j] in _VARIATION:
+                j += 1
+            if j < n and cps[j] == _KEYCAP:
+                out.append("".join(map(chr, cps[i:j + 1])))
+                i = j + 1
+                continue
+            i += 1
+            continue
+        # Flag: a pair of regional indicators
+        if _is_regional(cp):
+            if i + 1 < n and _is_regional(cps[i + 1]):
+                out.append(chr(cp) + chr(cps[i + 1]))
+                i += 2
+            else:
+                i += 1
+            continue
+        if not _is_emoji_base(cp):
+            i += 1
+            continue
+        j = i + 1
+        while j < n:
+            nxt = cps[j]
+            if nxt in _VARIATION or _is_skin_tone(nxt) or _is_tag(nxt) or nxt == _KEYCAP:
+                j += 1
+            elif nxt == _ZWJ and j + 1 < n and _is_emoji_base(cps[j + 1]):
+                j += 2
+            else:
+                break
+        out.append("".join(map(chr, cps[i:j])))
+        i = j
+    return out
+
+
+def _normalise(cluster: str) -> list[str]:
+    """The cluster without variation selectors, plus its toneless form if different."""
+    base = "".join(c for c in cluster if ord(c) not in _VARIATION)
+    forms = [base]
+    toneless = "".join(c for c in base if not _is_skin_tone(ord(c)))
+    if toneless != base and toneless:
+        forms.append(toneless)
+    return forms
+
+
+def tokens(text: str) -> list[str]:
+    """Normalised emoji and emoticon tokens in text, repeats included."""
+    if not text:
+        return []
+    out: list[str] = []
+    for cluster in _clusters(text):
+        out.extend(_normalise(cluster))
+    for word in text.split():
+        canon = _EMOTICONS.get(word) or _EMOTICONS.get(word.strip(_EMOTICON_EDGE))
+        if canon:
+            out.append(canon)
+    return out
@@ -42,17 +42,30 @@ Line 2: A brief rationale (one short phrase, max 8 words)"""
 async def ensure_house_agents(conn) -> None:
     """Upsert house agents. Called from init_db with a raw asyncpg connection."""
     now = datetime.now(timezone.utc).isoformat()
-    for agent in HOUSE_AGENTS:
-        existing = await conn.fetchrow("SELECT id FROM agents WHERE id = $1", agent["id"])
-        if not existing:
-            await conn.execute(
-                """INSERT INTO agents (id, name, api_key, claim_token, claim_status, created_at)
-                   VALUES ($1, $2, $3, NULL, 'claimed', $4)""",
-                agent["id"],
-                agent["name"],
-                "house-" + uuid.uuid4().hex,
-                now,
-            )
+    await conn.executemany(
+        """INSERT INTO agents (id, name, api_key, claim_token, claim_status, created_at)
+           VALUES ($1, $2, $3, NULL, 'claimed', $4)
+           ON CONFLICT (id) DO NOTHING""",
+        [(agent["id"], agent["name"], "house-" + uuid.uuid4().hex, now) for agent in HOUSE_AGENTS],
+    )
+
+
+# A house agent's proposal, inserted only while the round is open and the
+# agent hasn't answered yet, and counted on the prompt — one statement.
+# Returns the round's status and whether the proposal went in.
+_INSERT_HOUSE_PROPOSAL = """
+    WITH ins AS (
+        INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
+        SELECT $1, p.id, $3, $4, $5, $6 FROM prompts p
+        WHERE p.id = $2 AND p.status = 'open'
+          AND NOT EXISTS (SELECT 1 FROM proposals WHERE prompt_id = $2 AND agent_id = $3)
+        RETURNING prompt_id
+    ), counted AS (
+        UPDATE prompts SET proposal_count = proposal_count + 1
+        WHERE id = (SELECT prompt_id FROM ins)
+    )
+    SELECT status, EXISTS (SELECT 1 FROM ins) AS inserted FROM prompts WHERE id = $2
+"""
 
 
 async def _call_llm(context: str, personality: str) -> tuple[str, str]:
@@ -128,6 +141,7 @@ async def submit_house_proposals(prompt_id: str, context_text: str, title: str)
         return
 
     from core.database import get_pool
+    from core.indexer import enqueue
     pool = await get_pool()
 
     for i, agent in enumerate(HOUSE_AGENTS):
@@ -138,23 +152,15 @@ async def submit_house_proposals(prompt_id: str, context_text: str, title: str)
             emoji_string, rationale = await _call_llm(context, personality)
             now = datetime.now(timezone.utc).isoformat()
 
+            proposal_id = str(uuid.uuid4())
             async with pool.acquire() as conn:
                 row = await conn.fetchrow(
-                    "SELECT status FROM prompts WHERE id = $1", prompt_id
-                )
-                if not row or row["status"] != "open":
-                    break
-                already = await conn.fetchrow(
-                    "SELECT id FROM proposals WHERE prompt_id = $1 AND agent_id = $2",
-                    prompt_id, agent["id"],
-                )
-                if already:
-                    continue
-                await conn.execute(
-                    """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
-                       VALUES ($1, $2, $3, $4, $5, $6)""",
-                    str(uuid.uuid4()), prompt_id, agent["id"],
-                    emoji_string, rationale, now,
+                    _INSERT_HOUSE_PROPOSAL,
+                    proposal_id, prompt_id, agent["id"], emoji_string, rationale, now,
                 )
+            if not row or row["status"] != "open":
+                break
+            if row["inserted"]:
+                enqueue("proposal", proposal_id)
         except Exception:
             pass  # never let house agent failure surface to the user
@@ -0,0 +1,134 @@
+"""
+Search indexing outbox.
+
+Write paths call enqueue(entity_type, entity_id) instead of re-running the
+whole-table sync_search_index. A single background task (run_indexer, started
+from the app lifespan) drains the queue: bursts are coalesced so the latest
+op per entity wins, current rows are loaded from Postgres in one query per
+entity type, and the result is applied with index_many / delete_one on a
+worker thread. Write latency no longer depends on corpus size, and only one
+writer ever touches the search DB from request traffic.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+
+from core.database import DB_PATH, get_pool
+from core.search import delete_one, entity_document, index_many
+
+logger = logging.getLogger(__name__)
+
+# How long to wait after the first event before draining, so bursts coalesce
+_COALESCE_DELAY = int(os.getenv("SEARCH_INDEX_COALESCE_MS", "200")) / 1000
+
+# Row loaders — the columns entity_document() expects, for a batch of ids
+_LOAD_SQL = {
+    "prompt": "SELECT id, title, context_text FROM prompts WHERE id = ANY($1::text[])",
+    "agent": "SELECT id, name FROM agents WHERE id = ANY($1::text[])",
+    "proposal": """SELECT pr.id, pr.emoji_string, pr.rationale, p.title AS prompt_title
+                   FROM proposals pr
+                   JOIN prompts p ON p.id = pr.prompt_id
+                   WHERE pr.id = ANY($1::text[])""",
+}
+
+_pending: dict[tuple[str, str], str] = {}  # (entity_type, entity_id) -> "upsert" | "delete"
+_wakeup: asyncio.Event | None = None
+# Entities applied to the live index while a full reindex (core/reindex.py)
+# builds its shadow tables; replayed after the swap so none are lost
+_journal: set[tuple[str, str]] | None = None
+
+
+def enqueue(entity_type: str, entity_id: str, op: str = "upsert") -> None:
+    """Record that an entity changed. Cheap and non-blocking; safe to call from any handler."""
+    if entity_type not in _LOAD_SQL:
+        raise ValueError(f"Unknown entity type: {entity_type}")
+    if op not in ("upsert", "delete"):
+        raise ValueError(f"Unknown index op: {op}")
+    _pending[(entity_type, entity_id)] = op
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def pending_count() -> int:
+    return len(_pending)
+
+
+def start_journal() -> None:
+    global _journal
+    _journal = set()
+
+
+def stop_journal() -> set[tuple[str, str]]:
+    """Stop recording and return every (entity_type, entity_id) applied since start_journal."""
+    global _journal
+    journal, _journal = _journal or set(), None
+    return journal
+
+
+async def drain(db_path: str = DB_PATH) -> int:
+    """Apply every queued event now. Returns how many entities were processed."""
+    if not _pending:
+        return 0
+    batch = dict(_pending)
+    _pending.clear()
+
+    try:
+        upserts: dict[str, list[str]] = {}
+        deletes: list[tuple[str, str]] = []
+        for (etype, eid), op in batch.items():
+            if op == "delete":
+                deletes.append((etype, eid))
+            else:
+                upserts.setdefault(etype, []).append(eid)
+
+        docs: list[tuple[str, str, str, str]] = []
+        if upserts:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                for etype, ids in upserts.items():
+                    found = set()
+                    for row in await conn.fetch(_LOAD_SQL[etype], ids):
+                        docs.append((etype, row["id"], *entity_document(etype, row)))
+                        found.add(row["id"])
+                    # Gone from the source DB by the time we got here — drop it
+                    deletes.extend((etype, eid) for eid in ids if eid not in found)
+
+        await asyncio.to_thread(_apply, docs, deletes, db_path)
+        if _journal is not None:
+            _journal.update(batch)
+    except Exception:
+        # Put back anything not superseded by a newer event, then let the caller log
+        for key, op in batch.items():
+            _pending.setdefault(key, op)
+        raise
+    return len(batch)
+
+
+def _apply(docs: list[tuple[str, str, str, str]], deletes: list[tuple[str, str]], db_path: str) -> None:
+    index_many(docs, db_path)
+    for etype, eid in deletes:
+        delete_one(etype, eid, db_path)
+
+
+async def run_indexer() -> None:
+    """Background loop: wait for events, coalesce briefly, drain. Cancel to stop."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    if _pending:
+        _wakeup.set()
+    try:
+        while True:
+            await _wakeup.wait()
+            await asyncio.sleep(_COALESCE_DELAY)
+            _wakeup.clear()
+            try:
+                count = await drain()
+                logger.debug("search indexer: applied %d events", count)
+            except Exception:
+                logger.exception("search indexer: drain failed — retrying")
+                _wakeup.set()
+                await asyncio.sleep(1)
+    finally:
+        _wakeup = None
@@ -0,0 +1,344 @@
+"""
+Versioned schema migrations for the Postgres database.
+
+init_db() creates the base tables. Everything after that is a numbered
+migration in MIGRATIONS: it is applied once and recorded in
+schema_migrations. Index migrations use CREATE INDEX CONCURRENTLY, so they
+don't block writes on a live database. Those statements cannot run inside a
+transaction, so a migration containing one runs statement by statement
+(each must be idempotent) and is recorded at the end. A step may also be an
+async callable taking the connection, for data backfills that commit in
+batches; plain statements around it run in their own short transactions.
+Other migrations run in a single transaction.
+
+  python -m core.migrations            # apply pending migrations
+  python -m core.migrations --status   # list applied and pending versions
+
+init_db() also applies pending migrations unless DB_MIGRATE_ON_STARTUP=0;
+in that case, run the command above as a release step — init_db() refuses
+to start against a schema with pending migrations.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "1").strip().lower() in ("1", "true", "yes")
+LOCK_TIMEOUT = float(os.getenv("DB_MIGRATE_LOCK_TIMEOUT", "300"))  # seconds to wait for another runner
+
+BACKFILL_BATCH = int(os.getenv("DB_MIGRATE_BATCH", "5000"))  # rows per backfill transaction
+
+_LOCK_KEY = 0x6D6F6A69  # pg advisory lock held while migrating ("moji")
+_RETRIES = 3
+
+Step = Callable[[asyncpg.Connection], Awaitable[None]]
+
+
+class MigrationsPending(RuntimeError):
+    """The schema is behind the code and migrations are not applied on startup."""
+
+
+class MigrationLockTimeout(RuntimeError):
+    """Another runner held the migration lock for longer than DB_MIGRATE_LOCK_TIMEOUT."""
+
+
+# One keyset batch of migration 2's counter backfill: recount the next
+# $2 rows after id $1 and return the last id seen (NULL when done)
+_BACKFILL_PROPOSALS = """
+    WITH batch AS (SELECT id FROM proposals WHERE id > $1 ORDER BY id LIMIT $2),
+    fixed AS (
+        UPDATE proposals pr SET net_votes = s.net
+        FROM (SELECT b.id, COALESCE(SUM(v.value), 0) AS net
+              FROM batch b LEFT JOIN votes v ON v.proposal_id = b.id GROUP BY b.id) s
+        WHERE s.id = pr.id AND pr.net_votes <> s.net
+    )
+    SELECT MAX(id) FROM batch
+"""
+_BACKFILL_PROMPTS = """
+    WITH batch AS (SELECT id FROM prompts WHERE id > $1 ORDER BY id LIMIT $2),
+    fixed AS (
+        UPDATE prompts p SET total_votes = s.total, proposal_count = s.n
+        FROM (SELECT b.id, COALESCE(SUM(pr.net_votes), 0) AS total, COUNT(pr.id) AS n
+              FROM batch b LEFT JOIN proposals pr ON pr.prompt_id = b.id GROUP BY b.id) s
+        WHERE s.id = p.id AND (p.total_votes <> s.total OR p.proposal_count <> s.n)
+    )
+    SELECT MAX(id) FROM batch
+"""
+
+
+async def _backfill_batches(conn, sql: str, batch_size: int) -> None:
+    """Run sql over the whole table a keyset batch per transaction."""
+    after = ""
+    while after is not None:
+        # Repeatable read, as in core/counters.py: a vote landing mid-batch
+        # fails the batch (retried) instead of being overwritten
+        for attempt in range(_RETRIES):
+            try:
+                async with conn.transaction(isolation="repeatable_read"):
+                    last = await conn.fetchval(sql, after, batch_size)
+                break
+            except asyncpg.SerializationError:
+                if attempt == _RETRIES - 1:
+                    raise
+                await asyncio.sleep(0.1 * (attempt + 1))
+        after = last
+
+
+async def _backfill_vote_counters(conn) -> None:
+    # proposals first: prompt totals are sums of net_votes
+    await _backfill_batches(conn, _BACKFILL_PROPOSALS, BACKFILL_BATCH)
+    await _backfill_batches(conn, _BACKFILL_PROMPTS, BACKFILL_BATCH)
+
+
+# (version, name, steps) — append only; never edit an applied migration
+MIGRATIONS: list[tuple[int, str, list[str | Step]]] = [
+    (1, "hot path indexes", [
+        # votes(proposal_id) is already covered by UNIQUE(proposal_id, user_fingerprint)
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proposals_prompt_id ON proposals (prompt_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proposals_agent_id ON proposals (agent_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_emoji_chat_room_created ON emoji_chat_messages (room, created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_agents_api_key ON agents (api_key)",
+    ]),
+    (2, "denormalized vote counters", [
+        # Maintained on write by the vote upsert and INSERT_PROPOSAL; core/counters.py repairs drift
+        "ALTER TABLE proposals ADD COLUMN IF NOT EXISTS net_votes INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE prompts ADD COLUMN IF NOT EXISTS total_votes INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE prompts ADD COLUMN IF NOT EXISTS proposal_count INTEGER NOT NULL DEFAULT 0",
+        # Committed in batches so the backfill never holds table-wide row locks
+        _backfill_vote_counters,
+    ]),
+    (3, "prompt list sort indexes", [
+        # new / trending / hot orderings in list_prompts and search intents (scanned backwards)
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prompts_created ON prompts (created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prompts_trending ON prompts (total_votes, created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prompts_hot ON prompts (total_votes, proposal_count, created_at)",
+    ]),
+    (4, "search change log", [
+        # Updates and deletes for sync_search_index (core/search.py), which
+        # reads them in (txid, seq) order below the oldest running transaction
+        """CREATE TABLE IF NOT EXISTS search_changes (
+               seq         BIGSERIAL PRIMARY KEY,
+               txid        BIGINT NOT NULL DEFAULT txid_current(),
+               entity_type TEXT NOT NULL,
+               entity_id   TEXT NOT NULL,
+               op          TEXT NOT NULL,
+               changed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_search_changes_txid ON search_changes (txid, seq)",
+        "CREATE INDEX IF NOT EXISTS idx_search_changes_changed ON search_changes (changed_at)",
+        # TG_ARGV[0] is the entity type; a retitled prompt re-indexes its proposals
+        """CREATE OR REPLACE FUNCTION search_log_change() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               IF TG_OP = 'DELETE' THEN
+                   INSERT INTO search_changes (entity_type, entity_id, op) VALUES (TG_ARGV[0], OLD.id, 'delete');
+                   RETURN OLD;
+               END IF;
+               INSERT INTO search_changes (entity_type, entity_id, op) VALUES (TG_ARGV[0], NEW.id, 'upsert');
+               IF TG_ARGV[0] = 'prompt' THEN
+                   INSERT INTO search_changes (entity_type, entity_id, op)
+                   SELECT 'proposal', id, 'upsert' FROM proposals WHERE prompt_id = NEW.id;
+               END IF;
+               RETURN NEW;
+           END $$""",
+        """CREATE TRIGGER search_log_prompt_update AFTER UPDATE OF title, context_text ON prompts
+           FOR EACH ROW WHEN (OLD.title IS DISTINCT FROM NEW.title OR OLD.context_text IS DISTINCT FROM NEW.context_text)
+           EXECUTE FUNCTION search_log_change('prompt')""",
+        """CREATE TRIGGER search_log_prompt_delete AFTER DELETE ON prompts
+           FOR EACH ROW EXECUTE FUNCTION search_log_change('prompt')""",
+        """CREATE TRIGGER search_log_agent_update AFTER UPDATE OF name ON agents
+           FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+           EXECUTE FUNCTION search_log_change('agent')""",
+        """CREATE TRIGGER search_log_agent_delete AFTER DELETE ON agents
+           FOR EACH ROW EXECUTE FUNCTION search_log_change('agent')""",
+        """CREATE TRIGGER search_log_proposal_update
+           AFTER UPDATE OF emoji_string, rationale, prompt_id ON proposals
+           FOR EACH ROW WHEN (OLD.emoji_string IS DISTINCT FROM NEW.emoji_string
+                              OR OLD.rationale IS DISTINCT FROM NEW.rationale
+                              OR OLD.prompt_id IS DISTINCT FROM NEW.prompt_id)
+           EXECUTE FUNCTION search_log_change('proposal')""",
+        """CREATE TRIGGER search_log_proposal_delete AFTER DELETE ON proposals
+           FOR EACH ROW EXECUTE FUNCTION search_log_change('proposal')""",
+    ]),
+    (5, "search sync high-water mark indexes", [
+        # (created_at, id) keyset pages in sync_search_index
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prompts_search_mark ON prompts (created_at, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_agents_search_mark ON agents (created_at, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proposals_search_mark ON proposals (created_at, id)",
+    ]),
+    (6, "search change log inserts", [
+        # New rows too: created_at is stamped by the app before commit, so a
+        # (created_at, id) mark can pass a row that commits late or comes
+        # from a skewed clock. Only a retitled prompt fans out to its proposals.
+        """CREATE OR REPLACE FUNCTION search_log_change() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               IF TG_OP = 'DELETE' THEN
+                   INSERT INTO search_changes (entity_type, entity_id, op) VALUES (TG_ARGV[0], OLD.id, 'delete');
+                   RETURN OLD;
+               END IF;
+               INSERT INTO search_changes (entity_type, entity_id, op) VALUES (TG_ARGV[0], NEW.id, 'upsert');
+               IF TG_ARGV[0] = 'prompt' AND TG_OP = 'UPDATE' THEN
+                   INSERT INTO search_changes (entity_type, entity_id, op)
+                   SELECT 'proposal', id, 'upsert' FROM proposals WHERE prompt_id = NEW.id;
+               END IF;
+               RETURN NEW;
+           END $$""",
+        """CREATE TRIGGER search_log_prompt_insert AFTER INSERT ON prompts
+           FOR EACH ROW EXECUTE FUNCTION search_log_change('prompt')""",
+        """CREATE TRIGGER search_log_agent_insert AFTER INSERT ON agents
+           FOR EACH ROW EXECUTE FUNCTION search_log_change('agent')""",
+        """CREATE TRIGGER search_log_proposal_insert AFTER INSERT ON proposals
+           FOR EACH ROW EXECUTE FUNCTION search_log_change('proposal')""",
+    ]),
+]
+
+_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version    INTEGER PRIMARY KEY,
+        name       TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+"""
+
+_CONCURRENT_INDEX = re.compile(r"INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+
+async def applied_versions(conn) -> set[int]:
+    await conn.execute(_CREATE_VERSION_TABLE)
+    return {r["version"] for r in await conn.fetch("SELECT version FROM schema_migrations")}
+
+
+async def pending(conn) -> list[tuple[int, str, list[str | Step]]]:
+    done = await applied_versions(conn)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m[0]) if m[0] not in done]
+
+
+async def check_current(conn) -> None:
+    """Raise MigrationsPending if any migration has not been applied."""
+    versions = [version for version, _, _ in await pending(conn)]
+    if versions:
+        raise MigrationsPending(
+            f"Database schema is behind: migration(s) {versions} pending and "
+            "DB_MIGRATE_ON_STARTUP=0 — run `python -m core.migrations` first"
+        )
+
+
+async def _lock(conn) -> None:
+    # Polls instead of blocking in pg_advisory_lock: a session waiting inside
+    # that call holds a snapshot, which CREATE INDEX CONCURRENTLY in the
+    # session holding the lock would wait on — a deadlock.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LOCK_TIMEOUT
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", _LOCK_KEY):
+        if loop.time() > deadline:
+            # A bigint advisory key shows up split into classid / objid
+            holder = await conn.fetchval(
+                """SELECT pid FROM pg_locks WHERE locktype = 'advisory' AND granted
+                   AND classid = $1 AND objid = $2 AND objsubid = 1""",
+                _LOCK_KEY >> 32, _LOCK_KEY & 0xFFFFFFFF,
+            )
+            logger.error(
+                "Migration lock still held by backend pid %s after %.0fs; giving up", holder, LOCK_TIMEOUT
+            )
+            raise MigrationLockTimeout(
+                f"Timed out after {LOCK_TIMEOUT:.0f}s waiting for the migration lock (held by pid {holder})"
+            )
+        await asyncio.sleep(1)
+
+
+async def _drop_invalid_index(conn, stmt: str) -> None:
+    """A failed CREATE INDEX CONCURRENTLY leaves an INVALID index that IF NOT EXISTS would keep."""
+    match = _CONCURRENT_INDEX.search(stmt)
+    if not match:
+        return
+    invalid = await conn.fetchval(
+        """SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+           WHERE c.relname = $1 AND NOT i.indisvalid""",
+        match.group(1),
+    )
+    if invalid:
+        logger.warning("Rebuilding invalid index %s", match.group(1))
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def _transactional(step: str | Step) -> bool:
+    return isinstance(step, str) and not _CONCURRENT_INDEX.search(step)
+
+
+async def _apply(conn, version: int, name: str, steps: list[str | Step]) -> None:
+    record = (
+        "INSERT INTO schema_migrations (version, name, applied_at) VALUES ($1, $2, $3)",
+        version, name, datetime.now(timezone.utc).isoformat(),
+    )
+    if all(_transactional(step) for step in steps):
+        async with conn.transaction():
+            for stmt in steps:
+                await conn.execute(stmt)
+            await conn.execute(*record)
+        return
+    batch: list[str] = []
+    for step in [*steps, None]:
+        if step is not None and _transactional(step):
+            batch.append(step)
+            continue
+        if batch:
+            async with conn.transaction():
+                for stmt in batch:
+                    await conn.execute(stmt)
+            batch = []
+        if step is None:
+            break
+        if callable(step):
+            await step(conn)
+        else:
+            await _drop_invalid_index(conn, step)
+            await conn.execute(step)
+    await conn.execute(*record)
+
+
+async def migrate(conn) -> list[int]:
+    """Apply pending migrations in version order on an asyncpg connection. Returns the versions applied."""
+    await _lock(conn)
+    try:
+        done = []
+        for version, name, steps in await pending(conn):
+            logger.info("Applying migration %d: %s", version, name)
+            await _apply(conn, version, name, steps)
+            done.append(version)
+        return done
+    finally:
+        await conn.fetchval("SELECT pg_advisory_unlock($1)", _LOCK_KEY)
+
+
+async def _main(status: bool) -> None:
+    from core.database import close_pool, get_pool
+
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            if status:
+                done = await applied_versions(conn)
+                for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+                    print(f"{version:4d}  {'applied' if version in done else 'pending'}  {name}")
+            else:
+                applied = await migrate(conn)
+                print(f"Applied {len(applied)} migration(s)" + (f": {applied}" if applied else ""))
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Apply pending database migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying any")
+    try:
+        asyncio.run(_main(parser.parse_args().status))
+    except MigrationLockTimeout:
+        sys.exit(1)  # already logged with the holder's pid
@@ -61,6 +61,10 @@ class PromptDetailResponse(PromptResponse):
     proposals: list[ProposalInPrompt]
 
 
+class RelatedPromptResponse(PromptResponse):
+    similarity: float
+
+
 # ── Proposals ─────────────────────────────────────────────────────────────────
 
 class ProposalCreateRequest(BaseModel):
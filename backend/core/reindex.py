@@ -0,0 +1,316 @@
+"""
+Resumable, parallel full rebuild of the search index.
+
+sync_search_index(incremental=False) wipes the live tables and re-embeds the
+corpus on one core — searches see a half-empty index until it finishes.
+This job instead:
+
+  1. builds into shadow tables (search_fts_rebuild, search_embeddings_rebuild,
+     search_emoji_rebuild) in the same file — in each shard's file with
+     SEARCH_SHARDED — so searches keep hitting the old index meanwhile;
+  2. pages source rows out of Postgres in id order and fans each page's
+     embedding work out to a process pool (SEARCH_REINDEX_WORKERS processes,
+     each with its own encoder; 0 = embed on a thread, e.g. with a shared
+     embedding server);
+  3. commits every page together with its entity type's checkpoint (last
+     id), so a restarted job resumes where the previous one stopped;
+  4. swaps the shadow tables in with one short transaction per file, then replays
+     entities the outbox indexed into the old tables while the job ran.
+
+Started and monitored through POST/GET /api/admin/search/reindex.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from core import indexer
+from core.database import DB_PATH, get_pool
+from core.search import (
+    _connect,
+    _create_index_tables,
+    _embed_batch,
+    _emoji_postings,
+    _bump_shared,
+    _index_replaced,
+    _pack_embedding,
+    _wrote_shared,
+    entity_document,
+    init_search_tables,
+    shard_path,
+)
+
+logger = logging.getLogger(__name__)
+
+REINDEX_WORKERS = int(os.getenv("SEARCH_REINDEX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+REINDEX_PAGE = int(os.getenv("SEARCH_REINDEX_PAGE", "512"))
+
+_FTS_SHADOW = "search_fts_rebuild"
+_EMB_SHADOW = "search_embeddings_rebuild"
+_EMOJI_SHADOW = "search_emoji_rebuild"
+_CHECKPOINT_KEY = "rebuild:checkpoint:"  # + entity type
+
+_ENTITY_ORDER = ("prompt", "agent", "proposal")
+
+# Keyset pages — the columns entity_document() expects, after a given id
+_PAGE_SQL = {
+    "prompt": "SELECT id, title, context_text FROM prompts WHERE id > $1 ORDER BY id LIMIT $2",
+    "agent": "SELECT id, name FROM agents WHERE id > $1 ORDER BY id LIMIT $2",
+    "proposal": """SELECT pr.id, pr.emoji_string, pr.rationale, p.title AS prompt_title
+                   FROM proposals pr
+                   JOIN prompts p ON p.id = pr.prompt_id
+                   WHERE pr.id > $1 ORDER BY pr.id LIMIT $2""",
+}
+_COUNT_SQL = {
+    "prompt": "SELECT COUNT(*) FROM prompts",
+    "agent": "SELECT COUNT(*) FROM agents",
+    "proposal": "SELECT COUNT(*) FROM proposals pr JOIN prompts p ON p.id = pr.prompt_id",
+}
+
+_task: asyncio.Task | None = None
+_progress: dict = {"status": "idle"}
+
+
+# ---------------------------------------------------------------------------
+# Worker side — runs in pool processes (or a thread when workers == 0)
+# ---------------------------------------------------------------------------
+
+def _embed_chunk(texts: list[str]) -> list[bytes] | None:
+    """Packed embeddings for texts, or None without an encoder."""
+    embs = _embed_batch(texts)
+    if embs is None:
+        return None
+    return [_pack_embedding(emb) for emb in embs]
+
+
+# ---------------------------------------------------------------------------
+# Shadow tables (blocking — run in a thread)
+# ---------------------------------------------------------------------------
+
+def _index_files(db_path: str) -> dict[str, list[str]]:
+    """Index file -> entity types it holds (one file, or one per shard)."""
+    files: dict[str, list[str]] = {}
+    for etype in _ENTITY_ORDER:
+        files.setdefault(shard_path(db_path, etype), []).append(etype)
+    return files
+
+
+def _prepare_shadow(db_path: str, resume: bool) -> dict[str, dict]:
+    """
+    Return each entity type's checkpoint to continue from, creating fresh
+    shadow tables in any index file that has nothing to resume.
+    """
+    init_search_tables(db_path)
+    checkpoints: dict[str, dict] = {}
+    for path, types in _index_files(db_path).items():
+        with _connect(path) as conn:
+            saved = {}
+            for etype in types:
+                row = conn.execute(
+                    "SELECT value FROM search_meta WHERE key = ?", (_CHECKPOINT_KEY + etype,)
+                ).fetchone()
+                if row is not None:
+                    saved[etype] = json.loads(row["value"])
+            shadow = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (_FTS_SHADOW,)
+            ).fetchone()
+            if resume and shadow is not None and len(saved) == len(types):
+                checkpoints.update(saved)
+                continue
+            conn.execute(f"DROP TABLE IF EXISTS {_FTS_SHADOW}")
+            conn.execute(f"DROP TABLE IF EXISTS {_EMB_SHADOW}")
+            conn.execute(f"DROP TABLE IF EXISTS {_EMOJI_SHADOW}")
+            _create_index_tables(conn, _FTS_SHADOW, _EMB_SHADOW, _EMOJI_SHADOW)
+            for etype in types:
+                checkpoints[etype] = {
+                    "last_id": "",
+                    "rows_done": 0,
+                    "started_at": datetime.now(timezone.utc).isoformat(),
+                }
+                _save_checkpoint(conn, etype, checkpoints[etype])
+    return checkpoints
+
+
+def _save_checkpoint(conn, entity_type: str, checkpoint: dict) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO search_meta (key, value) VALUES (?, ?)",
+        (_CHECKPOINT_KEY + entity_type, json.dumps(checkpoint)),
+    )
+
+
+def _write_page(
+    path: str,
+    docs: list[tuple[str, str, str, str]],
+    blobs: list[bytes | None],
+    checkpoint: dict,
+) -> None:
+    """Insert one page into path's shadow tables and advance the checkpoint atomically."""
+    with _connect(path) as conn:
+        conn.executemany(
+            f"INSERT INTO {_FTS_SHADOW} (entity_type, entity_id, title, content) VALUES (?, ?, ?, ?)",
+            docs,
+        )
+        conn.executemany(
+            f"""INSERT OR REPLACE INTO {_EMB_SHADOW}
+                (entity_type, entity_id, content, embedding) VALUES (?, ?, ?, ?)""",
+            [(etype, eid, content, blob) for (etype, eid, _, content), blob in zip(docs, blobs) if blob],
+        )
+        conn.executemany(
+            f"""INSERT OR REPLACE INTO {_EMOJI_SHADOW}
+                (token, entity_type, entity_id, title, hits) VALUES (?, ?, ?, ?, ?)""",
+            _emoji_postings(docs),
+        )
+        _save_checkpoint(conn, docs[0][0], checkpoint)
+
+
+def _swap(path: str) -> None:
+    """Replace path's live tables with its shadow tables in one transaction."""
+    with _connect(path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DROP TABLE search_fts")
+        conn.execute(f"ALTER TABLE {_FTS_SHADOW} RENAME TO search_fts")
+        conn.execute("DROP TABLE search_embeddings")
+        conn.execute(f"ALTER TABLE {_EMB_SHADOW} RENAME TO search_embeddings")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_type ON search_embeddings(entity_type)")
+        conn.execute("DROP TABLE search_emoji")
+        conn.execute(f"ALTER TABLE {_EMOJI_SHADOW} RENAME TO search_emoji")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_emoji_entity ON search_emoji(entity_type, entity_id)")
+        conn.execute("DELETE FROM search_meta WHERE key LIKE ?", (_CHECKPOINT_KEY + "%",))
+        generation = _bump_shared(conn, None, [])  # other workers reload on their next read
+    _wrote_shared(path, generation)
+    _index_replaced(path)
+
+
+# ---------------------------------------------------------------------------
+# Job
+# ---------------------------------------------------------------------------
+
+async def _embed_page(docs: list[tuple[str, str, str, str]], executor, workers: int) -> list[bytes | None]:
+    """One packed embedding per doc, the page split evenly across pool workers."""
+    texts = [content for _, _, _, content in docs]
+    if executor is None:
+        chunks = [texts]
+        results = [await asyncio.to_thread(_embed_chunk, texts)]
+    else:
+        size = -(-len(texts) // workers)
+        chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(loop.run_in_executor(executor, _embed_chunk, c) for c in chunks))
+    blobs: list[bytes | None] = []
+    for chunk, packed in zip(chunks, results):
+        blobs.extend(packed if packed is not None else [None] * len(chunk))
+    return blobs
+
+
+async def run_reindex(db_path: str = DB_PATH, resume: bool = True, workers: int = REINDEX_WORKERS) -> int:
+    """Rebuild the index into shadow tables and swap it in. Returns rows indexed."""
+    checkpoints = await asyncio.to_thread(_prepare_shadow, db_path, resume)
+    rows_done = sum(cp["rows_done"] for cp in checkpoints.values())
+    started_at = min(cp["started_at"] for cp in checkpoints.values())
+    resumed = rows_done > 0
+    indexer.start_journal()
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        total = sum([await conn.fetchval(sql) for sql in _COUNT_SQL.values()])
+    _progress.update(
+        status="running", rows_total=total, rows_done=rows_done, resumed=resumed,
+        workers=workers, started_at=started_at, finished_at=None, error=None,
+        entity_type=_ENTITY_ORDER[0], _t0=time.monotonic(), _done0=rows_done,
+    )
+
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for etype in _ENTITY_ORDER:
+            checkpoint = checkpoints[etype]
+            path = shard_path(db_path, etype)
+            _progress["entity_type"] = etype
+            while True:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(_PAGE_SQL[etype], checkpoint["last_id"], REINDEX_PAGE)
+                if not rows:
+                    break
+                docs = [(etype, r["id"], *entity_document(etype, r)) for r in rows]
+                blobs = await _embed_page(docs, executor, workers)
+                checkpoint.update(last_id=rows[-1]["id"], rows_done=checkpoint["rows_done"] + len(docs))
+                await asyncio.to_thread(_write_page, path, docs, blobs, dict(checkpoint))
+                rows_done += len(docs)
+                _progress["rows_done"] = rows_done
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    _progress["status"] = "swapping"
+    for path in _index_files(db_path):
+        await asyncio.to_thread(_swap, path)
+
+    # Entities the outbox wrote to the old tables while we were building
+    for etype, eid in indexer.stop_journal():
+        indexer.enqueue(etype, eid)
+    if resumed:
+        # The journal only covers this process; pick up rows created before a restart
+        from core.search_snapshot import apply_delta
+        since = datetime.fromisoformat(started_at) - timedelta(minutes=5)
+        await apply_delta(since.isoformat(), db_path)
+    else:
+        await indexer.drain(db_path)
+
+    _progress.update(status="done", finished_at=datetime.now(timezone.utc).isoformat(), _t1=time.monotonic())
+    logger.info("Search reindex finished: %d rows", rows_done)
+    return rows_done
+
+
+async def _run_logged(db_path: str, resume: bool, workers: int) -> None:
+    try:
+        await run_reindex(db_path, resume, workers)
+    except asyncio.CancelledError:
+        _progress.update(status="interrupted")
+        indexer.stop_journal()
+        raise
+    except Exception as exc:
+        logger.exception("Search reindex failed")
+        _progress.update(status="failed", error=str(exc))
+        indexer.stop_journal()
+
+
+def start_reindex(db_path: str = DB_PATH, resume: bool = True, workers: int = REINDEX_WORKERS) -> bool:
+    """Start the job in the background. False if one is already running."""
+    global _task
+    if _task is not None and not _task.done():
+        return False
+    _progress.clear()
+    _progress["status"] = "starting"
+    _task = asyncio.create_task(_run_logged(db_path, resume, workers))
+    return True
+
+
+async def stop_reindex() -> None:
+    """Cancel a running job and wait for it to wind down (app shutdown)."""
+    task = _task
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def reindex_progress() -> dict:
+    """Rows done, throughput and ETA of the current (or last) job."""
+    out = {k: v for k, v in _progress.items() if not k.startswith("_")}
+    if "_t0" in _progress:
+        elapsed = max(_progress.get("_t1", time.monotonic()) - _progress["_t0"], 1e-9)
+        rate = (_progress["rows_done"] - _progress["_done0"]) / elapsed
+        remaining = max(0, _progress["rows_total"] - _progress["rows_done"])
+        out["rows_per_sec"] = round(rate, 1)
+        out["eta_seconds"] = round(remaining / rate, 1) if rate > 0 else None
+    return out
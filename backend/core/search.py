@@ -5,16 +5,35 @@ async-safe embedding, numpy-free cosine fallback, and robust error handling.
 """
 from __future__ import annotations
 
+import asyncio
+import heapq
 import json
+import queue
 import logging
 import math
 import re
 import sqlite3
+import struct
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 from contextlib import contextmanager
-from threading import Lock
+from datetime import datetime, timedelta, timezone
+import threading
+from threading import Lock, Thread
 from typing import Optional
 
-from core.database import DB_PATH
+from core import emoji_tokens
+from core.database import DB_PATH, get_pool
+
+try:
+    import numpy as np
+    from core import ann
+except ImportError:  # numpy is optional — pure-Python cosine is used instead
+    np = None
+    ann = None
 
 logger = logging.getLogger(__name__)
 
@@ -66,68 +85,420 @@ def _get_encoder():
 
 
 # ---------------------------------------------------------------------------
-# Connection helper — use WAL mode for better read/write concurrency
+# Connection helper — one persistent connection per (thread, db_path)
+#
+# Opening a connection, setting pragmas and parsing the schema is a visible
+# share of a short BM25 query, so connections are cached thread-locally and
+# configured once. WAL mode gives concurrent readers alongside one writer.
+# A connection is reopened if the file at db_path was replaced.
 # ---------------------------------------------------------------------------
 
-@contextmanager
-def _connect(db_path: str = DB_PATH):
+_MMAP_SIZE = int(os.environ.get("SEARCH_MMAP_SIZE", str(256 * 1024 * 1024)))
+_CACHE_SIZE_KB = int(os.environ.get("SEARCH_CACHE_SIZE_KB", "65536"))
+
+_local = threading.local()
+_conn_stats = {"opened": 0, "reused": 0, "reopened": 0}
+_conn_stats_lock = Lock()
+# Thread -> that thread's cache. Keyed on the Thread object, not its ident:
+# idents are reused, which would hide a dead thread's connections
+_conns_by_thread: "weakref.WeakKeyDictionary[threading.Thread, dict[str, list]]" = weakref.WeakKeyDictionary()
+
+
+def _count(key: str) -> None:
+    with _conn_stats_lock:
+        _conn_stats[key] += 1
+
+
+def _open(db_path: str) -> sqlite3.Connection:
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _file_id(db_path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def _thread_conn(db_path: str) -> list:
+    """[conn, file_id, depth] for this thread, opening or reopening as needed."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+        thread = threading.current_thread()
+        with _conn_stats_lock:
+            _prune_dead_threads()
+            _conns_by_thread[thread] = conns
+        # Closes them if the Thread object is collected before a prune sees it dead
+        weakref.finalize(thread, _close_conns, conns)
+    entry = conns.get(db_path)
+    if entry is not None:
+        if entry[2] > 0 or entry[1] == _file_id(db_path):
+            _count("reused")
+            return entry
+        entry[0].close()
+        _count("reopened")
+        _index_replaced(db_path)  # in-memory state belongs to the replaced file
+    else:
+        _count("opened")
+    conn = _open(db_path)
+    entry = conns[db_path] = [conn, _file_id(db_path), 0]
+    return entry
+
+
+def _close_conns(conns: dict[str, list]) -> None:
+    for conn, _, _ in conns.values():
+        conn.close()
+    conns.clear()
+
+
+def _prune_dead_threads() -> None:
+    """Close connections left behind by finished threads (caller holds _conn_stats_lock)."""
+    for thread in [t for t in list(_conns_by_thread) if not t.is_alive()]:
+        _close_conns(_conns_by_thread.pop(thread))
+
+
+@contextmanager
+def _connect(db_path: str = DB_PATH):
+    """
+    Yield this thread's connection for db_path. The outermost block commits
+    on success and rolls back on error; nested blocks share its transaction.
+    """
+    entry = _thread_conn(db_path)
+    conn = entry[0]
+    entry[2] += 1
     try:
         yield conn
-        conn.commit()
+        if entry[2] == 1:
+            conn.commit()
     except Exception:
-        conn.rollback()
+        if entry[2] == 1:
+            conn.rollback()
         raise
     finally:
-        conn.close()
+        entry[2] -= 1
+
+
+def close_search_connections() -> None:
+    """Close the calling thread's cached connections (e.g. before deleting a DB file)."""
+    _close_conns(getattr(_local, "conns", None) or {})
+
+
+def search_pool_stats() -> dict:
+    """Connection cache counters: opened, reused, reopened (file replaced) and currently open."""
+    with _conn_stats_lock:
+        _prune_dead_threads()
+        stats = dict(_conn_stats)
+        stats["open"] = sum(len(c) for c in _conns_by_thread.values())
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Sharded layout — one SQLite file per entity type (SEARCH_SHARDED=1)
+#
+# SQLite has one writer per file, so a burst of proposal indexing used to
+# hold the lock that prompt and agent writes queue behind. Sharded, each
+# type's search_fts / search_embeddings / search_emoji live in
+# "<db>.<type>.db" beside db_path, which keeps only the sync bookkeeping
+# (search_meta). Searches query the shards for the
+# requested types in parallel and fuse them with RRF. Turning this on for
+# an existing deployment starts from empty shards — run a reindex.
+# ---------------------------------------------------------------------------
+
+_SHARDED = os.environ.get("SEARCH_SHARDED", "").lower() in ("1", "true", "yes")
+ENTITY_TYPES = ("prompt", "agent", "proposal")
+
+_shard_owner: dict[str, str] = {}  # shard file -> the db_path it belongs to
+
+
+def shard_file(base: str, entity_type: str) -> str:
+    """Name of entity_type's shard of base: /tmp/search.db -> /tmp/search.<entity_type>.db."""
+    root, ext = os.path.splitext(base)
+    return f"{root}.{entity_type}{ext or '.db'}"
+
+
+def shard_path(db_path: str, entity_type: str) -> str:
+    """The file holding entity_type's index: its shard, or db_path when unsharded."""
+    if not _SHARDED:
+        return db_path
+    path = shard_file(db_path, entity_type)
+    _shard_owner[path] = db_path
+    return path
+
+
+def shard_paths(db_path: str, entity_types: Optional[list[str]] = None) -> dict[str, Optional[list[str]]]:
+    """
+    Files to search for entity_types (None = all), each mapped to the type
+    filter to apply inside it — None where the file holds nothing else.
+    """
+    if not _SHARDED:
+        return {db_path: list(entity_types) if entity_types else None}
+    return {shard_path(db_path, t): None for t in ENTITY_TYPES if not entity_types or t in entity_types}
+
+
+def index_files(db_path: str) -> list[str]:
+    """Every file holding index tables for db_path."""
+    return list(dict.fromkeys(shard_path(db_path, t) for t in ENTITY_TYPES))
+
+
+def _by_shard(db_path: str, items) -> dict[str, list]:
+    """Group (entity_type, ...) tuples by the file that indexes them."""
+    groups: dict[str, list] = {}
+    for item in items:
+        groups.setdefault(shard_path(db_path, item[0]), []).append(item)
+    return groups
 
 
 # ---------------------------------------------------------------------------
 # Schema
 # ---------------------------------------------------------------------------
 
+def _create_index_tables(
+    conn: sqlite3.Connection,
+    fts: str = "search_fts",
+    embeddings: str = "search_embeddings",
+    emoji: str = "search_emoji",
+) -> None:
+    """FTS5, embeddings and emoji tables (the live names, or a rebuild's shadow names)."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {embeddings} (
+            entity_type TEXT NOT NULL,
+            entity_id   TEXT NOT NULL,
+            content     TEXT NOT NULL,
+            embedding   BLOB NOT NULL,
+            PRIMARY KEY (entity_type, entity_id)
+        )
+    """)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            entity_type,
+            entity_id UNINDEXED,
+            title,
+            content,
+            tokenize='porter unicode61'
+        )
+    """)
+    # Inverted index of emoji grapheme clusters / emoticons (core/emoji_tokens.py),
+    # which unicode61 discards
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {emoji} (
+            token       TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            entity_id   TEXT NOT NULL,
+            title       TEXT NOT NULL,
+            hits        INTEGER NOT NULL,
+            PRIMARY KEY (token, entity_type, entity_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def _create_meta_table(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+
 def init_search_tables(db_path: str = DB_PATH) -> None:
-    """Create FTS5 and embeddings tables if they don't exist."""
+    """Create FTS5 and embeddings tables (in every shard, if sharded) if they don't exist."""
+    for path in index_files(db_path):
+        with _connect(path) as conn:
+            _create_index_tables(conn)
+            # Index to speed up entity_type lookups on the embeddings table
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_embeddings_type
+                ON search_embeddings(entity_type)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_emoji_entity
+                ON search_emoji(entity_type, entity_id)
+            """)
+            _create_meta_table(conn)
+            # Entities each shared generation touched (see _bump_shared)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_log (
+                    generation  INTEGER NOT NULL,
+                    entity_type TEXT NOT NULL,
+                    entity_id   TEXT NOT NULL,
+                    op          TEXT NOT NULL,
+                    title       TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_search_log_generation ON search_log(generation)")
+            _backfill_emoji_index(conn)
     with _connect(db_path) as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS search_embeddings (
-                entity_type TEXT NOT NULL,
-                entity_id   TEXT NOT NULL,
-                content     TEXT NOT NULL,
-                embedding   BLOB NOT NULL,
-                PRIMARY KEY (entity_type, entity_id)
-            )
-        """)
-        conn.execute("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
-                entity_type,
-                entity_id UNINDEXED,
-                title,
-                content,
-                tokenize='porter unicode61'
-            )
-        """)
-        # Index to speed up entity_type lookups on the embeddings table
-        conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_embeddings_type
-            ON search_embeddings(entity_type)
-        """)
+        # Sync bookkeeping: per-type high-water marks and the change-log cursor
+        _create_meta_table(conn)
+        # The update/delete log moved to Postgres (see sync_search_index)
+        conn.execute("DROP TABLE IF EXISTS search_changes")
+
+
+# Bump when core/emoji_tokens.py learns new tokens, so existing indexes are re-tokenised
+_EMOJI_INDEX_VERSION = "2"
+
+
+def _backfill_emoji_index(conn: sqlite3.Connection) -> None:
+    """Build search_emoji for an index created before it existed, or before the current token set."""
+    row = conn.execute("SELECT value FROM search_meta WHERE key = 'emoji_index'").fetchone()
+    if row is not None and row["value"] == _EMOJI_INDEX_VERSION:
+        return
+    conn.execute("DELETE FROM search_emoji")
+    conn.executemany(
+        "INSERT INTO search_emoji (token, entity_type, entity_id, title, hits) VALUES (?, ?, ?, ?, ?)",
+        _emoji_postings(
+            (r["entity_type"], r["entity_id"], r["title"], r["content"])
+            for r in conn.execute("SELECT entity_type, entity_id, title, content FROM search_fts")
+        ),
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO search_meta (key, value) VALUES ('emoji_index', ?)", (_EMOJI_INDEX_VERSION,)
+    )
+
+
+def _emoji_postings(rows) -> list[tuple[str, str, str, str, int]]:
+    """(token, entity_type, entity_id, title, hits) for (entity_type, entity_id, title, content) rows."""
+    postings: list[tuple[str, str, str, str, int]] = []
+    for etype, eid, title, content in rows:
+        counts: dict[str, int] = {}
+        for token in emoji_tokens.tokens(content):
+            counts[token] = counts.get(token, 0) + 1
+        postings.extend((token, etype, eid, title or "", hits) for token, hits in counts.items())
+    return postings
 
 
 # ---------------------------------------------------------------------------
 # Embedding helpers
 # ---------------------------------------------------------------------------
 
-def _embed(text: str) -> list[float] | None:
+# Texts per TextEmbedding.embed call when indexing in bulk
+_EMBED_BATCH_SIZE = int(os.environ.get("SEARCH_EMBED_BATCH", "64"))
+
+
+# When set, embeddings come from the shared server in core/embed_server.py
+# instead of a model loaded in this process.
+_EMBED_SOCKET = os.environ.get("SEARCH_EMBED_SOCKET", "")
+
+
+def _embed_batch(texts: list[str]) -> list | None:
+    """Embed many texts in one ONNX run; returns one vector per text (None if no encoder)."""
+    if not texts:
+        return None
+    if _EMBED_SOCKET:
+        from core.embed_server import embed_remote
+        return embed_remote(texts, _EMBED_SOCKET)
     model = _get_encoder()
     if model is None:
         return None
-    # fastembed.embed() returns a generator of numpy arrays, one per input
-    result = next(model.embed([text]))
-    return result.tolist()
+    return list(model.embed(texts, batch_size=len(texts)))
+
+
+# Query-time micro-batching: concurrent _embed callers (each on its own
+# asyncio.to_thread worker) hand their text to one batcher thread, which runs
+# a single ONNX call for everything that arrived within the wait window.
+# SEARCH_EMBED_BATCH_WAIT_MS=0 disables it and embeds inline.
+_MICROBATCH_MAX = int(os.environ.get("SEARCH_EMBED_MICROBATCH", "32"))
+_MICROBATCH_WAIT = float(os.environ.get("SEARCH_EMBED_BATCH_WAIT_MS", "2")) / 1000
+_MICROBATCH_TIMEOUT = 30.0
+
+
+class _EmbedBatcher:
+    """Collects concurrent embed requests and resolves them from one batched call."""
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self.cancelled = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Thread | None = None
+        self._lock = Lock()
+
+    def submit(self, text: str, timeout: float = _MICROBATCH_TIMEOUT):
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()  # if still queued, the batcher drops it unembedded
+            raise
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="search-embed-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            live = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            self.cancelled += len(batch) - len(live)
+            batch = live
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                vectors = _embed_batch([text for text, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for i, (_, future) in enumerate(batch):
+                future.set_result(vectors[i].tolist() if vectors is not None else None)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "cancelled": self.cancelled,
+        }
+
+
+_batcher = _EmbedBatcher(_MICROBATCH_MAX, _MICROBATCH_WAIT)
+
+
+def _embed(text: str, deadline: float | None = None) -> list[float] | None:
+    """Embed one query text; waits for the batcher no later than deadline (time.monotonic())."""
+    if not _EMBED_SOCKET and _get_encoder() is None:
+        return None
+    try:
+        if _MICROBATCH_WAIT > 0 and _MICROBATCH_MAX > 1:
+            timeout = _MICROBATCH_TIMEOUT if deadline is None else max(0.0, deadline - time.monotonic())
+            return _batcher.submit(text, timeout)
+        vectors = _embed_batch([text])
+    except FutureTimeout:
+        logger.warning("Query embedding missed its deadline")
+        return None
+    except Exception as exc:
+        if not _EMBED_SOCKET:
+            raise
+        # Embedding server down or slow — degrade this query to BM25-only
+        logger.warning("Query embedding unavailable: %s", exc)
+        return None
+    return vectors[0].tolist() if vectors is not None else None
 
 
 def _cosine_similarity(a: list[float], b: list[float]) -> float:
@@ -139,15 +510,841 @@ def _cosine_similarity(a: list[float], b: list[float]) -> float:
     return dot / denom if denom > 1e-9 else 0.0
 
 
-def _pack_embedding(emb: list[float]) -> str:
-    """Store as compact JSON (or swap for struct.pack for ~3x smaller blobs)."""
-    return json.dumps(emb)
+def _normalise(vec) -> "np.ndarray":
+    """Return vec as a unit-length float32 array (zero vectors stay zero)."""
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm > 1e-9 else arr
+
+
+# Embedding blob format. Legacy rows hold JSON text ("[0.1, ...]"); current
+# rows are a one-byte version header followed by raw little-endian float32s
+# (384 dims -> 1537 bytes instead of ~8 KB of JSON).
+_EMB_FORMAT_F32 = 0x01
+
+
+def _pack_embedding(emb) -> bytes:
+    """Serialise as versioned little-endian float32."""
+    if np is not None:
+        return bytes((_EMB_FORMAT_F32,)) + np.asarray(emb, dtype="<f4").tobytes()
+    return bytes((_EMB_FORMAT_F32,)) + struct.pack(f"<{len(emb)}f", *emb)
+
+
+def _unpack_embedding(raw: str | bytes):
+    """
+    Decode either storage format.
+    Binary rows come back as a zero-copy read-only numpy view when numpy is
+    installed (a list of floats otherwise); legacy JSON rows as a list.
+    """
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if raw[:1] == bytes((_EMB_FORMAT_F32,)):
+        body = memoryview(raw)[1:]
+        if np is not None:
+            return np.frombuffer(body, dtype="<f4")
+        return list(struct.unpack(f"<{len(body) // 4}f", body))
+    return json.loads(raw.decode("utf-8"))
+
+
+def migrate_embeddings(db_path: str = DB_PATH, batch_size: int = 500, pause: float = 0.05) -> int:
+    """
+    Rewrite legacy JSON embedding rows in the binary format.
+    Each batch is its own short transaction, so concurrent searches keep
+    reading (WAL) and are never blocked for more than one batch.
+    Returns the number of rows rewritten.
+    """
+    migrated = 0
+    last_rowid = 0
+    while True:
+        with _connect(db_path) as conn:
+            rows = conn.execute(
+                """SELECT rowid, embedding FROM search_embeddings
+                   WHERE rowid > ? AND typeof(embedding) = 'text'
+                   ORDER BY rowid LIMIT ?""",
+                (last_rowid, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                # typeof guard: skip rows index_one rewrote since the SELECT
+                "UPDATE search_embeddings SET embedding = ? WHERE rowid = ? AND typeof(embedding) = 'text'",
+                [(_pack_embedding(_unpack_embedding(r["embedding"])), r["rowid"]) for r in rows],
+            )
+        migrated += len(rows)
+        last_rowid = rows[-1]["rowid"]
+        time.sleep(pause)  # yield the write lock to index_one / sync between batches
+    if migrated:
+        logger.info("Migrated %d legacy JSON embeddings to float32 in %s", migrated, db_path)
+    return migrated
+
+
+def start_embedding_migration(db_path: str = DB_PATH) -> Thread | None:
+    """Run migrate_embeddings in a daemon thread if any legacy rows exist."""
+    with _connect(db_path) as conn:
+        legacy = conn.execute(
+            "SELECT 1 FROM search_embeddings WHERE typeof(embedding) = 'text' LIMIT 1"
+        ).fetchone()
+    if legacy is None:
+        return None
+
+    def _run() -> None:
+        try:
+            migrate_embeddings(db_path)
+        except Exception:
+            logger.exception("Embedding migration failed (will retry on next start)")
+
+    thread = Thread(target=_run, name="search-embedding-migration", daemon=True)
+    thread.start()
+    return thread
+
+
+# ---------------------------------------------------------------------------
+# In-memory vector matrix — one pre-normalised float32 matrix per entity type
+#
+# Loaded lazily from search_embeddings the first time a db_path is searched,
+# then kept in sync by index_one / delete_one / sync_search_index so vector
+# scoring is a single matrix-vector product instead of a JSON decode and a
+# Python cosine per row. Only used when numpy is installed.
+#
+# Rows are append-only: an update appends the new row and tombstones the old
+# one, a delete only tombstones. A reader takes a _MatrixView (array
+# references, row count and live mask) under _vector_lock and scores it after
+# releasing the lock — writers never touch rows a view can see. Once enough
+# rows are dead the matrix is compacted into fresh arrays.
+#
+# Large matrices can additionally carry an IVF index (core/ann.py, opt-in via
+# SEARCH_ANN=ivf) so a query scores only the rows in its nprobe closest cells.
+# It is trained on a view in a background thread and swapped in under the lock.
+#
+# SEARCH_VECTOR_QUANT=int8 holds rows as int8 codes plus a per-row scale
+# (~4x smaller). Queries stay float32 (asymmetric scoring); the best
+# limit * SEARCH_VECTOR_RERANK candidates are re-scored exactly against the
+# float32 blobs in search_embeddings, which keep full precision on disk.
+# ---------------------------------------------------------------------------
+
+_MIN_SIMILARITY = 0.15
+_QUANTIZE_INT8 = os.environ.get("SEARCH_VECTOR_QUANT", "").strip().lower() == "int8"
+_RERANK_FACTOR = max(1, int(os.environ.get("SEARCH_VECTOR_RERANK", "4")))
+# Quantisation error on a unit-vector dot product stays well under this
+_QUANT_SLACK = 0.05
+_SCORE_CHUNK = 8192
+# Compact once this many rows (and a quarter of the matrix) are tombstones
+_COMPACT_MIN = 1024
+
+
+class _MatrixView:
+    """Frozen rows [:n] of a _VectorMatrix; safe to score without _vector_lock."""
+
+    __slots__ = ("ids", "contents", "n", "epoch", "quantized", "ivf", "_mat", "_scale", "_cells", "_live")
+
+    def __init__(self, matrix: "_VectorMatrix"):
+        n = self.n = matrix._rows
+        self.ids = matrix.ids
+        self.contents = matrix.contents
+        self.epoch = matrix.epoch
+        self.quantized = matrix.quantized
+        self.ivf = matrix.ivf
+        self._mat = matrix._mat[:n]
+        self._scale = matrix._scale[:n]
+        self._cells = matrix._cells[:n]
+        self._live = matrix._live[:n] if matrix._dead else None
+
+    def __len__(self) -> int:
+        return self.n if self._live is None else int(self._live.sum())
+
+    def vectors(self, live_only: bool = True) -> "np.ndarray":
+        """float32 rows (dequantised copy in int8 mode), optionally skipping tombstones."""
+        mat, scale = self._mat, self._scale
+        if live_only and self._live is not None:
+            mat, scale = mat[self._live], scale[self._live]
+        if self.quantized:
+            return mat.astype(np.float32) * scale[:, None]
+        return mat
+
+    def top_k(
+        self, query: "np.ndarray", k: int, threshold: float, nprobe: int | None = None
+    ) -> list[tuple[str, str, float]]:
+        """
+        Best k rows by cosine similarity (query must be normalised), highest first.
+        With an IVF index attached only the nprobe closest cells are scored
+        (nprobe defaults to SEARCH_ANN_NPROBE; 0 forces an exhaustive scan).
+        """
+        n = self.n
+        if n == 0 or k <= 0:
+            return []
+        if nprobe is None:
+            nprobe = ann.ANN_NPROBE
+        if self.ivf is not None and nprobe > 0:
+            probed = np.zeros(self.ivf.nlist, dtype=bool)
+            probed[self.ivf.probe(query, nprobe)] = True
+            hit = probed[self._cells]
+            rows = np.flatnonzero(hit if self._live is None else hit & self._live)
+        else:
+            rows = None
+        sims = self._scores(query, rows)
+        if rows is None and self._live is not None:
+            sims[~self._live] = -np.inf
+        if self.quantized:
+            # Approximate scores: keep extra candidates for the exact re-rank
+            k *= _RERANK_FACTOR
+            threshold -= _QUANT_SLACK
+        m = sims.shape[0]
+        idx = np.argpartition(sims, m - k)[m - k:] if k < m else np.arange(m)
+        idx = idx[sims[idx] > threshold]
+        idx = idx[np.argsort(-sims[idx], kind="stable")]
+        if rows is not None:
+            return [(self.ids[rows[i]], self.contents[rows[i]], float(sims[i])) for i in idx]
+        return [(self.ids[i], self.contents[i], float(sims[i])) for i in idx]
+
+    def _scores(self, query: "np.ndarray", rows: "np.ndarray | None") -> "np.ndarray":
+        """Dot products of query with every row (or the given row ids)."""
+        if not self.quantized:
+            return (self._mat if rows is None else self._mat[rows]) @ query
+        total = self.n if rows is None else rows.shape[0]
+        out = np.empty(total, dtype=np.float32)
+        # int8 codes are widened a chunk at a time to bound the temporary
+        for start in range(0, total, _SCORE_CHUNK):
+            stop = min(start + _SCORE_CHUNK, total)
+            sel = slice(start, stop) if rows is None else rows[start:stop]
+            out[start:stop] = (self._mat[sel] @ query) * self._scale[sel]
+        return out
+
+
+class _VectorMatrix:
+    """Dense rows for one entity type: append-only with tombstones, see _MatrixView."""
+
+    __slots__ = (
+        "ids", "contents", "quantized", "ivf", "epoch",
+        "_pos", "_rows", "_dead", "_mat", "_scale", "_cells", "_live", "_live_shared",
+    )
+
+    def __init__(self, dim: int, quantized: bool | None = None):
+        self.quantized = _QUANTIZE_INT8 if quantized is None else quantized
+        self.ivf = None
+        self.epoch = 0  # bumped when compaction renumbers rows
+        self._reset(np.empty((16, dim), dtype=np.int8 if self.quantized else np.float32))
+
+    def _reset(self, mat: "np.ndarray") -> None:
+        self.ids: list[str] = []
+        self.contents: list[str] = []
+        self._pos: dict[str, int] = {}  # entity_id -> its live row
+        self._rows = 0
+        self._dead = 0
+        self._mat = mat
+        self._scale = np.empty(mat.shape[0], dtype=np.float32)  # per-row dequantisation factor (int8 mode)
+        self._cells = np.empty(mat.shape[0], dtype=np.int32)  # IVF cell per row (valid when ivf is set)
+        self._live = np.ones(mat.shape[0], dtype=bool)
+        self._live_shared = False
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    @property
+    def dim(self) -> int:
+        return self._mat.shape[1]
+
+    def view(self) -> _MatrixView:
+        """Snapshot for scoring outside _vector_lock (caller holds the lock)."""
+        self._live_shared = self._dead > 0
+        return _MatrixView(self)
+
+    def vectors(self) -> "np.ndarray":
+        """Live float32 rows (dequantised copy in int8 mode)."""
+        return _MatrixView(self).vectors()
+
+    def vector(self, entity_id: str) -> "np.ndarray | None":
+        """The stored (normalised, dequantised) row for entity_id."""
+        i = self._pos.get(entity_id)
+        if i is None:
+            return None
+        if self.quantized:
+            return self._mat[i].astype(np.float32) * self._scale[i]
+        return self._mat[i].copy()
+
+    def nbytes(self) -> int:
+        n = self._rows
+        return self._mat[:n].nbytes + (self._scale[:n].nbytes if self.quantized else 0)
+
+    def attach_ivf(self, index, cells: "np.ndarray | None" = None) -> None:
+        """
+        Use index for top_k. cells holds the cell of each of the first
+        len(cells) rows (assigned outside the lock); the rest are assigned here.
+        """
+        done = 0 if cells is None else cells.shape[0]
+        fresh = np.empty(self._mat.shape[0], dtype=np.int32)
+        if done:
+            fresh[:done] = cells
+        if done < self._rows:
+            tail = self._mat[done:self._rows]
+            if self.quantized:
+                tail = tail.astype(np.float32) * self._scale[done:self._rows, None]
+            fresh[done:self._rows] = index.assign(tail)
+        self._cells = fresh
+        self.ivf = index
+
+    def upsert(self, entity_id: str, content: str, vec) -> None:
+        row = _normalise(vec)
+        if row.shape[0] != self._mat.shape[1]:
+            logger.warning("Skipping %s: embedding dim %d != %d", entity_id, row.shape[0], self._mat.shape[1])
+            return
+        self.remove(entity_id)
+        i = self._rows
+        if i == self._mat.shape[0]:
+            self._grow()
+        if self.quantized:
+            peak = float(np.abs(row).max()) if row.size else 0.0
+            self._scale[i] = peak / 127 if peak > 0 else 1.0
+            self._mat[i] = np.rint(row / self._scale[i]).astype(np.int8)
+        else:
+            self._mat[i] = row
+        if self.ivf is not None:
+            self._cells[i] = self.ivf.assign(row[None, :])[0]
+        self._live[i] = True
+        self.ids.append(entity_id)
+        self.contents.append(content)
+        self._pos[entity_id] = i
+        self._rows = i + 1
+
+    def remove(self, entity_id: str) -> None:
+        i = self._pos.pop(entity_id, None)
+        if i is None:
+            return
+        if self._live_shared:
+            self._live = self._live.copy()  # a view still reads the old mask
+            self._live_shared = False
+        self._live[i] = False
+        self._dead += 1
+        if self._dead >= _COMPACT_MIN and self._dead * 4 >= self._rows:
+            self._compact()
+
+    def _grow(self) -> None:
+        # New arrays: views keep reading the old ones
+        n = self._rows
+        size = max(16, n * 2)
+        for name in ("_mat", "_scale", "_cells", "_live"):
+            old = getattr(self, name)
+            new = np.empty((size,) + old.shape[1:], dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+        self._live_shared = False
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self._live[: self._rows])
+        ids, contents, scale, cells = self.ids, self.contents, self._scale, self._cells
+        mat = np.empty((max(16, keep.size), self.dim), dtype=self._mat.dtype)
+        mat[: keep.size] = self._mat[keep]
+        self._reset(mat)
+        self._scale[: keep.size] = scale[keep]
+        self._cells[: keep.size] = cells[keep]
+        self.ids = [ids[i] for i in keep]
+        self.contents = [contents[i] for i in keep]
+        self._pos = {eid: i for i, eid in enumerate(self.ids)}
+        self._rows = keep.size
+        self.epoch += 1
+
+    def top_k(
+        self, query: "np.ndarray", k: int, threshold: float, nprobe: int | None = None
+    ) -> list[tuple[str, str, float]]:
+        return _MatrixView(self).top_k(query, k, threshold, nprobe)
+
+    def _scores(self, query: "np.ndarray", rows: "np.ndarray | None") -> "np.ndarray":
+        return _MatrixView(self)._scores(query, rows)
+
+
+_vector_stores: dict[str, dict[str, _VectorMatrix]] = {}
+_vector_lock = Lock()
+# (db_path, entity_type) pairs with an IVF training thread in flight
+_ann_training: set[tuple[str, str]] = set()
+
+
+def _ann_due(db_path: str, store: dict[str, _VectorMatrix]) -> list[str]:
+    """Entity types whose matrix needs a (re)built IVF index (caller holds _vector_lock)."""
+    if ann is None or not ann.ANN_ENABLED:
+        return []
+    return [
+        etype for etype, m in store.items()
+        if len(m) >= ann.ANN_MIN_ROWS and (m.ivf is None or m.ivf.stale(len(m)))
+        and (db_path, etype) not in _ann_training
+    ]
+
+
+def _schedule_ann(db_path: str, store: dict[str, _VectorMatrix]) -> Thread | None:
+    """Start _refresh_ann in the background if any matrix is due (caller holds _vector_lock)."""
+    due = _ann_due(db_path, store)
+    if not due:
+        return None
+    _ann_training.update((db_path, etype) for etype in due)
+    thread = Thread(target=_refresh_ann, args=(db_path, store, due), name="search-ann-train", daemon=True)
+    thread.start()
+    return thread
+
+
+def _refresh_ann(db_path: str, store: dict[str, _VectorMatrix], due: list[str]) -> None:
+    """
+    Build IVF indexes for the due matrices without holding _vector_lock:
+    centroids come from the sidecar when they still fit the corpus, otherwise
+    they are retrained on a view and the sidecar is rewritten. Rows are
+    assigned to cells outside the lock too; only the swap happens under it.
+    """
+    try:
+        with _vector_lock:
+            views = {etype: store[etype].view() for etype in due}
+        path = ann.sidecar_path(db_path)
+        saved = ann.load(path)
+        retrained = False
+        for etype, view in views.items():
+            index = saved.get(etype)
+            if index is None or index.dim != view._mat.shape[1] or index.stale(len(view)):
+                index = ann.IVFIndex.train(view.vectors(), ann.ANN_NLIST)
+                retrained = True
+                logger.info("Trained IVF index for %s: %d cells over %d rows", etype, index.nlist, len(view))
+            cells = index.assign(view.vectors(live_only=False))
+            with _vector_lock:
+                matrix = store[etype]
+                # Compaction renumbered the rows: assign them all under the lock instead
+                matrix.attach_ivf(index, cells if matrix.epoch == view.epoch else None)
+        if retrained:
+            with _vector_lock:
+                indexes = {etype: m.ivf for etype, m in store.items() if m.ivf is not None}
+            try:
+                ann.save(path, indexes)
+            except OSError as exc:
+                logger.warning("Could not write ANN sidecar %s: %s", path, exc)
+    except Exception:
+        logger.exception("IVF index build failed for %s", db_path)
+    finally:
+        with _vector_lock:
+            _ann_training.difference_update((db_path, etype) for etype in due)
+
+
+def _vector_store(conn: sqlite3.Connection, db_path: str) -> dict[str, _VectorMatrix] | None:
+    """Return the loaded matrices for db_path, reading search_embeddings on first use."""
+    if np is None:
+        return None
+    store = _vector_stores.get(db_path)
+    if store is not None:
+        return store
+    with _vector_lock:
+        store = _vector_stores.get(db_path)
+        if store is not None:
+            return store
+        store = {}
+        for row in conn.execute(
+            "SELECT entity_type, entity_id, content, embedding FROM search_embeddings"
+        ):
+            emb = _unpack_embedding(row["embedding"])
+            matrix = store.get(row["entity_type"])
+            if matrix is None:
+                matrix = store[row["entity_type"]] = _VectorMatrix(len(emb))
+            matrix.upsert(row["entity_id"], row["content"][:100], emb)
+        _vector_stores[db_path] = store
+        _schedule_ann(db_path, store)
+        logger.debug("Loaded %d vectors for %s", sum(len(m) for m in store.values()), db_path)
+        return store
+
+
+def _vector_cache_upsert(db_path: str, items: list[tuple[str, str, str, list[float]]]) -> None:
+    """Apply committed (entity_type, entity_id, content, embedding) rows to a loaded store."""
+    if np is None or not items:
+        return
+    with _vector_lock:
+        store = _vector_stores.get(db_path)
+        if store is None:
+            return  # not loaded yet — the first search will read the committed rows
+        for etype, eid, content, emb in items:
+            matrix = store.get(etype)
+            if matrix is None:
+                matrix = store[etype] = _VectorMatrix(len(emb))
+            matrix.upsert(eid, content[:100], emb)
+        _schedule_ann(db_path, store)
+
+
+def _vector_cache_remove(db_path: str, entity_type: str, entity_id: str) -> None:
+    if np is None:
+        return
+    with _vector_lock:
+        matrix = _vector_stores.get(db_path, {}).get(entity_type)
+        if matrix is not None:
+            matrix.remove(entity_id)
+
+
+def invalidate_vector_cache(db_path: str | None = None) -> None:
+    """Drop the in-memory vectors for db_path (or all paths); reloaded on next search."""
+    with _vector_lock:
+        if db_path is None:
+            _vector_stores.clear()
+        else:
+            _vector_stores.pop(db_path, None)
+
+
+def _vector_search(
+    conn: sqlite3.Connection,
+    db_path: str,
+    query_embedding: list[float],
+    entity_types: Optional[list[str]],
+    limit: int,
+) -> list[tuple[str, str, str]]:
+    """Top `limit` (entity_type, entity_id, content) rows by cosine similarity."""
+    store = _vector_store(conn, db_path)
+    if store is None:
+        return _vector_scan(conn, query_embedding, entity_types, limit)
+
+    query = _normalise(query_embedding)
+    with _vector_lock:
+        views = [
+            (etype, matrix.view()) for etype, matrix in store.items()
+            if not entity_types or etype in entity_types
+        ]
+    scored: list[tuple[str, str, str, float]] = []
+    approximate: list[tuple[str, str, str, float]] = []
+    for etype, view in views:
+        hits = [(etype, eid, content, sim) for eid, content, sim in view.top_k(query, limit, _MIN_SIMILARITY)]
+        (approximate if view.quantized else scored).extend(hits)
+    if approximate:
+        scored.extend(_rerank_exact(conn, query, approximate))
+    best = heapq.nlargest(limit, scored, key=lambda x: x[3])
+    return [(r[0], r[1], r[2]) for r in best]
+
+
+def _rerank_exact(
+    conn: sqlite3.Connection,
+    query: "np.ndarray",
+    candidates: list[tuple[str, str, str, float]],
+) -> list[tuple[str, str, str, float]]:
+    """Re-score int8 candidates against their stored float32 embeddings."""
+    by_type: dict[str, list[tuple[str, str, str, float]]] = {}
+    for cand in candidates:
+        by_type.setdefault(cand[0], []).append(cand)
+    out: list[tuple[str, str, str, float]] = []
+    for etype, cands in by_type.items():
+        marks = ",".join("?" * len(cands))
+        stored = {
+            row["entity_id"]: row["embedding"]
+            for row in conn.execute(
+                f"SELECT entity_id, embedding FROM search_embeddings "
+                f"WHERE entity_type = ? AND entity_id IN ({marks})",
+                [etype, *(c[1] for c in cands)],
+            )
+        }
+        for _, eid, content, _ in cands:
+            raw = stored.get(eid)
+            if raw is None:
+                continue  # deleted since the matrix was scored
+            sim = float(_normalise(_unpack_embedding(raw)) @ query)
+            if sim > _MIN_SIMILARITY:
+                out.append((etype, eid, content, sim))
+    return out
+
+
+def _vector_scan(
+    conn: sqlite3.Connection,
+    query_embedding: list[float],
+    entity_types: Optional[list[str]],
+    limit: int,
+) -> list[tuple[str, str, str]]:
+    """numpy-free fallback: decode and score every stored embedding."""
+    emb_sql = "SELECT entity_type, entity_id, content, embedding FROM search_embeddings"
+    emb_params: list = []
+    if entity_types:
+        emb_sql += f" WHERE entity_type IN ({','.join('?' * len(entity_types))})"
+        emb_params = list(entity_types)
+
+    # Bounded min-heap of (sim, -seq, row): memory stays O(limit) however many
+    # rows clear the threshold, and ties keep scan order like a stable sort
+    if limit <= 0:
+        return []
+    heap: list[tuple[float, int, sqlite3.Row]] = []
+    for seq, row in enumerate(conn.execute(emb_sql, emb_params)):
+        sim = _cosine_similarity(query_embedding, _unpack_embedding(row["embedding"]))
+        if sim <= _MIN_SIMILARITY:
+            continue
+        item = (sim, -seq, row)
+        if len(heap) < limit:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    best = sorted(heap, reverse=True)
+    return [(r["entity_type"], r["entity_id"], r["content"][:100]) for _, _, r in best]
+
+
+# ---------------------------------------------------------------------------
+# Query caches — LRU of query embeddings, short-TTL LRU of fused results
+#
+# Result entries record the index generation they were computed at; every
+# index write bumps the generation for its db_path, so a stale entry is
+# simply a miss. Encoder inference dominates /api/search, and identical
+# queries (users retyping the same words) are common.
+# ---------------------------------------------------------------------------
+
+_QUERY_CACHE_SIZE = int(os.environ.get("SEARCH_QUERY_CACHE_SIZE", "1024"))
+_RESULT_CACHE_SIZE = int(os.environ.get("SEARCH_RESULT_CACHE_SIZE", "512"))
+_RESULT_CACHE_TTL = float(os.environ.get("SEARCH_RESULT_CACHE_TTL", "30"))
+
+
+class _LRUCache:
+    """Thread-safe bounded LRU with optional TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl is None or time.monotonic() - item[1] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_query_embeddings = _LRUCache(_QUERY_CACHE_SIZE)
+_results = _LRUCache(_RESULT_CACHE_SIZE, ttl=_RESULT_CACHE_TTL)
+_generations: dict[str, int] = {}
+_generation_lock = Lock()
+
+
+def _normalise_query(q: str) -> str:
+    return " ".join(q.lower().split())
+
+
+def _bump_generation(db_path: str) -> None:
+    """Invalidate cached results for db_path (call after every index write)."""
+    with _generation_lock:
+        _generations[db_path] = _generations.get(db_path, 0) + 1
+
+
+# ---------------------------------------------------------------------------
+# Cross-process invalidation — every uvicorn worker keeps its own vector
+# matrices and LRU caches over the same index files. Each index write bumps
+# a 'generation' counter in the file's search_meta inside its transaction
+# and logs the entities it touched under that generation in search_log.
+# Readers compare the counter (one primary-key lookup) with what this
+# process last saw and replay another process's logged upserts and deletes
+# into their in-memory state; only a rebuild or swap (a 'reset' entry), or
+# a gap longer than the log keeps, drops that state wholesale. (A file
+# replaced wholesale is caught by _thread_conn instead.)
+# ---------------------------------------------------------------------------
+
+# Generations of search_log kept per file; a process further behind reloads
+_SHARED_LOG_GENERATIONS = int(os.environ.get("SEARCH_SHARED_LOG_GENERATIONS", "1000"))
+
+_shared_seen: dict[str, int] = {}  # db_path -> shared generation the caches reflect
+_shared_own: dict[str, set[int]] = {}  # db_path -> generations this process wrote since
+
+
+def _bump_shared(conn: sqlite3.Connection, upserts: list | None, deletes: list) -> int:
+    """
+    Bump the file's shared generation in the caller's write transaction and
+    log the write under it: upserts as (entity_type, entity_id, title),
+    deletes as (entity_type, entity_id); upserts=None logs a reset (the
+    whole index was replaced). Returns the new generation.
+    """
+    row = conn.execute("SELECT value FROM search_meta WHERE key = 'generation'").fetchone()
+    value = (int(row["value"]) if row else 0) + 1
+    conn.execute("INSERT OR REPLACE INTO search_meta (key, value) VALUES ('generation', ?)", (str(value),))
+    if upserts is None:
+        entries = [(value, "", "", "reset", None)]
+    else:
+        entries = [(value, etype, eid, "delete", None) for etype, eid in deletes]
+        entries += [(value, etype, eid, "upsert", title) for etype, eid, title in upserts]
+    conn.executemany(
+        "INSERT INTO search_log (generation, entity_type, entity_id, op, title) VALUES (?, ?, ?, ?, ?)",
+        entries,
+    )
+    conn.execute("DELETE FROM search_log WHERE generation <= ?", (value - _SHARED_LOG_GENERATIONS,))
+    return value
+
+
+def _wrote_shared(db_path: str, value: int) -> None:
+    """Record a committed _bump_shared value so our own write doesn't look foreign."""
+    with _generation_lock:
+        _shared_own.setdefault(db_path, set()).add(value)
+
+
+def _foreign_changes(db_path: str, seen: int, current: int, own: set[int]) -> list | None:
+    """
+    search_log rows another process wrote in (seen, current], oldest first,
+    or None when they can't be replayed (a reset, or entries already pruned).
+    """
+    foreign = set(range(seen + 1, current + 1)) - own
+    if not foreign:
+        return []
+    with _connect(db_path) as conn:
+        rows = conn.execute(
+            """SELECT generation, entity_type, entity_id, op, title FROM search_log
+               WHERE generation > ? AND generation <= ? ORDER BY generation, rowid""",
+            (seen, current),
+        ).fetchall()
+    rows = [row for row in rows if row["generation"] in foreign]
+    if {row["generation"] for row in rows} != foreign or any(row["op"] == "reset" for row in rows):
+        return None
+    return rows
+
+
+def _replay_changes(db_path: str, rows: list) -> None:
+    """Apply another process's logged writes to this process's vectors and caches."""
+    latest: dict[tuple[str, str], sqlite3.Row] = {}
+    for row in rows:
+        latest[(row["entity_type"], row["entity_id"])] = row  # last op per entity wins
+    upserts = [(etype, eid, row["title"]) for (etype, eid), row in latest.items() if row["op"] == "upsert"]
+    deletes = [key for key, row in latest.items() if row["op"] == "delete"]
+    if np is not None and db_path in _vector_stores:
+        vectors = []
+        missing = []  # written without a vector, or removed since
+        with _connect(db_path) as conn:
+            for etype, eid, _ in upserts:
+                found = conn.execute(
+                    """SELECT content, embedding FROM search_embeddings
+                       WHERE entity_type = ? AND entity_id = ?""",
+                    (etype, eid),
+                ).fetchone()
+                if found is None:
+                    missing.append((etype, eid))
+                else:
+                    vectors.append((etype, eid, found["content"], _unpack_embedding(found["embedding"])))
+        for etype, eid in deletes + missing:
+            _vector_cache_remove(db_path, etype, eid)
+        _vector_cache_upsert(db_path, vectors)
+    _bump_generation(db_path)
+    _emit(db_path, upserts, deletes)
+
+
+def _check_shared(db_path: str) -> None:
+    """Bring in-memory state for db_path up to date with writes from other processes."""
+    try:
+        with _connect(db_path) as conn:
+            row = conn.execute("SELECT value FROM search_meta WHERE key = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        return  # tables not created yet
+    current = int(row["value"]) if row else 0
+    with _generation_lock:
+        seen = _shared_seen.get(db_path)
+        if seen == current:
+            return
+        own = set(_shared_own.get(db_path, set()))
+    changes: list | None = []
+    if seen is not None:
+        if current < seen or current - seen >= _SHARED_LOG_GENERATIONS:
+            changes = None
+        else:
+            try:
+                changes = _foreign_changes(db_path, seen, current, own)
+            except sqlite3.OperationalError:
+                changes = None  # written before search_log existed
+    if changes is None:
+        logger.debug("Search index %s was replaced in another process; dropping cached state", db_path)
+        _index_replaced(db_path)
+    elif changes:
+        logger.debug("Replaying %d search index changes from another process on %s", len(changes), db_path)
+        _replay_changes(db_path, changes)
+    with _generation_lock:
+        if _shared_seen.get(db_path) == seen:  # unless a concurrent check got further
+            _shared_seen[db_path] = current
+            _shared_own[db_path] = {g for g in _shared_own.get(db_path, set()) if g > current}
+
+
+# ---------------------------------------------------------------------------
+# Index events — in-process listeners (e.g. core/suggest.py) kept in step
+# with writes. Callbacks run on the writing thread after commit; keep them cheap.
+# ---------------------------------------------------------------------------
 
+_index_listeners: list = []
 
-def _unpack_embedding(raw: str | bytes) -> list[float]:
-    if isinstance(raw, bytes):
-        raw = raw.decode("utf-8")
-    return json.loads(raw)
+
+def add_index_listener(fn) -> None:
+    """
+    Register fn(db_path, upserts, deletes): upserts is a list of
+    (entity_type, entity_id, title), deletes of (entity_type, entity_id).
+    upserts is None when the whole index was replaced.
+    """
+    if fn not in _index_listeners:
+        _index_listeners.append(fn)
+
+
+def _emit(db_path: str, upserts: list | None, deletes: list) -> None:
+    db_path = _shard_owner.get(db_path, db_path)  # listeners only see the logical index
+    for fn in _index_listeners:
+        try:
+            fn(db_path, upserts, deletes)
+        except Exception:
+            logger.exception("Search index listener %r failed", fn)
+
+
+def _index_replaced(db_path: str) -> None:
+    """The index under db_path changed wholesale (rebuild, swap, file replaced)."""
+    invalidate_vector_cache(db_path)
+    _bump_generation(db_path)
+    _emit(db_path, None, [])
+
+
+def _embed_query(q: str, deadline: float | None = None) -> list[float] | None:
+    """_embed with an LRU keyed by normalised query text."""
+    key = _normalise_query(q)
+    emb = _query_embeddings.get(key)
+    if emb is None:
+        emb = _embed(q, deadline)
+        if emb is not None:
+            _query_embeddings.put(key, emb)
+    return emb
+
+
+def search_cache_stats() -> dict:
+    return {
+        "query_embeddings": _query_embeddings.stats(),
+        "results": _results.stats(),
+        "related": _related.stats(),
+        "embed_batcher": _batcher.stats(),
+        "vectors": _vector_stats(),
+    }
+
+
+def _vector_stats() -> dict:
+    with _vector_lock:
+        matrices = [m for store in _vector_stores.values() for m in store.values()]
+        return {
+            "rows": sum(len(m) for m in matrices),
+            "bytes": sum(m.nbytes() for m in matrices),
+            "quantized": _QUANTIZE_INT8,
+        }
+
+
+def clear_search_caches() -> None:
+    _query_embeddings.clear()
+    _results.clear()
+    _related.clear()
 
 
 # ---------------------------------------------------------------------------
@@ -183,24 +1380,45 @@ def _indexed_ids(conn: sqlite3.Connection, entity_type: str) -> set[str]:
     return {r["entity_id"] for r in rows}
 
 
+def _insert_entities(
+    conn: sqlite3.Connection,
+    rows: list[tuple[str, str, str, str]],
+) -> list[tuple[str, str, str, list[float]]]:
+    """
+    Insert FTS and embedding rows for (entity_type, entity_id, title, content)
+    tuples with one embedding call and one executemany per table.
+    Returns the (entity_type, entity_id, content, embedding) rows written.
+    """
+    conn.executemany(
+        "INSERT INTO search_fts (entity_type, entity_id, title, content) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO search_emoji (token, entity_type, entity_id, title, hits) VALUES (?, ?, ?, ?, ?)",
+        _emoji_postings(rows),
+    )
+    embs = _embed_batch([content for _, _, _, content in rows])
+    if embs is None:
+        return []
+    vectors = [(etype, eid, content, emb) for (etype, eid, _, content), emb in zip(rows, embs)]
+    conn.executemany(
+        """INSERT OR REPLACE INTO search_embeddings
+           (entity_type, entity_id, content, embedding) VALUES (?, ?, ?, ?)""",
+        [(etype, eid, content, _pack_embedding(emb)) for etype, eid, content, emb in vectors],
+    )
+    return vectors
+
+
 def _insert_entity(
     conn: sqlite3.Connection,
     entity_type: str,
     entity_id: str,
     title: str,
     content: str,
-) -> None:
-    conn.execute(
-        "INSERT INTO search_fts (entity_type, entity_id, title, content) VALUES (?, ?, ?, ?)",
-        (entity_type, entity_id, title, content),
-    )
-    emb = _embed(content)
-    if emb is not None:
-        conn.execute(
-            """INSERT OR REPLACE INTO search_embeddings
-               (entity_type, entity_id, content, embedding) VALUES (?, ?, ?, ?)""",
-            (entity_type, entity_id, content, _pack_embedding(emb)),
-        )
+) -> list[float] | None:
+    """Insert FTS and embedding rows; returns the embedding (None if no encoder)."""
+    vectors = _insert_entities(conn, [(entity_type, entity_id, title, content)])
+    return vectors[0][3] if vectors else None
 
 
 def _delete_entity(conn: sqlite3.Connection, entity_type: str, entity_id: str) -> None:
@@ -212,67 +1430,248 @@ def _delete_entity(conn: sqlite3.Connection, entity_type: str, entity_id: str) -
         "DELETE FROM search_embeddings WHERE entity_type = ? AND entity_id = ?",
         (entity_type, entity_id),
     )
+    conn.execute(
+        "DELETE FROM search_emoji WHERE entity_type = ? AND entity_id = ?",
+        (entity_type, entity_id),
+    )
+
+
+def entity_document(entity_type: str, row) -> tuple[str, str]:
+    """
+    (title, content) to index for a source row. Expects the columns selected
+    by sync_search_index: prompts(title, context_text), agents(name),
+    proposals(emoji_string, rationale, prompt_title).
+    """
+    if entity_type == "prompt":
+        title = row["title"] or ""
+        return title, f"{title} {row['context_text'] or ''}".strip()
+    if entity_type == "agent":
+        name = row["name"] or ""
+        return name, name
+    if entity_type == "proposal":
+        content = f"{row['emoji_string'] or ''} {row['rationale'] or ''} {row['prompt_title'] or ''}".strip()
+        return (row["rationale"] or row["emoji_string"] or "")[:100], content
+    raise ValueError(f"Unknown entity type: {entity_type}")
 
 
 # ---------------------------------------------------------------------------
-# Public sync API
+# Public sync API — catch-up from Postgres
+#
+# The outbox (core/indexer.py) indexes writes as they happen; this pass
+# catches an index up with whatever it missed (cold start, a restored
+# snapshot, writes made outside the app, an outbox entry lost in a crash).
+# Triggers on the source tables log every insert, update and delete to
+# search_changes (migrations 4 and 6 in core/migrations.py), which is read
+# past this index's cursor. created_at is stamped by the app, so it can't
+# order commits: a fresh index is built by paging each type past a
+# (created_at, id) high-water mark once, with the cursor pinned at the log
+# horizon taken before the first page; after that only the log is read.
+# Marks and cursor live in db_path's search_meta.
 # ---------------------------------------------------------------------------
 
-def sync_search_index(db_path: str = DB_PATH, incremental: bool = True) -> int:
+# Source rows per entity type, with created_at as the sort key of the
+# high-water mark. The second item is the alias of the entity's own table.
+_SOURCE_SQL = {
+    "prompt": ("SELECT p.id, p.title, p.context_text, p.created_at AS mark FROM prompts p", "p"),
+    "agent": ("SELECT a.id, a.name, a.created_at AS mark FROM agents a", "a"),
+    "proposal": ("SELECT pr.id, pr.emoji_string, pr.rationale, p.title AS prompt_title, "
+                 "pr.created_at AS mark "
+                 "FROM proposals pr JOIN prompts p ON p.id = pr.prompt_id", "pr"),
+}
+_NEW_ROWS_SQL = "{sql} WHERE ({a}.created_at, {a}.id) > ($1, $2) ORDER BY {a}.created_at, {a}.id LIMIT $3"
+_BY_IDS_SQL = "{sql} WHERE {a}.id = ANY($1::text[])"
+
+# The log is read in (txid, seq) order and only below the oldest transaction
+# still running, so a change committed late by a long transaction is never
+# skipped over: every transaction below that horizon has finished.
+_CHANGES_HORIZON_SQL = "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+_CHANGES_SQL = """SELECT txid, seq, entity_type, entity_id, op FROM search_changes
+                  WHERE (txid, seq) > ($1, $2) AND txid < $3
+                  ORDER BY txid, seq LIMIT $4"""
+_PRUNE_CHANGES_SQL = "DELETE FROM search_changes WHERE changed_at < $1"
+
+_SYNC_PAGE = int(os.environ.get("SEARCH_SYNC_PAGE", "1000"))
+# Log rows older than this are pruned; an index last synced before that
+# can't trust the log any more and is rebuilt instead
+CHANGE_RETENTION = timedelta(days=float(os.environ.get("SEARCH_CHANGE_RETENTION_DAYS", "7")))
+
+# changes:inserts marks an index whose initial build has finished, so new
+# rows come from the log alone
+_SYNC_KEYS = ("changes:cursor", "changes:inserts", "synced_at")
+_SYNC_KEYS_SQL = f"key LIKE 'watermark:%' OR key IN ({', '.join('?' * len(_SYNC_KEYS))})"
+
+
+def _sync_state(db_path: str, reset: bool) -> dict[str, str]:
+    """Sync bookkeeping from db_path's search_meta; reset=True empties the index first."""
+    wrote: dict[str, int] = {}
+    with _connect(db_path) as conn:
+        if reset:
+            for path in index_files(db_path):
+                with _connect(path) as index_conn:
+                    index_conn.execute("DELETE FROM search_fts")
+                    index_conn.execute("DELETE FROM search_embeddings")
+                    index_conn.execute("DELETE FROM search_emoji")
+                    wrote[path] = _bump_shared(index_conn, None, [])
+            conn.execute(f"DELETE FROM search_meta WHERE {_SYNC_KEYS_SQL}", _SYNC_KEYS)
+        rows = conn.execute(f"SELECT key, value FROM search_meta WHERE {_SYNC_KEYS_SQL}", _SYNC_KEYS).fetchall()
+    for path, value in wrote.items():
+        _wrote_shared(path, value)
+        _index_replaced(path)
+    return {row["key"]: row["value"] for row in rows}
+
+
+def _indexed_ids_at(db_path: str, entity_type: str) -> set[str]:
+    with _connect(shard_path(db_path, entity_type)) as conn:
+        return _indexed_ids(conn, entity_type)
+
+
+def _apply_sync(
+    db_path: str,
+    pending: list[tuple[str, str, str, str]],
+    stale: list[tuple[str, str]],
+    removed: list[tuple[str, str]],
+    meta: dict[str, str],
+    batch_size: int,
+) -> None:
     """
-    Sync FTS5 and embeddings tables from prompts, agents, proposals.
-
-    incremental=True  — only index new rows (fast, safe to call on every write)
-    incremental=False — full rebuild (use for schema migrations or repairs)
-
-    Returns the number of newly indexed items.
+    Write one page of a sync: drop stale and removed entities, index pending
+    rows and record the page's bookkeeping. Unsharded that is one
+    transaction; shards commit just ahead of the bookkeeping.
     """
+    dropped = _by_shard(db_path, stale + removed)
+    batches = _by_shard(db_path, pending)
+    vectors: dict[str, list[tuple[str, str, str, list[float]]]] = {}
+    wrote: dict[str, int] = {}
+    batch_size = max(1, batch_size)
     with _connect(db_path) as conn:
-        if not incremental:
-            conn.execute("DELETE FROM search_fts")
-            conn.execute("DELETE FROM search_embeddings")
-            existing_prompts: set[str] = set()
-            existing_agents: set[str] = set()
-            existing_proposals: set[str] = set()
-        else:
-            existing_prompts = _indexed_ids(conn, "prompt")
-            existing_agents = _indexed_ids(conn, "agent")
-            existing_proposals = _indexed_ids(conn, "proposal")
+        for path in dict.fromkeys([*dropped, *batches]):
+            written = vectors.setdefault(path, [])
+            with _connect(path) as index_conn:
+                for etype, eid in dropped.get(path, []):
+                    _delete_entity(index_conn, etype, eid)
+                rows = batches.get(path, [])
+                for start in range(0, len(rows), batch_size):
+                    written.extend(_insert_entities(index_conn, rows[start:start + batch_size]))
+                wrote[path] = _bump_shared(
+                    index_conn, [(etype, eid, title) for etype, eid, title, _ in rows], dropped.get(path, [])
+                )
+        conn.executemany(
+            "INSERT OR REPLACE INTO search_meta (key, value) VALUES (?, ?)", list(meta.items())
+        )
+    for path, written in vectors.items():
+        _wrote_shared(path, wrote[path])
+        for etype, eid in dropped.get(path, []):
+            _vector_cache_remove(path, etype, eid)
+        _vector_cache_upsert(path, written)
+        _bump_generation(path)
+    if pending or removed:
+        _emit(db_path, [(etype, eid, title) for etype, eid, title, _ in pending], removed)
 
-        count = 0
 
-        # --- Prompts ---
-        for row in conn.execute("SELECT id, title, context_text FROM prompts").fetchall():
-            if row["id"] in existing_prompts:
-                continue
-            title = row["title"] or ""
-            content = f"{title} {row['context_text'] or ''}".strip()
-            _insert_entity(conn, "prompt", row["id"], title, content)
-            count += 1
-
-        # --- Agents ---
-        for row in conn.execute("SELECT id, name FROM agents").fetchall():
-            if row["id"] in existing_agents:
-                continue
-            name = row["name"] or ""
-            content = name
-            _insert_entity(conn, "agent", row["id"], name, content)
-            count += 1
+async def sync_search_index(
+    db_path: str = DB_PATH,
+    incremental: bool = True,
+    batch_size: int = _EMBED_BATCH_SIZE,
+) -> int:
+    """
+    Sync FTS5 and embeddings tables from prompts, agents, proposals in Postgres.
 
-        # --- Proposals ---
-        for row in conn.execute(
-            """SELECT pr.id, pr.emoji_string, pr.rationale, p.title AS prompt_title
-               FROM proposals pr
-               JOIN prompts p ON p.id = pr.prompt_id"""
-        ).fetchall():
-            if row["id"] in existing_proposals:
-                continue
-            content = f"{row['emoji_string'] or ''} {row['rationale'] or ''} {row['prompt_title'] or ''}".strip()
-            title = (row["rationale"] or row["emoji_string"] or "")[:100]
-            _insert_entity(conn, "proposal", row["id"], title, content)
-            count += 1
+    incremental=True  — replay the inserts, updates and deletes logged since
+                        this index's cursor (finishing an interrupted initial
+                        build first); cost is proportional to what changed,
+                        not to table size
+    incremental=False — full rebuild (use for schema migrations or repairs)
+
+    Rows are read SEARCH_SYNC_PAGE at a time and embedded batch_size at a
+    time (SEARCH_EMBED_BATCH env); each page commits with its bookkeeping,
+    so an interrupted sync resumes where it stopped.
+    Returns the number of entities indexed, re-indexed or removed.
+    """
+    state = await asyncio.to_thread(_sync_state, db_path, not incremental)
+    now = datetime.now(timezone.utc)
+    synced_at = state.get("synced_at")
+    if incremental and synced_at and datetime.fromisoformat(synced_at) < now - CHANGE_RETENTION:
+        logger.warning("search index %s is older than the change log; rebuilding", db_path)
+        return await sync_search_index(db_path, incremental=False, batch_size=batch_size)
+
+    count = 0
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        horizon = await conn.fetchval(_CHANGES_HORIZON_SQL)
+        # A fresh index reads current rows below, which already reflect every
+        # change committed before the horizon; anything committed after it is
+        # in the log past the cursor, which every page records
+        cursor = tuple(json.loads(state["changes:cursor"])) if "changes:cursor" in state else (horizon, 0)
+
+        # --- Initial build: current rows, past the high-water mark ---
+        new_keys: set[tuple[str, str]] = set()
+        building = "changes:inserts" not in state
+        for etype, (sql, alias) in _SOURCE_SQL.items() if building else ():
+            mark = tuple(json.loads(state[f"watermark:{etype}"])) if f"watermark:{etype}" in state else ("", "")
+            existing: set[str] | None = None if incremental else set()
+            while True:
+                rows = await conn.fetch(_NEW_ROWS_SQL.format(sql=sql, a=alias), *mark, _SYNC_PAGE)
+                if not rows:
+                    break
+                if existing is None:
+                    # Rows the outbox indexed since the last sync are already there
+                    existing = await asyncio.to_thread(_indexed_ids_at, db_path, etype)
+                pending = [
+                    (etype, row["id"], *entity_document(etype, row))
+                    for row in rows if row["id"] not in existing
+                ]
+                new_keys.update((etype, eid) for _, eid, _, _ in pending)
+                mark = (rows[-1]["mark"], rows[-1]["id"])
+                await asyncio.to_thread(
+                    _apply_sync, db_path, pending, [], [],
+                    {f"watermark:{etype}": json.dumps(list(mark)), "changes:cursor": json.dumps(list(cursor))},
+                    batch_size,
+                )
+                count += len(pending)
+                if len(rows) < _SYNC_PAGE:
+                    break
+
+        # --- Logged inserts, updates and deletes (latest op per entity wins) ---
+        while True:
+            rows = await conn.fetch(_CHANGES_SQL, *cursor, horizon, _SYNC_PAGE)
+            if not rows:
+                break
+            changes: dict[tuple[str, str], str] = {}
+            for row in rows:
+                changes[(row["entity_type"], row["entity_id"])] = row["op"]
+            cursor = (rows[-1]["txid"], rows[-1]["seq"])
+            upserts: dict[str, list[str]] = {}
+            removed: list[tuple[str, str]] = []
+            for (etype, eid), op in changes.items():
+                if (etype, eid) in new_keys and op != "delete":
+                    continue
+                if op == "delete":
+                    removed.append((etype, eid))
+                else:
+                    upserts.setdefault(etype, []).append(eid)
+            pending = []
+            for etype, ids in upserts.items():
+                sql, alias = _SOURCE_SQL[etype]
+                found = await conn.fetch(_BY_IDS_SQL.format(sql=sql, a=alias), ids)
+                pending.extend((etype, row["id"], *entity_document(etype, row)) for row in found)
+                present = {row["id"] for row in found}
+                removed.extend((etype, eid) for eid in ids if eid not in present)
+            await asyncio.to_thread(
+                _apply_sync, db_path, pending, [(etype, eid) for etype, eid, _, _ in pending], removed,
+                {"changes:cursor": json.dumps(list(cursor))}, batch_size,
+            )
+            count += len(pending) + len(removed)
+            if len(rows) < _SYNC_PAGE:
+                break
+
+        await conn.execute(_PRUNE_CHANGES_SQL, now - CHANGE_RETENTION)
+    await asyncio.to_thread(
+        _apply_sync, db_path, [], [], [],
+        {"changes:cursor": json.dumps(list(cursor)), "changes:inserts": "1", "synced_at": now.isoformat()},
+        batch_size,
+    )
 
-    logger.debug("sync_search_index: indexed %d new items (incremental=%s)", count, incremental)
+    logger.debug("sync_search_index: %d entities changed (incremental=%s)", count, incremental)
     return count
 
 
@@ -290,15 +1689,129 @@ def index_one(
     Example:
         index_one("prompt", new_prompt.id, new_prompt.title, new_prompt.context_text)
     """
-    with _connect(db_path) as conn:
+    path = shard_path(db_path, entity_type)
+    with _connect(path) as conn:
         _delete_entity(conn, entity_type, entity_id)  # remove stale version if any
-        _insert_entity(conn, entity_type, entity_id, title, content)
+        emb = _insert_entity(conn, entity_type, entity_id, title, content)
+        generation = _bump_shared(conn, [(entity_type, entity_id, title)], [])
+    _wrote_shared(path, generation)
+    if emb is not None:
+        _vector_cache_upsert(path, [(entity_type, entity_id, content, emb)])
+    else:
+        _vector_cache_remove(path, entity_type, entity_id)
+    _bump_generation(path)
+    _emit(db_path, [(entity_type, entity_id, title)], [])
+
+
+def index_many(
+    rows: list[tuple[str, str, str, str]],
+    db_path: str = DB_PATH,
+    batch_size: int = _EMBED_BATCH_SIZE,
+) -> None:
+    """
+    Index (entity_type, entity_id, title, content) rows in one transaction
+    per index file, replacing any stale versions. Used by the indexing
+    outbox (core/indexer.py).
+    """
+    if not rows:
+        return
+    batch_size = max(1, batch_size)
+    for path, group in _by_shard(db_path, rows).items():
+        vectors: list[tuple[str, str, str, list[float]]] = []
+        with _connect(path) as conn:
+            for etype, eid, _, _ in group:
+                _delete_entity(conn, etype, eid)
+            for start in range(0, len(group), batch_size):
+                vectors.extend(_insert_entities(conn, group[start:start + batch_size]))
+            generation = _bump_shared(conn, [(etype, eid, title) for etype, eid, title, _ in group], [])
+        _wrote_shared(path, generation)
+        embedded = {(etype, eid) for etype, eid, _, _ in vectors}
+        for etype, eid, _, _ in group:
+            if (etype, eid) not in embedded:
+                _vector_cache_remove(path, etype, eid)
+        _vector_cache_upsert(path, vectors)
+        _bump_generation(path)
+    _emit(db_path, [(etype, eid, title) for etype, eid, title, _ in rows], [])
 
 
 def delete_one(entity_type: str, entity_id: str, db_path: str = DB_PATH) -> None:
     """Remove a single entity from the search index (call on deletion)."""
-    with _connect(db_path) as conn:
+    path = shard_path(db_path, entity_type)
+    with _connect(path) as conn:
         _delete_entity(conn, entity_type, entity_id)
+        generation = _bump_shared(conn, [], [(entity_type, entity_id)])
+    _wrote_shared(path, generation)
+    _vector_cache_remove(path, entity_type, entity_id)
+    _bump_generation(path)
+    _emit(db_path, [], [(entity_type, entity_id)])
+
+
+# ---------------------------------------------------------------------------
+# "More like this" — nearest neighbours of an already-indexed entity
+#
+# Uses the entity's stored vector, so no encoder call at request time.
+# Cached per (entity, limit); a write to any entity of the same type moves
+# that type's generation and retires its cached neighbour lists.
+# ---------------------------------------------------------------------------
+
+_related = _LRUCache(int(os.environ.get("SEARCH_RELATED_CACHE_SIZE", "1024")))
+_type_generations: dict[tuple[str, str], int] = {}
+
+
+def _on_related_event(db_path: str, upserts: list | None, deletes: list) -> None:
+    if upserts is None:
+        types = {etype for (path, etype) in _type_generations if path == db_path}
+    else:
+        types = {u[0] for u in upserts} | {d[0] for d in deletes}
+    with _generation_lock:
+        for etype in types:
+            _type_generations[(db_path, etype)] = _type_generations.get((db_path, etype), 0) + 1
+
+
+add_index_listener(_on_related_event)
+
+
+def related(
+    entity_type: str,
+    entity_id: str,
+    limit: int = 10,
+    db_path: str = DB_PATH,
+) -> list[tuple[str, float]]:
+    """
+    Up to `limit` (entity_id, similarity) of the same type closest to
+    entity_id's stored embedding, best first. Empty if it has no vector.
+    """
+    key = (db_path, entity_type, entity_id, limit)
+    path = shard_path(db_path, entity_type)
+    _check_shared(path)
+    generation = _type_generations.setdefault((db_path, entity_type), 0)
+    cached = _related.get(key)
+    if cached is not None and cached[0] == generation:
+        return list(cached[1])
+
+    out: list[tuple[str, float]] = []
+    with _connect(path) as conn:
+        store = _vector_store(conn, path)
+        if store is not None:
+            with _vector_lock:
+                matrix = store.get(entity_type)
+                query = matrix.vector(entity_id) if matrix is not None else None
+                view = matrix.view() if query is not None else None
+            quantized = view is not None and view.quantized
+            hits = view.top_k(_normalise(query), limit + 1, _MIN_SIMILARITY) if view is not None else []
+            if quantized and hits:
+                row = conn.execute(
+                    "SELECT embedding FROM search_embeddings WHERE entity_type = ? AND entity_id = ?",
+                    (entity_type, entity_id),
+                ).fetchone()
+                if row is not None:
+                    exact = _normalise(_unpack_embedding(row["embedding"]))
+                    reranked = _rerank_exact(conn, exact, [(entity_type, eid, c, sim) for eid, c, sim in hits])
+                    hits = [(eid, c, sim) for _, eid, c, sim in heapq.nlargest(limit + 1, reranked, key=lambda x: x[3])]
+            out = [(eid, round(sim, 4)) for eid, _, sim in hits if eid != entity_id][:limit]
+
+    _related.put(key, (generation, out))
+    return list(out)
 
 
 # ---------------------------------------------------------------------------
@@ -312,89 +1825,247 @@ def hybrid_search(
     db_path: str = DB_PATH,
 ) -> list[dict]:
     """
-    Hybrid BM25 + vector search with Reciprocal Rank Fusion (RRF).
+    Hybrid BM25 + vector search with Reciprocal Rank Fusion (RRF); emoji and
+    emoticons in the query add a third leg from the search_emoji index.
     Returns list of {entity_type, entity_id, title, snippet, score}.
     Falls back gracefully to BM25-only if embeddings are unavailable.
+    Results are cached briefly per (query, entity_types, limit) until the
+    next index write.
     """
     if not query or not query.strip():
         return []
 
     q = query.strip()
     fts_query = _build_fts_query(q)
-    if fts_query is None:
+    emoji_query = list(dict.fromkeys(emoji_tokens.tokens(q)))
+    if fts_query is None and not emoji_query:
         return []
 
-    type_filter = ""
-    type_params: list = []
-    if entity_types:
-        placeholders = ",".join("?" * len(entity_types))
-        type_filter = f" AND entity_type IN ({placeholders})"
-        type_params = list(entity_types)
+    shards = shard_paths(db_path, entity_types)
+    if not shards:
+        return []
+    cache_key = (
+        db_path,
+        _normalise_query(q),
+        tuple(sorted(entity_types)) if entity_types else None,
+        limit,
+    )
+    for path in shards:
+        _check_shared(path)
+    generation = tuple(_generations.get(path, 0) for path in shards)
+    cached = _results.get(cache_key)
+    if cached is not None and cached[0] == generation:
+        return [dict(r) for r in cached[1]]
 
     fetch_limit = limit * 3  # over-fetch before RRF re-ranking
 
-    with _connect(db_path) as conn:
-        # --- BM25 via FTS5 ---
-        bm25_rows = _run_fts(conn, fts_query, type_filter, type_params, fetch_limit)
-
-        # If AND query matched nothing, retry with OR (broader fallback)
-        if not bm25_rows and " AND " in fts_query:
-            fts_or = fts_query.replace(" AND ", " OR ")
-            bm25_rows = _run_fts(conn, fts_or, type_filter, type_params, fetch_limit)
-
-        # --- Vector search ---
-        query_embedding = _embed(q)
-        vector_ranked: list[tuple[str, str, str]] = []
-
-        if query_embedding is not None:
-            emb_sql = "SELECT entity_type, entity_id, content, embedding FROM search_embeddings"
-            emb_params: list = []
-            if entity_types:
-                emb_sql += f" WHERE entity_type IN ({','.join('?' * len(entity_types))})"
-                emb_params = list(entity_types)
-
-            scored: list[tuple[str, str, str, float]] = []
-            for row in conn.execute(emb_sql, emb_params).fetchall():
-                emb = _unpack_embedding(row["embedding"])
-                sim = _cosine_similarity(query_embedding, emb)
-                if sim > 0.15:
-                    scored.append((row["entity_type"], row["entity_id"], row["content"][:100], sim))
-
-            scored.sort(key=lambda x: -x[3])
-            vector_ranked = [(r[0], r[1], r[2]) for r in scored[:fetch_limit]]
-
-    # --- RRF fusion (k=60 is standard) ---
-    k = 60
-    rrf: dict[tuple[str, str], float] = {}
-
-    for rank, row in enumerate(bm25_rows):
-        key = (row["entity_type"], row["entity_id"])
-        rrf[key] = rrf.get(key, 0.0) + 1.0 / (k + rank + 1)
-
-    for rank, (etype, eid, _) in enumerate(vector_ranked):
-        key = (etype, eid)
-        rrf[key] = rrf.get(key, 0.0) + 1.0 / (k + rank + 1)
-
-    # --- Build output ---
-    bm25_lookup = {(r["entity_type"], r["entity_id"]): r for r in bm25_rows}
-    vector_content = {(r[0], r[1]): r[2] for r in vector_ranked}
+    # The vector leg (embed + scan) runs on the leg pool while the BM25 leg
+    # runs here; each gets its own thread-local connection and must finish
+    # by the shared deadline or is dropped from the fusion. With several
+    # shards, every shard's BM25 leg but the first also goes to the pool.
+    deadline = time.monotonic() + _LEG_TIMEOUT
+    vector_future = None
+    if _EMBED_SOCKET or _get_encoder() is not None:
+        vector_future = _leg_pool.submit(_vector_leg, shards, q, fetch_limit, deadline)
+
+    paths = list(shards)
+    bm25_futures = []
+    if fts_query is not None:
+        bm25_futures = [
+            _leg_pool.submit(_bm25_leg, path, fts_query, *_type_filter(shards[path]), fetch_limit, deadline)
+            for path in paths[1:]
+        ]
+
+    bm25_legs: list[list[sqlite3.Row]] = []
+    complete = True
+    if fts_query is not None:
+        first = _bm25_leg(paths[0], fts_query, *_type_filter(shards[paths[0]]), fetch_limit, deadline)
+        others = [_leg_result(f, deadline, "BM25", q) for f in bm25_futures]
+        for rows in (first, *others):
+            complete = complete and rows is not None
+            bm25_legs.append(rows or [])
+    ranked_legs = [
+        _emoji_leg(path, emoji_query, *_type_filter(shards[path]), fetch_limit)
+        for path in paths
+    ] if emoji_query else []
+
+    if vector_future is not None:
+        vector_legs = _leg_result(vector_future, deadline, "Vector", q)
+        complete = complete and vector_legs is not None
+        ranked_legs = (vector_legs or []) + ranked_legs
+
+    results = _fuse(bm25_legs, ranked_legs, limit)
+
+    if complete:  # don't pin a degraded answer in the cache
+        _results.put(cache_key, (generation, [dict(r) for r in results]))
+    return results
+
+
+_RRF_K = 60  # standard Reciprocal Rank Fusion constant
+
+
+def _fuse(
+    bm25_legs: list[list[sqlite3.Row]],
+    ranked_legs: list[list[tuple[str, str, str]]],
+    limit: int,
+) -> list[dict]:
+    """
+    RRF-merge the ranked legs — BM25 rows per shard, then (entity_type,
+    entity_id, text) lists from the vector and emoji legs — and format the
+    best `limit`. Selection is a bounded heap; only the survivors are
+    turned into dicts.
+    """
+    legs = [leg for leg in (*bm25_legs, *ranked_legs) if leg]
+    if not legs:
+        return []
+
+    # key -> [score, bm25 row or None, fallback title text or None]
+    fused: dict[tuple[str, str], list] = {}
+    for bm25_rows in bm25_legs:
+        for rank, row in enumerate(bm25_rows):
+            key = (row["entity_type"], row["entity_id"])
+            entry = fused.get(key)
+            if entry is None:
+                fused[key] = [1.0 / (_RRF_K + rank + 1), row, None]
+            else:
+                entry[0] += 1.0 / (_RRF_K + rank + 1)
+                entry[1] = entry[1] or row
+    for leg in ranked_legs:
+        for rank, (etype, eid, text) in enumerate(leg):
+            key = (etype, eid)
+            entry = fused.get(key)
+            if entry is None:
+                fused[key] = [1.0 / (_RRF_K + rank + 1), None, text]
+            else:
+                entry[0] += 1.0 / (_RRF_K + rank + 1)
+                entry[2] = entry[2] or text
+
+    if len(legs) == 1 and len(fused) == len(legs[0]):
+        top = list(fused.items())[:limit]  # one leg, no repeats: already in rank order
+    else:
+        top = heapq.nlargest(limit, fused.items(), key=lambda item: item[1][0])
 
     results: list[dict] = []
-    for (etype, eid), score in sorted(rrf.items(), key=lambda x: -x[1])[:limit]:
-        bm = bm25_lookup.get((etype, eid))
-        title = bm["title"] if bm else (vector_content.get((etype, eid)) or "")[:80]
-        snippet = (bm["snippet"] if bm and bm["snippet"] else None)
+    for (etype, eid), (score, bm, content) in top:
         results.append({
             "entity_type": etype,
             "entity_id": eid,
-            "title": title,
-            "snippet": snippet,
+            "title": bm["title"] if bm else (content or "")[:80],
+            "snippet": bm["snippet"] if bm and bm["snippet"] else None,
             "score": round(score, 4),
         })
-
     return results
 
 
+_LEG_TIMEOUT = int(os.environ.get("SEARCH_LEG_TIMEOUT_MS", "2000")) / 1000
+# Searches in flight at once: routers call hybrid_search through
+# asyncio.to_thread, whose default executor runs min(32, cpus + 4) threads.
+# Each pools one vector leg plus, sharded, a BM25 leg per extra shard.
+_SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", str(min(32, (os.cpu_count() or 1) + 4))))
+_POOLED_LEGS = 1 + (len(ENTITY_TYPES) - 1 if _SHARDED else 0)
+_leg_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SEARCH_LEG_WORKERS", str(_SEARCH_CONCURRENCY * _POOLED_LEGS))),
+    thread_name_prefix="search-leg",
+)
+
+
+def _type_filter(entity_types: Optional[list[str]]) -> tuple[str, list]:
+    """SQL clause and params restricting a leg's query to entity_types (None = no filter)."""
+    if not entity_types:
+        return "", []
+    return f" AND entity_type IN ({','.join('?' * len(entity_types))})", list(entity_types)
+
+
+def _leg_result(future: Future, deadline: float, leg: str, q: str):
+    """A pooled leg's result, or None if it missed the deadline or failed."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        future.cancel()  # frees the worker if the leg hasn't started yet
+        logger.warning("%s leg missed the %.0f ms deadline for %r", leg, _LEG_TIMEOUT * 1000, q)
+    except Exception:
+        logger.exception("%s leg failed for %r", leg, q)
+    return None
+
+
+def _bm25_leg(
+    db_path: str,
+    fts_query: str,
+    type_filter: str,
+    type_params: list,
+    limit: int,
+    deadline: float,
+) -> list[sqlite3.Row] | None:
+    """
+    FTS5 ranking with the AND -> OR fallback. SQLite aborts the statement
+    once the deadline passes (progress handler); returns None in that case.
+    """
+    timed_out = False
+
+    def _past_deadline() -> int:
+        nonlocal timed_out
+        timed_out = time.monotonic() > deadline
+        return 1 if timed_out else 0
+
+    with _connect(db_path) as conn:
+        conn.set_progress_handler(_past_deadline, 1000)
+        try:
+            rows = _run_fts(conn, fts_query, type_filter, type_params, limit)
+            # If AND query matched nothing, retry with OR (broader fallback)
+            if not rows and not timed_out and " AND " in fts_query:
+                fts_or = fts_query.replace(" AND ", " OR ")
+                rows = _run_fts(conn, fts_or, type_filter, type_params, limit)
+        finally:
+            conn.set_progress_handler(None, 0)
+    if timed_out:
+        logger.warning("BM25 leg missed the %.0f ms deadline for %r", _LEG_TIMEOUT * 1000, fts_query)
+        return None
+    return rows
+
+
+def _emoji_leg(
+    db_path: str,
+    tokens: list[str],
+    type_filter: str,
+    type_params: list,
+    limit: int,
+) -> list[tuple[str, str, str]]:
+    """(entity_type, entity_id, title) ranked by distinct query emoji matched, then occurrences."""
+    sql = f"""
+        SELECT entity_type, entity_id, MAX(title) AS title
+        FROM search_emoji
+        WHERE token IN ({",".join("?" * len(tokens))}){type_filter}
+        GROUP BY entity_type, entity_id
+        ORDER BY COUNT(*) DESC, SUM(hits) DESC
+        LIMIT ?
+    """
+    with _connect(db_path) as conn:
+        rows = conn.execute(sql, [*tokens, *type_params, limit]).fetchall()
+    return [(r["entity_type"], r["entity_id"], r["title"]) for r in rows]
+
+
+def _vector_leg(
+    shards: dict[str, Optional[list[str]]],
+    q: str,
+    limit: int,
+    deadline: float | None = None,
+) -> list[list[tuple[str, str, str]]] | None:
+    """
+    Embed q once, then one ranked list per shard (see shard_paths). Returns
+    None once the deadline passes, so a late leg stops holding its worker.
+    """
+    query_embedding = _embed_query(q, deadline)
+    if query_embedding is None:
+        return None if deadline is not None and time.monotonic() > deadline else []
+    legs: list[list[tuple[str, str, str]]] = []
+    for path, entity_types in shards.items():
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        with _connect(path) as conn:
+            legs.append(_vector_search(conn, path, query_embedding, entity_types, limit))
+    return legs
+
+
 def _run_fts(
     conn: sqlite3.Connection,
     fts_query: str,
@@ -0,0 +1,321 @@
+"""
+Snapshot / restore of the search index across ephemeral-disk cold starts.
+
+SEARCH_DB_PATH lives on /tmp, so every new Cloud Run / Railway instance used
+to start with an empty index and re-embed the whole corpus. With
+SEARCH_SNAPSHOT configured, a compact copy of the index (FTS + vectors) is
+written periodically and restored on boot; only rows created, updated or
+deleted since the snapshot's watermark are then re-applied through the
+outbox (the search_changes log adds updates, deletes and late commits).
+
+SEARCH_SNAPSHOT
+  /data/search-snapshot.db   a file on a mounted volume
+  postgres                   a zlib-compressed blob in the search_snapshots table
+SEARCH_SNAPSHOT_INTERVAL     seconds between snapshots (default 600, 0 = only on demand)
+
+With SEARCH_SHARDED each shard file is snapshotted alongside db_path: as
+"<target>.<type>.db" files, or as further search_snapshots rows.
+
+Every uvicorn worker on an instance shares the local index, but only one
+of them restores it and takes snapshots: the first to claim an flock on
+"<db_path>.snapshot.lock", held until that process exits. Start-up is
+serialised on "<db_path>.startup.lock" so the others don't open the index
+before the owner has put the snapshot in place.
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from core.database import DB_PATH, get_pool
+from core.search import (
+    CHANGE_RETENTION, ENTITY_TYPES, index_files, shard_file, shard_path, sync_search_index,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TARGET = os.getenv("SEARCH_SNAPSHOT", "")
+SNAPSHOT_INTERVAL = int(os.getenv("SEARCH_SNAPSHOT_INTERVAL", "600"))
+
+# Bump when the search_fts / search_embeddings layout changes incompatibly
+SNAPSHOT_FORMAT = 1
+# Changes this long before a snapshot are re-applied on restore, to cover
+# events still sitting in the indexing outbox when the snapshot was taken and
+# transactions that started before it (changed_at is their start time)
+_WATERMARK_MARGIN = timedelta(minutes=5)
+
+_CREATE_SNAPSHOT_TABLE = """
+    CREATE TABLE IF NOT EXISTS search_snapshots (
+        id         INTEGER PRIMARY KEY,
+        format     INTEGER NOT NULL,
+        watermark  TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        data       BYTEA NOT NULL
+    )
+"""
+
+_DELTA_SQL = {
+    "prompt": "SELECT id FROM prompts WHERE created_at >= $1",
+    "agent": "SELECT id FROM agents WHERE created_at >= $1",
+    "proposal": "SELECT id FROM proposals WHERE created_at >= $1",
+}
+# Updates and deletes since the watermark, oldest first so the latest op wins
+_CHANGES_SINCE_SQL = """SELECT entity_type, entity_id, op FROM search_changes
+                        WHERE changed_at >= $1 ORDER BY txid, seq"""
+
+
+# ---------------------------------------------------------------------------
+# Building and checking snapshot files (blocking — run in a thread)
+# ---------------------------------------------------------------------------
+
+def _write_snapshot_file(db_path: str, dest: str, watermark: str) -> None:
+    """VACUUM INTO a compact copy, then stamp its format and watermark."""
+    if os.path.exists(dest):
+        os.remove(dest)
+    src = sqlite3.connect(db_path)
+    try:
+        src.execute("VACUUM INTO ?", (dest,))
+    finally:
+        src.close()
+    out = sqlite3.connect(dest)
+    try:
+        out.execute("CREATE TABLE IF NOT EXISTS search_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        out.executemany(
+            "INSERT OR REPLACE INTO search_meta (key, value) VALUES (?, ?)",
+            [("snapshot_format", str(SNAPSHOT_FORMAT)), ("snapshot_watermark", watermark)],
+        )
+        out.commit()
+    finally:
+        out.close()
+
+
+def _read_snapshot_meta(path: str) -> tuple[int, str] | None:
+    """(format, watermark) of a snapshot file, or None if it is unusable."""
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                return None
+            meta = dict(conn.execute("SELECT key, value FROM search_meta").fetchall())
+        finally:
+            conn.close()
+        return int(meta["snapshot_format"]), meta["snapshot_watermark"]
+    except (sqlite3.Error, KeyError, ValueError):
+        return None
+
+
+def _index_is_empty(db_path: str) -> bool:
+    for path in index_files(db_path):
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("SELECT 1 FROM search_fts LIMIT 1").fetchone() is not None:
+                return False
+        except sqlite3.OperationalError:
+            pass  # tables not created yet
+        finally:
+            conn.close()
+    return True
+
+
+def _parts(db_path: str) -> list[tuple[str, str]]:
+    """(part, local file) pairs making up the index: "" for db_path, else the shard's type."""
+    parts = [("", db_path)]
+    parts.extend(
+        (etype, path) for etype in ENTITY_TYPES
+        if (path := shard_path(db_path, etype)) != db_path
+    )
+    return parts
+
+
+def _part_target(target: str, part: str) -> str:
+    return shard_file(target, part) if part else target
+
+
+def _part_row(part: str) -> int:
+    """search_snapshots id of a part (db_path itself keeps id 1)."""
+    return 1 if not part else 2 + ENTITY_TYPES.index(part)
+
+
+def _install(snapshot: str, db_path: str) -> None:
+    """Atomically move a verified snapshot into place, dropping stale WAL files."""
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(snapshot, db_path)
+
+
+# ---------------------------------------------------------------------------
+# Single owner per local index
+# ---------------------------------------------------------------------------
+
+_owner_locks: dict[str, int] = {}  # db_path -> fd of the snapshot lock this process holds
+
+
+def claim_snapshots(db_path: str = DB_PATH) -> bool:
+    """
+    True if this process restores and snapshots db_path's index. The first
+    worker to ask takes the lock and keeps it until it exits; the others
+    get False without waiting, and a worker started after it exits takes over.
+    """
+    if db_path in _owner_locks:
+        return True
+    fd = os.open(db_path + ".snapshot.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _owner_locks[db_path] = fd
+    return True
+
+
+@asynccontextmanager
+async def startup_lock(db_path: str = DB_PATH):
+    """Hold db_path's start-up lock, so one worker at a time claims, restores and opens the index."""
+    fd = os.open(db_path + ".startup.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+async def save_snapshot(db_path: str = DB_PATH, target: str = SNAPSHOT_TARGET) -> dict | None:
+    """Write a snapshot of the live index to target. Returns its metadata."""
+    if not target:
+        return None
+    started = datetime.now(timezone.utc)
+    watermark = (started - _WATERMARK_MARGIN).isoformat()
+
+    tmp_dir = tempfile.mkdtemp(prefix="search-snapshot-")
+    size = 0
+    try:
+        for part, path in _parts(db_path):
+            tmp = os.path.join(tmp_dir, f"snapshot{part}.db")
+            await asyncio.to_thread(_write_snapshot_file, path, tmp, watermark)
+            if target == "postgres":
+                data = await asyncio.to_thread(lambda: zlib.compress(Path(tmp).read_bytes(), 6))
+                pool = await get_pool()
+                async with pool.acquire() as conn:
+                    await conn.execute(_CREATE_SNAPSHOT_TABLE)
+                    await conn.execute(
+                        """INSERT INTO search_snapshots (id, format, watermark, created_at, data)
+                           VALUES ($1, $2, $3, $4, $5)
+                           ON CONFLICT (id) DO UPDATE SET format = excluded.format,
+                               watermark = excluded.watermark, created_at = excluded.created_at,
+                               data = excluded.data""",
+                        _part_row(part), SNAPSHOT_FORMAT, watermark, started.isoformat(), data,
+                    )
+                size += len(data)
+            else:
+                dest = _part_target(target, part)
+                staging = dest + ".tmp"
+                await asyncio.to_thread(shutil.copyfile, tmp, staging)
+                os.replace(staging, dest)
+                size += os.path.getsize(tmp)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    logger.info("Saved search snapshot to %s (%d bytes, watermark %s)", target, size, watermark)
+    return {"target": target, "bytes": size, "watermark": watermark, "format": SNAPSHOT_FORMAT}
+
+
+async def restore_snapshot(db_path: str = DB_PATH, target: str = SNAPSHOT_TARGET) -> str | None:
+    """
+    Restore the latest snapshot into db_path if the local index is empty.
+    Returns the snapshot watermark, or None when nothing was restored.
+    """
+    if not target or not await asyncio.to_thread(_index_is_empty, db_path):
+        return None
+
+    parts = _parts(db_path)
+    staged = [(path + ".restore", path) for _, path in parts]
+    if target == "postgres":
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(_CREATE_SNAPSHOT_TABLE)
+            rows = {
+                r["id"]: r for r in await conn.fetch(
+                    "SELECT id, format, data FROM search_snapshots WHERE id = ANY($1::int[])",
+                    [_part_row(part) for part, _ in parts],
+                )
+            }
+        found = [rows.get(_part_row(part)) for part, _ in parts]
+        if any(r is None or r["format"] != SNAPSHOT_FORMAT for r in found):
+            return None
+        for (tmp, _), row in zip(staged, found):
+            data = row["data"]
+            await asyncio.to_thread(Path(tmp).write_bytes, zlib.decompress(data))
+    else:
+        sources = [_part_target(target, part) for part, _ in parts]
+        if not all(os.path.exists(src) for src in sources):
+            return None
+        for (tmp, _), src in zip(staged, sources):
+            await asyncio.to_thread(shutil.copyfile, src, tmp)
+
+    metas = [await asyncio.to_thread(_read_snapshot_meta, tmp) for tmp, _ in staged]
+    if any(meta is None or meta[0] != SNAPSHOT_FORMAT for meta in metas):
+        logger.warning("Ignoring incompatible or corrupt search snapshot at %s", target)
+        for tmp, _ in staged:
+            os.remove(tmp)
+        return None
+    for tmp, path in staged:
+        await asyncio.to_thread(_install, tmp, path)
+    watermark = min(meta[1] for meta in metas)  # parts are written moments apart
+    logger.info("Restored search index from %s (watermark %s)", target, watermark)
+    return watermark
+
+
+async def apply_delta(watermark: str, db_path: str = DB_PATH) -> int:
+    """
+    Re-apply every source row created, updated or deleted at or after
+    watermark. Returns the count queued. A watermark older than the change
+    log's retention can't be replayed; the index is rebuilt from Postgres.
+    """
+    from core.indexer import drain, enqueue
+
+    since = datetime.fromisoformat(watermark)
+    if since < datetime.now(timezone.utc) - CHANGE_RETENTION:
+        logger.warning("Watermark %s is older than the search change log; rebuilding", watermark)
+        return await sync_search_index(db_path, incremental=False)
+
+    pool = await get_pool()
+    ops: dict[tuple[str, str], str] = {}
+    async with pool.acquire() as conn:
+        for etype, sql in _DELTA_SQL.items():
+            for row in await conn.fetch(sql, watermark):
+                ops[(etype, row["id"])] = "upsert"
+        # Inserts are logged too; the log has the final say per entity
+        for row in await conn.fetch(_CHANGES_SINCE_SQL, since):
+            ops[(row["entity_type"], row["entity_id"])] = row["op"]
+    for (etype, eid), op in ops.items():
+        enqueue(etype, eid, op)
+    await drain(db_path)
+    return len(ops)
+
+
+async def run_snapshots(interval: int = SNAPSHOT_INTERVAL) -> None:
+    """Background loop: snapshot the index every interval seconds. Cancel to stop."""
+    if not SNAPSHOT_TARGET or interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await save_snapshot()
+        except Exception:
+            logger.exception("Search snapshot failed")
@@ -0,0 +1,200 @@
+"""
+Typeahead suggestions for the search box.
+
+A sorted array of normalised keys searched with bisect: every prompt title
+and agent name is indexed at the start of each of its words (so "nig"
+finds "Pizza night"), plus queries that /api/search has answered often
+enough to be worth suggesting. Kept current by search index events
+(core/search.py add_index_listener); answering never touches SQLite or
+the encoder once an index is loaded.
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import sqlite3
+import threading
+
+from core.database import DB_PATH
+from core.search import _connect, _normalise_query, add_index_listener, shard_paths
+
+SUGGEST_MIN_COUNT = int(os.getenv("SEARCH_SUGGEST_MIN_COUNT", "2"))
+SUGGEST_MAX_QUERIES = int(os.getenv("SEARCH_SUGGEST_MAX_QUERIES", "5000"))
+
+_SUGGEST_TYPES = ("prompt", "agent")
+_MAX_WORDS = 8      # word-start keys per title
+_SCAN_LIMIT = 256   # prefix matches examined per request before ranking
+
+
+class _PrefixIndex:
+    """Sorted (key, kind, id) tuples plus the display text and keys per entry."""
+
+    __slots__ = ("_keys", "_docs")
+
+    def __init__(self):
+        self._keys: list[tuple[str, str, str]] = []
+        self._docs: dict[tuple[str, str], tuple[str, list[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _word_keys(text: str) -> list[str]:
+        words = _normalise_query(text).split()[:_MAX_WORDS]
+        return list(dict.fromkeys(" ".join(words[i:]) for i in range(len(words))))
+
+    def add(self, kind: str, ident: str, text: str) -> None:
+        self.remove(kind, ident)
+        keys = self._word_keys(text)
+        if not keys:
+            return
+        for key in keys:
+            bisect.insort(self._keys, (key, kind, ident))
+        self._docs[(kind, ident)] = (text, keys)
+
+    def remove(self, kind: str, ident: str) -> None:
+        doc = self._docs.pop((kind, ident), None)
+        if doc is None:
+            return
+        for key in doc[1]:
+            i = bisect.bisect_left(self._keys, (key, kind, ident))
+            if i < len(self._keys) and self._keys[i] == (key, kind, ident):
+                del self._keys[i]
+
+    def bulk_load(self, entries: list[tuple[str, str, str]]) -> None:
+        """Replace the contents with (kind, id, text) entries, sorting once."""
+        self._keys, self._docs = [], {}
+        for kind, ident, text in entries:
+            keys = self._word_keys(text)
+            if keys:
+                self._docs[(kind, ident)] = (text, keys)
+                self._keys.extend((key, kind, ident) for key in keys)
+        self._keys.sort()
+
+    def matches(self, prefix: str):
+        """(kind, id, text, starts_phrase) for keys beginning with prefix, in key order."""
+        i = bisect.bisect_left(self._keys, (prefix,))
+        for key, kind, ident in self._keys[i:i + _SCAN_LIMIT]:
+            if not key.startswith(prefix):
+                break
+            text, keys = self._docs[(kind, ident)]
+            yield kind, ident, text, key == keys[0]
+
+
+_lock = threading.Lock()
+_indexes: dict[str, _PrefixIndex] = {}   # entity titles per search DB
+_queries = _PrefixIndex()                 # popular queries (process-wide)
+_query_counts: dict[str, int] = {}
+
+
+def _load(db_path: str) -> _PrefixIndex:
+    index = _PrefixIndex()
+    marks = ",".join("?" * len(_SUGGEST_TYPES))
+    rows = []
+    for path in shard_paths(db_path, list(_SUGGEST_TYPES)):
+        try:
+            with _connect(path) as conn:
+                rows.extend(conn.execute(
+                    f"SELECT entity_type, entity_id, title FROM search_fts WHERE entity_type IN ({marks})",
+                    _SUGGEST_TYPES,
+                ).fetchall())
+        except sqlite3.OperationalError:
+            pass  # index tables not created yet
+    index.bulk_load([(r["entity_type"], r["entity_id"], r["title"]) for r in rows])
+    return index
+
+
+def is_loaded(db_path: str = DB_PATH) -> bool:
+    return db_path in _indexes
+
+
+def warm(db_path: str = DB_PATH) -> None:
+    """Build the entity index for db_path now instead of on the first request."""
+    index = _load(db_path)
+    with _lock:
+        _indexes.setdefault(db_path, index)
+
+
+def _on_index_event(db_path: str, upserts: list | None, deletes: list) -> None:
+    with _lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            return  # not loaded yet — built from SQLite on first use
+        if upserts is None:
+            del _indexes[db_path]
+            return
+        for etype, eid, title in upserts:
+            if etype in _SUGGEST_TYPES:
+                index.add(etype, eid, title)
+        for etype, eid in deletes:
+            index.remove(etype, eid)
+
+
+add_index_listener(_on_index_event)
+
+
+def record_query(q: str) -> None:
+    """Count a query that returned results; frequent ones become suggestions."""
+    key = _normalise_query(q)
+    if not key:
+        return
+    with _lock:
+        count = _query_counts.get(key, 0) + 1
+        _query_counts[key] = count
+        if count == SUGGEST_MIN_COUNT:
+            _queries.add("query", key, key)
+        if len(_query_counts) > SUGGEST_MAX_QUERIES * 2:
+            # Keep the most frequent half; rare one-off queries age out
+            keep = sorted(_query_counts.items(), key=lambda kv: -kv[1])[:SUGGEST_MAX_QUERIES]
+            dropped = set(_query_counts) - {k for k, _ in keep}
+            for k in dropped:
+                _queries.remove("query", k)
+            _query_counts.clear()
+            _query_counts.update(keep)
+
+
+def suggest(prefix: str, limit: int = 8, db_path: str = DB_PATH) -> list[dict]:
+    """
+    Up to `limit` completions for prefix: popular queries first (by count),
+    then titles whose first word matches, then titles matching a later word.
+    """
+    key = _normalise_query(prefix)
+    if not key:
+        return []
+    if db_path not in _indexes:
+        warm(db_path)
+
+    with _lock:
+        candidates = [
+            (-_query_counts.get(ident, 0), 0, len(text), kind, ident, text)
+            for kind, ident, text, _ in _queries.matches(key)
+        ]
+        index = _indexes.get(db_path)
+        if index is not None:
+            candidates.extend(
+                (0, 0 if starts else 1, len(text), kind, ident, text)
+                for kind, ident, text, starts in index.matches(key)
+            )
+    candidates.sort()
+
+    out: list[dict] = []
+    seen: set[str] = set()
+    for _, _, _, kind, ident, text in candidates:
+        norm = _normalise_query(text)
+        if norm in seen:
+            continue
+        seen.add(norm)
+        item = {"text": text, "type": kind}
+        if kind != "query":
+            item["entity_id"] = ident
+        out.append(item)
+        if len(out) >= limit:
+            break
+    return out
+
+
+def clear_suggestions() -> None:
+    with _lock:
+        _indexes.clear()
+        _queries.bulk_load([])
+        _query_counts.clear()
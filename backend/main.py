@@ -9,7 +9,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from core.database import init_db, get_db
+from core.database import init_db, get_db, close_pool
 from routers import agents, prompts, proposals, votes, emoji_chat, leaderboard, search, protocol, telegram, admin
 
 _FRONTEND_DIST = Path(__file__).resolve().parent / "frontend_dist"
@@ -18,17 +18,39 @@ _FRONTEND_DIST = Path(__file__).resolve().parent / "frontend_dist"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    from core.indexer import drain, run_indexer
+    from core.search_snapshot import claim_snapshots, run_snapshots
+    from core.counters import run_reconciler
+    indexer_task = asyncio.create_task(run_indexer())
+    # Only the worker that owns the local index snapshots it
+    snapshot_task = asyncio.create_task(run_snapshots()) if claim_snapshots() else None
+    reconcile_task = asyncio.create_task(run_reconciler())
     polling_task = None
     if os.getenv("TELEGRAM_POLLING", "").strip().lower() in ("1", "true", "yes"):
         from routers.telegram import start_polling
         polling_task = asyncio.create_task(start_polling())
     yield
+    from core.reindex import stop_reindex
+    await stop_reindex()  # an admin-started reindex; resumes from its checkpoint next time
     if polling_task:
         polling_task.cancel()
         try:
             await polling_task
         except asyncio.CancelledError:
             pass
+    for task in (reconcile_task, snapshot_task, indexer_task):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    try:
+        await drain()  # flush events queued since the last coalesce window
+    except Exception:
+        pass
+    await close_pool()
 
 
 app = FastAPI(
@@ -85,13 +107,27 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/health/db")
+async def health_db():
+    """Round-trip the database through the pool; 503 if it is unreachable or exhausted."""
+    from core.database import _acquire, get_pool, pool_stats
+    try:
+        pool = await get_pool()
+        async with _acquire(pool) as conn:
+            await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=5)
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {type(exc).__name__}")
+    return {"status": "healthy", "pool": pool_stats()}
+
+
 @app.get("/api/debug/votes")
 async def debug_votes(limit: int = 20, db=Depends(get_db)):
     """Debug: return recent votes (verify votes are persisted). No proposal_id needed."""
     cur = await db.execute(
-        """SELECT v.proposal_id, v.user_fingerprint, v.value, v.created_at,
-                  COALESCE((SELECT SUM(value) FROM votes WHERE proposal_id = v.proposal_id), 0) AS net_votes
-           FROM votes v ORDER BY v.created_at DESC LIMIT ?""",
+        """SELECT v.proposal_id, v.user_fingerprint, v.value, v.created_at, pr.net_votes
+           FROM votes v
+           JOIN proposals pr ON pr.id = v.proposal_id
+           ORDER BY v.created_at DESC LIMIT ?""",
         (limit,),
     )
     rows = await cur.fetchall()
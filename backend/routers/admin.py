@@ -61,11 +61,8 @@ async def admin_logout(token: str = Depends(_require_admin)):
 async def list_prompts(token: str = Depends(_require_admin), db=Depends(get_db)):
     cursor = await db.execute(
         """
-        SELECT p.id, p.title, p.context_text, p.status, p.created_at,
-               COUNT(pr.id) AS proposal_count
+        SELECT p.id, p.title, p.context_text, p.status, p.created_at, p.proposal_count
         FROM prompts p
-        LEFT JOIN proposals pr ON pr.prompt_id = p.id
-        GROUP BY p.id
         ORDER BY p.created_at DESC
         """
     )
@@ -85,12 +82,8 @@ async def open_prompt(
     await db.execute("UPDATE prompts SET status = 'open' WHERE id = ?", (prompt_id,))
     await db.commit()
     cursor2 = await db.execute(
-        """SELECT p.id, p.title, p.context_text, p.status, p.created_at,
-                  COUNT(pr.id) AS proposal_count
-           FROM prompts p
-           LEFT JOIN proposals pr ON pr.prompt_id = p.id
-           WHERE p.id = ?
-           GROUP BY p.id""",
+        """SELECT id, title, context_text, status, created_at, proposal_count
+           FROM prompts WHERE id = ?""",
         (prompt_id,),
     )
     return dict(await cursor2.fetchone())
@@ -108,12 +101,53 @@ async def close_prompt(
     await db.execute("UPDATE prompts SET status = 'closed' WHERE id = ?", (prompt_id,))
     await db.commit()
     cursor2 = await db.execute(
-        """SELECT p.id, p.title, p.context_text, p.status, p.created_at,
-                  COUNT(pr.id) AS proposal_count
-           FROM prompts p
-           LEFT JOIN proposals pr ON pr.prompt_id = p.id
-           WHERE p.id = ?
-           GROUP BY p.id""",
+        """SELECT id, title, context_text, status, created_at, proposal_count
+           FROM prompts WHERE id = ?""",
         (prompt_id,),
     )
     return dict(await cursor2.fetchone())
+
+
+@router.get("/search/stats")
+async def search_stats(token: str = Depends(_require_admin)):
+    from core.search import search_cache_stats, search_pool_stats
+    return {"connections": search_pool_stats(), "caches": search_cache_stats()}
+
+
+@router.get("/db/stats")
+async def db_stats(token: str = Depends(_require_admin)):
+    from core.database import pool_stats, statement_stats
+    return {"statements": statement_stats(), "pool": pool_stats()}
+
+
+@router.post("/db/reconcile-votes")
+async def reconcile_votes(token: str = Depends(_require_admin)):
+    """Recompute the denormalized vote counters now; returns how many rows were wrong."""
+    from core.counters import reconcile
+    from core.database import get_pool
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await reconcile(conn)
+
+
+@router.post("/search/snapshot")
+async def search_snapshot(token: str = Depends(_require_admin)):
+    from core.search_snapshot import save_snapshot
+    result = await save_snapshot()
+    if result is None:
+        raise HTTPException(status_code=400, detail="SEARCH_SNAPSHOT is not configured")
+    return result
+
+
+@router.post("/search/reindex", status_code=202)
+async def search_reindex(resume: bool = True, token: str = Depends(_require_admin)):
+    from core.reindex import reindex_progress, start_reindex
+    if not start_reindex(resume=resume):
+        raise HTTPException(status_code=409, detail="A reindex is already running")
+    return reindex_progress()
+
+
+@router.get("/search/reindex")
+async def search_reindex_progress(token: str = Depends(_require_admin)):
+    from core.reindex import reindex_progress
+    return reindex_progress()
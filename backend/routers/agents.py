@@ -54,12 +54,8 @@ async def register_agent(body: AgentRegisterRequest, db=Depends(get_db)):
             raise HTTPException(status_code=409, detail="Agent name already taken.")
         raise
 
-    import asyncio
-    from core.search import sync_search_index
-    try:
-        await asyncio.to_thread(sync_search_index)
-    except Exception:
-        pass
+    from core.indexer import enqueue
+    enqueue("agent", agent_id)
 
     return AgentRegisterResponse(
         id=agent_id,
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 from fastapi import Header, HTTPException, Depends
-from core.database import get_db
+from core.database import get_db, hot_statement
+
+_AGENT_BY_KEY = hot_statement("SELECT id, name FROM agents WHERE api_key = ?")
 
 
 def _extract_api_key(x_api_key: str = Header(default=None), authorization: str = Header(default=None)) -> str | None:
@@ -22,9 +24,7 @@ async def require_agent(
     api_key = _extract_api_key(x_api_key, authorization)
     if not api_key:
         raise HTTPException(status_code=401, detail="Missing API key. Use X-API-Key or Authorization: Bearer.")
-    cursor = await db.execute(
-        "SELECT id, name FROM agents WHERE api_key = ?", (api_key,)
-    )
+    cursor = await db.execute(_AGENT_BY_KEY, (api_key,))
     row = await cursor.fetchone()
     if not row:
         raise HTTPException(status_code=401, detail="Invalid API key.")
@@ -40,8 +40,6 @@ async def optional_agent(
     api_key = _extract_api_key(x_api_key, authorization)
     if not api_key:
         return None
-    cursor = await db.execute(
-        "SELECT id, name FROM agents WHERE api_key = ?", (api_key,)
-    )
+    cursor = await db.execute(_AGENT_BY_KEY, (api_key,))
     row = await cursor.fetchone()
     return {"id": row["id"], "name": row["name"]} if row else None
@@ -11,21 +11,16 @@ async def get_leaderboard(db=Depends(get_db)):
     Ranks agents by total upvote score across all proposals.
     A "win" = proposal with the highest net votes in its prompt (among all proposals).
     """
-    # Total score per agent
+    # Total score per agent (net_votes is maintained on write)
     cursor = await db.execute(
         """
         SELECT
             a.id AS agent_id,
             a.name AS agent_name,
-            COUNT(DISTINCT pr.id) AS proposals,
-            COALESCE(SUM(COALESCE(v_sum.net, 0)), 0) AS total_score
+            COUNT(pr.id) AS proposals,
+            COALESCE(SUM(pr.net_votes), 0) AS total_score
         FROM agents a
         LEFT JOIN proposals pr ON pr.agent_id = a.id
-        LEFT JOIN (
-            SELECT proposal_id, SUM(value) AS net
-            FROM votes
-            GROUP BY proposal_id
-        ) v_sum ON v_sum.proposal_id = pr.id
         GROUP BY a.id
         ORDER BY total_score DESC, proposals DESC
         """
@@ -38,22 +33,12 @@ async def get_leaderboard(db=Depends(get_db)):
         SELECT pr.agent_id, COUNT(*) AS wins
         FROM proposals pr
         JOIN (
-            SELECT prompt_id, MAX(COALESCE(v_sum.net, 0)) AS max_votes
-            FROM proposals pr2
-            LEFT JOIN (
-                SELECT proposal_id, SUM(value) AS net
-                FROM votes
-                GROUP BY proposal_id
-            ) v_sum ON v_sum.proposal_id = pr2.id
+            SELECT prompt_id, MAX(net_votes) AS max_votes
+            FROM proposals
             GROUP BY prompt_id
-            HAVING MAX(COALESCE(v_sum.net, 0)) > 0
+            HAVING MAX(net_votes) > 0
         ) winners ON winners.prompt_id = pr.prompt_id
-        LEFT JOIN (
-            SELECT proposal_id, SUM(value) AS net
-            FROM votes
-            GROUP BY proposal_id
-        ) v_sum2 ON v_sum2.proposal_id = pr.id
-        WHERE COALESCE(v_sum2.net, 0) = winners.max_votes
+        WHERE pr.net_votes = winners.max_votes
         GROUP BY pr.agent_id
         """
     )
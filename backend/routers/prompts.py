@@ -3,7 +3,9 @@ from datetime import datetime, timezone
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from core.database import get_db
-from core.models import PromptCreateRequest, PromptResponse, PromptDetailResponse, ProposalInPrompt
+from core.models import (
+    PromptCreateRequest, PromptResponse, PromptDetailResponse, ProposalInPrompt, RelatedPromptResponse,
+)
 from routers.auth import optional_agent
 
 router = APIRouter(prefix="/api/prompts", tags=["prompts"])
@@ -34,22 +36,18 @@ async def list_prompts(
 
     # new: newest first; hot: most votes + proposals, then recent; trending: most votes first
     # all: open rounds first, then closed, each sorted by newest
+    # total_votes and proposal_count are maintained on write, so these orders use indexes
     order = {
         "new": "p.created_at DESC",
-        "hot": "total_votes DESC, proposal_count DESC, p.created_at DESC",
-        "trending": "total_votes DESC, p.created_at DESC",
+        "hot": "p.total_votes DESC, p.proposal_count DESC, p.created_at DESC",
+        "trending": "p.total_votes DESC, p.created_at DESC",
         "all": "CASE WHEN p.status = 'open' THEN 0 ELSE 1 END, p.created_at DESC",
     }.get(sort, "p.created_at DESC")
 
     query = f"""
-        SELECT p.*,
-               COUNT(pr.id) AS proposal_count,
-               COALESCE(SUM(v.value), 0) AS total_votes
+        SELECT p.*
         FROM prompts p
-        LEFT JOIN proposals pr ON pr.prompt_id = p.id
-        LEFT JOIN votes v ON v.proposal_id = pr.id
         {where}
-        GROUP BY p.id
         ORDER BY {order}
         LIMIT 50
     """
@@ -77,16 +75,13 @@ async def create_prompt(
     await db.commit()
 
     import asyncio
-    from core.search import sync_search_index
+    from core.indexer import enqueue
     from core.house_agents import submit_house_proposals
-    try:
-        await asyncio.to_thread(sync_search_index)
-    except Exception:
-        pass
+    enqueue("prompt", prompt_id)
     asyncio.create_task(submit_house_proposals(prompt_id, body.context_text, body.title))
 
     cursor = await db.execute(
-        "SELECT *, 0 AS proposal_count FROM prompts WHERE id = ?", (prompt_id,)
+        "SELECT * FROM prompts WHERE id = ?", (prompt_id,)
     )
     row = await cursor.fetchone()
     return _fmt(row)
@@ -94,28 +89,18 @@ async def create_prompt(
 
 @router.get("/{prompt_id}", response_model=PromptDetailResponse)
 async def get_prompt(prompt_id: str, db=Depends(get_db)):
-    cursor = await db.execute(
-        """SELECT p.*, COUNT(pr.id) AS proposal_count
-           FROM prompts p
-           LEFT JOIN proposals pr ON pr.prompt_id = p.id
-           WHERE p.id = ?
-           GROUP BY p.id""",
-        (prompt_id,),
-    )
+    cursor = await db.execute("SELECT * FROM prompts WHERE id = ?", (prompt_id,))
     row = await cursor.fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Prompt not found.")
 
     # fetch proposals with net votes
     cursor2 = await db.execute(
-        """SELECT pr.*, a.name AS agent_name,
-                  COALESCE(SUM(v.value), 0) AS votes
+        """SELECT pr.*, a.name AS agent_name, pr.net_votes AS votes
            FROM proposals pr
            JOIN agents a ON a.id = pr.agent_id
-           LEFT JOIN votes v ON v.proposal_id = pr.id
            WHERE pr.prompt_id = ?
-           GROUP BY pr.id, a.name
-           ORDER BY votes DESC, pr.created_at ASC""",
+           ORDER BY pr.net_votes DESC, pr.created_at ASC""",
         (prompt_id,),
     )
     proposal_rows = await cursor2.fetchall()
@@ -137,6 +122,41 @@ async def get_prompt(prompt_id: str, db=Depends(get_db)):
     return PromptDetailResponse(**base.model_dump(), proposals=proposals)
 
 
+@router.get("/{prompt_id}/related", response_model=list[RelatedPromptResponse])
+async def related_prompts(
+    prompt_id: str,
+    limit: int = Query(default=10, ge=1, le=50),
+    status: Optional[str] = Query(default=None, description="Only rounds with this status, e.g. open"),
+    db=Depends(get_db),
+):
+    """Rounds most similar to this one, from its stored embedding (no encoder call)."""
+    cursor = await db.execute("SELECT id FROM prompts WHERE id = ?", (prompt_id,))
+    if not await cursor.fetchone():
+        raise HTTPException(status_code=404, detail="Prompt not found.")
+
+    import asyncio
+    from core.search import related
+    # Over-fetch when filtering: status lives in the DB, not in the index
+    fetch = limit * 4 if status else limit
+    neighbours = await asyncio.to_thread(related, "prompt", prompt_id, fetch)
+    if not neighbours:
+        return []
+
+    ids = [eid for eid, _ in neighbours]
+    placeholders = ",".join("?" * len(ids))
+    where = f"WHERE p.id IN ({placeholders})" + (" AND p.status = ?" if status else "")
+    cursor = await db.execute(
+        f"SELECT p.* FROM prompts p {where}",
+        (*ids, status) if status else tuple(ids),
+    )
+    rows = {r["id"]: r for r in await cursor.fetchall()}
+    return [
+        RelatedPromptResponse(**_fmt(rows[eid]).model_dump(), similarity=sim)
+        for eid, sim in neighbours
+        if eid in rows
+    ][:limit]
+
+
 @router.patch("/{prompt_id}/close", response_model=PromptResponse)
 async def close_prompt(prompt_id: str, db=Depends(get_db)):
     cursor = await db.execute("SELECT id FROM prompts WHERE id = ?", (prompt_id,))
@@ -146,13 +166,6 @@ async def close_prompt(prompt_id: str, db=Depends(get_db)):
     await db.execute("UPDATE prompts SET status = 'closed' WHERE id = ?", (prompt_id,))
     await db.commit()
 
-    cursor2 = await db.execute(
-        """SELECT p.*, COUNT(pr.id) AS proposal_count
-           FROM prompts p
-           LEFT JOIN proposals pr ON pr.prompt_id = p.id
-           WHERE p.id = ?
-           GROUP BY p.id""",
-        (prompt_id,),
-    )
+    cursor2 = await db.execute("SELECT * FROM prompts WHERE id = ?", (prompt_id,))
     updated = await cursor2.fetchone()
     return _fmt(updated)
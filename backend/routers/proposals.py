@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
-from core.database import get_db
+from core.database import INSERT_PROPOSAL, get_db
 from core.models import ProposalCreateRequest, ProposalResponse
 from routers.auth import require_agent
 
@@ -29,19 +29,14 @@ async def submit_proposal(
     now = datetime.now(timezone.utc).isoformat()
 
     await db.execute(
-        """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
-           VALUES (?, ?, ?, ?, ?, ?)""",
+        INSERT_PROPOSAL,
         (proposal_id, prompt_id, agent["id"], body.emoji_string.strip(),
          body.rationale, now),
     )
     await db.commit()
 
-    import asyncio
-    from core.search import sync_search_index
-    try:
-        await asyncio.to_thread(sync_search_index)
-    except Exception:
-        pass
+    from core.indexer import enqueue
+    enqueue("proposal", proposal_id)
 
     return ProposalResponse(
         id=proposal_id,
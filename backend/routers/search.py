@@ -3,6 +3,7 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, Query
 
+from core import suggest as suggest_index
 from core.database import get_db
 from core.search import hybrid_search
 
@@ -11,11 +12,11 @@ router = APIRouter(prefix="/api/search", tags=["search"])
 # Intent keywords that map to a sort order rather than text content.
 # When the query matches one of these we return prompts sorted accordingly.
 _INTENT_SORT: dict[str, str] = {
-    "trending": "total_votes DESC, p.created_at DESC",
-    "trend":    "total_votes DESC, p.created_at DESC",
-    "hot":      "total_votes DESC, proposal_count DESC, p.created_at DESC",
-    "popular":  "total_votes DESC, proposal_count DESC, p.created_at DESC",
-    "top":      "total_votes DESC, p.created_at DESC",
+    "trending": "p.total_votes DESC, p.created_at DESC",
+    "trend":    "p.total_votes DESC, p.created_at DESC",
+    "hot":      "p.total_votes DESC, p.proposal_count DESC, p.created_at DESC",
+    "popular":  "p.total_votes DESC, p.proposal_count DESC, p.created_at DESC",
+    "top":      "p.total_votes DESC, p.created_at DESC",
     "new":      "p.created_at DESC",
     "newest":   "p.created_at DESC",
     "latest":   "p.created_at DESC",
@@ -27,13 +28,8 @@ async def _intent_results(order: str, limit: int, db) -> list[dict]:
     """Return prompts sorted by the given order clause as search results."""
     cursor = await db.execute(
         f"""
-        SELECT p.id, p.title, p.context_text,
-               COUNT(pr.id) AS proposal_count,
-               COALESCE(SUM(v.value), 0) AS total_votes
+        SELECT p.id, p.title, p.context_text
         FROM prompts p
-        LEFT JOIN proposals pr ON pr.prompt_id = p.id
-        LEFT JOIN votes v ON v.proposal_id = pr.id
-        GROUP BY p.id
         ORDER BY {order}
         LIMIT ?
         """,
@@ -52,6 +48,20 @@ async def _intent_results(order: str, limit: int, db) -> list[dict]:
     ]
 
 
+@router.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(default=8, ge=1, le=20),
+):
+    """
+    Typeahead completions for partial input: popular queries, round titles
+    and agent names. Served from memory — no embedding, no FTS query.
+    """
+    if not suggest_index.is_loaded():
+        await asyncio.to_thread(suggest_index.warm)
+    return {"query": q, "suggestions": suggest_index.suggest(q, limit)}
+
+
 @router.get("")
 async def search(
     q: str = Query(..., min_length=1),
@@ -79,6 +89,8 @@ async def search(
         return {"query": q, "results": results}
 
     results = await asyncio.to_thread(hybrid_search, q, limit, entity_types)
+    if results:
+        suggest_index.record_query(q)
 
     # Enrich proposals with prompt_id for linking
     proposal_ids = [r["entity_id"] for r in results if r["entity_type"] == "proposal"]
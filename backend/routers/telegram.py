@@ -32,6 +32,20 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 APP_URL = os.getenv("APP_URL", os.getenv("VITE_API_URL", "http://localhost:8000"))
 
 
+# The prompt (already counting its one proposal) and the proposal in one
+# atomic statement, so a failure can't leave a round with no answer.
+_INSERT_PROMPT_WITH_PROPOSAL = """
+    WITH new_prompt AS (
+        INSERT INTO prompts (id, created_by, title, context_text, media_type, media_url, status,
+                             proposal_count, created_at)
+        VALUES ($1, $2, $3, $4, 'text', NULL, 'open', 1, $5)
+        RETURNING id
+    )
+    INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
+    SELECT $6, id, $2, $7, $8, $5 FROM new_prompt
+"""
+
+
 async def _get_or_create_telegram_agent():
     """Get or create the MojifyBot agent used for Telegram-submitted proposals."""
     pool = await get_pool()
@@ -48,6 +62,8 @@ async def _get_or_create_telegram_agent():
                VALUES ($1, $2, $3, NULL, 'claimed', $4)""",
             agent_id, "MojifyBot", api_key, now,
         )
+        from core.indexer import enqueue
+        enqueue("agent", agent_id)
         return agent_id, api_key
 
 
@@ -55,29 +71,21 @@ async def _create_prompt_and_proposal(context: str, emoji_string: str, rationale
     """Create a prompt on Mojify and submit a proposal. Returns prompt_id."""
     agent_id, api_key = await _get_or_create_telegram_agent()
     prompt_id = str(uuid.uuid4())
+    proposal_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
-            """INSERT INTO prompts (id, created_by, title, context_text, media_type, media_url, status, created_at)
-               VALUES ($1, $2, $3, $4, 'text', NULL, 'open', $5)""",
+            _INSERT_PROMPT_WITH_PROPOSAL,
             prompt_id, agent_id, "Telegram: conversation snippet", context[:5000], now,
-        )
-        proposal_id = str(uuid.uuid4())
-        await conn.execute(
-            """INSERT INTO proposals (id, prompt_id, agent_id, emoji_string, rationale, created_at)
-               VALUES ($1, $2, $3, $4, $5, $6)""",
-            proposal_id, prompt_id, agent_id, emoji_string, rationale, now,
+            proposal_id, emoji_string, rationale,
         )
 
-    # Sync search index
-    import asyncio
-    from core.search import sync_search_index
-    try:
-        await asyncio.to_thread(sync_search_index)
-    except Exception:
-        pass
+    # Queue both rows for the search indexer
+    from core.indexer import enqueue
+    enqueue("prompt", prompt_id)
+    enqueue("proposal", proposal_id)
 
     return prompt_id
 
@@ -1,36 +1,54 @@
 import uuid
 from datetime import datetime, timezone
+
+import asyncpg
 from fastapi import APIRouter, Depends, HTTPException
-from core.database import get_db
+from core.database import get_db, hot_statement
 from core.models import VoteRequest, VoteResponse
 
 router = APIRouter(prefix="/api/proposals", tags=["votes"])
 
+# Upsert the vote and apply its delta to proposals.net_votes and
+# prompts.total_votes in one statement, returning the new tally. Repeating
+# the same vote changes nothing (the DO UPDATE's WHERE skips it, delta 0);
+# values are ±1, so an updated row is a flip worth twice its new value.
+# The counter rows are updated only when the vote changed.
+_CAST_VOTE = hot_statement(
+    """WITH cast_vote AS (
+           INSERT INTO votes (id, proposal_id, user_fingerprint, value, created_at)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(proposal_id, user_fingerprint)
+           DO UPDATE SET value = excluded.value, created_at = excluded.created_at
+           WHERE votes.value <> excluded.value
+           RETURNING CASE WHEN xmax = 0 THEN value ELSE 2 * value END AS delta
+       ), counted AS (
+           UPDATE proposals SET net_votes = net_votes + (SELECT delta FROM cast_vote)
+           WHERE id = ? AND EXISTS (SELECT 1 FROM cast_vote)
+           RETURNING prompt_id, net_votes
+       ), totalled AS (
+           UPDATE prompts SET total_votes = total_votes + (SELECT delta FROM cast_vote)
+           WHERE id = (SELECT prompt_id FROM counted)
+       )
+       SELECT COALESCE(
+           (SELECT net_votes FROM counted),
+           (SELECT net_votes FROM proposals WHERE id = ?)
+       ) AS net"""
+)
+
 
 @router.post("/{proposal_id}/vote", response_model=VoteResponse)
 async def vote(proposal_id: str, body: VoteRequest, db=Depends(get_db)):
-    cursor = await db.execute(
-        "SELECT id FROM proposals WHERE id = ?", (proposal_id,)
-    )
-    if not await cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Proposal not found.")
-
     vote_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
 
-    # Upsert: update if already voted, otherwise insert
-    await db.execute(
-        """INSERT INTO votes (id, proposal_id, user_fingerprint, value, created_at)
-           VALUES (?, ?, ?, ?, ?)
-           ON CONFLICT(proposal_id, user_fingerprint)
-           DO UPDATE SET value = excluded.value, created_at = excluded.created_at""",
-        (vote_id, proposal_id, body.user_fingerprint, body.value, now),
-    )
+    try:
+        cursor = await db.execute(
+            _CAST_VOTE,
+            (vote_id, proposal_id, body.user_fingerprint, body.value, now, proposal_id, proposal_id),
+        )
+    except asyncpg.ForeignKeyViolationError:
+        raise HTTPException(status_code=404, detail="Proposal not found.")
     await db.commit()
 
-    cursor2 = await db.execute(
-        "SELECT COALESCE(SUM(value), 0) AS net FROM votes WHERE proposal_id = ?",
-        (proposal_id,),
-    )
-    row = await cursor2.fetchone()
+    row = await cursor.fetchone()
     return VoteResponse(proposal_id=proposal_id, net_votes=row["net"])
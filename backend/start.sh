@@ -3,6 +3,8 @@
 # If LITESTREAM_GCS_BUCKET is set:
 #   1. Restore the SQLite DB from GCS (so data survives container restarts)
 #   2. Start Litestream replication in the background (continuous WAL streaming)
+# If SEARCH_EMBED_SOCKET is set, one embedding server process owns the model
+# and every uvicorn worker talks to it over that Unix socket.
 # Then start the FastAPI app.
 
 set -e
@@ -16,4 +18,9 @@ else
   echo "[warning] LITESTREAM_GCS_BUCKET not set — data will NOT persist across restarts"
 fi
 
+if [ -n "$SEARCH_EMBED_SOCKET" ]; then
+  echo "[search] Starting shared embedding server on $SEARCH_EMBED_SOCKET ..."
+  python -m core.embed_server &
+fi
+
 exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-8080}"
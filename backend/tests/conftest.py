@@ -1,9 +1,17 @@
 """
 Pytest configuration and fixtures for backend tests.
 Uses a temporary database file; clears tables after tests that insert data.
+Also home to the shared test doubles (FakeConnection, FakePool,
+SourceTables, FakeEncoder) and the `pg` fixture for tests marked db.
 """
 import asyncio
+import hashlib
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 
+import asyncpg
 import pytest
 
 from tests.test_utils import TEST_DB_PATH, clear_db, run_async
@@ -50,3 +58,275 @@ def client():
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
+
+
+# ── asyncpg doubles (no Postgres needed) ──────────────────────────────────────
+
+class FakePrepared:
+    def __init__(self, conn, sql):
+        self.conn, self.sql = conn, sql
+        self.stale = False
+
+    async def fetch(self, *args):
+        if self.stale:
+            raise asyncpg.InvalidCachedStatementError("cached plan must not change result type")
+        return await self.conn._call("prepared", self.sql, args)
+
+
+class FakeConnection:
+    """
+    The parts of asyncpg.Connection the app uses. Every call is recorded in
+    `calls` as (method, sql, args) and answered by handler(method, sql, args)
+    (None unless set); transactions record begin / commit / rollback.
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.calls: list[tuple] = []
+        self.prepared: list[FakePrepared] = []
+        self.isolation: list = []
+        self.in_transaction = False
+
+    async def _call(self, method, sql, args):
+        self.calls.append((method, sql, args))
+        return self.handler(method, sql, args) if self.handler else None
+
+    async def fetch(self, sql, *args):
+        return await self._call("fetch", sql, args) or []
+
+    async def fetchrow(self, sql, *args):
+        return await self._call("fetchrow", sql, args)
+
+    async def fetchval(self, sql, *args):
+        return await self._call("fetchval", sql, args)
+
+    async def execute(self, sql, *args):
+        return await self._call("execute", sql, args)
+
+    async def executemany(self, sql, args):
+        return await self._call("executemany", sql, list(args))
+
+    @asynccontextmanager
+    async def transaction(self, isolation=None):
+        self.isolation.append(isolation)
+        outer, self.in_transaction = self.in_transaction, True
+        self.calls.append(("begin", None, ()))
+        try:
+            yield
+        except BaseException:
+            self.calls.append(("rollback", None, ()))
+            raise
+        finally:
+            self.in_transaction = outer
+        self.calls.append(("commit", None, ()))
+
+    async def prepare(self, sql):
+        stmt = FakePrepared(self, sql)
+        self.prepared.append(stmt)
+        return stmt
+
+    def is_in_transaction(self):
+        return self.in_transaction
+
+    def kinds(self) -> list[str]:
+        return [method for method, _, _ in self.calls]
+
+
+class _FakeAcquire:
+    """pool.acquire() result: awaitable, or an async context manager that releases."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __await__(self):
+        return self.pool._take().__await__()
+
+    async def __aenter__(self):
+        self.conn = await self.pool._take()
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        await self.pool.release(self.conn)
+
+
+class FakePool:
+    """
+    asyncpg.Pool stand-in: hands out one shared `conn` to every acquire, or
+    with `size` set, that many distinct connections — acquire times out
+    once none are free.
+    """
+
+    def __init__(self, conn=None, size=None):
+        self.conn = conn or FakeConnection()
+        self.free = None if size is None else [FakeConnection() for _ in range(size)]
+
+    def acquire(self, timeout=None):
+        return _FakeAcquire(self)
+
+    async def _take(self):
+        if self.free is None:
+            return self.conn
+        if not self.free:
+            raise asyncio.TimeoutError
+        return self.free.pop()
+
+    async def release(self, conn):
+        if self.free is not None:
+            self.free.append(conn)
+
+
+class SourceTables:
+    """
+    In-memory prompts / agents / proposals answering the Postgres queries
+    the search side sends (row loads by id, keyset pages, counts, created_at
+    deltas), plus the search_changes log that migrations 4 and 6's triggers
+    keep: add() / update() / delete() each log in their own transaction
+    (an add as of its created_at). Use as a FakeConnection handler.
+    """
+
+    def __init__(self):
+        self.tables: dict[str, list[dict]] = {"prompts": [], "agents": [], "proposals": []}
+        self.fail_after: int | None = None  # keyset pages served before raising
+        self.pages = 0
+        self.changes: list[dict] = []
+        self.txid = 1  # next transaction id
+        self.horizon: int | None = None  # oldest running transaction; None = all committed
+
+    def add(self, table: str, **row) -> dict:
+        row.setdefault("created_at", "2026-01-01T00:00:00+00:00")
+        self.tables[table].append(row)
+        self._log(table[:-1], row["id"], "upsert", datetime.fromisoformat(row["created_at"]))
+        self.txid += 1
+        return row
+
+    def update(self, table: str, row_id: str, **fields) -> None:
+        next(r for r in self.tables[table] if r["id"] == row_id).update(fields)
+        self._log(table[:-1], row_id, "upsert")
+        if table == "prompts":
+            for proposal in self.tables["proposals"]:
+                if proposal["prompt_id"] == row_id:
+                    self._log("proposal", proposal["id"], "upsert")
+        self.txid += 1
+
+    def delete(self, table: str, row_id: str) -> None:
+        self.tables[table] = [r for r in self.tables[table] if r["id"] != row_id]
+        self._log(table[:-1], row_id, "delete")
+        self.txid += 1
+
+    def _log(self, entity_type: str, entity_id: str, op: str, at: datetime | None = None) -> None:
+        self.changes.append({
+            "txid": self.txid, "seq": len(self.changes) + 1,
+            "entity_type": entity_type, "entity_id": entity_id, "op": op,
+            "changed_at": at or datetime.now(timezone.utc),
+        })
+
+    def _rows(self, sql: str) -> tuple[str, list[dict]]:
+        table = "proposals" if "FROM proposals" in sql else "agents" if "FROM agents" in sql else "prompts"
+        rows = [dict(r) for r in self.tables[table]]
+        if table == "proposals":
+            titles = {p["id"]: p["title"] for p in self.tables["prompts"]}
+            rows = [dict(r, prompt_title=titles[r["prompt_id"]]) for r in rows if r["prompt_id"] in titles]
+        return table, rows
+
+    def __call__(self, method, sql, args):
+        if "txid_snapshot_xmin" in sql:
+            return self.txid if self.horizon is None else self.horizon
+        if "search_changes" in sql:
+            if sql.startswith("DELETE"):
+                return None
+            if "changed_at >= $1" in sql:
+                return [c for c in self.changes if c["changed_at"] >= args[0]]
+            after, horizon, limit = tuple(args[:2]), args[2], args[3]
+            return [c for c in self.changes if (c["txid"], c["seq"]) > after and c["txid"] < horizon][:limit]
+        _, rows = self._rows(sql)
+        if ".id) > ($1, $2)" in sql:
+            rows = sorted((dict(r, mark=r["created_at"]) for r in rows), key=lambda r: (r["mark"], r["id"]))
+            return [r for r in rows if (r["mark"], r["id"]) > tuple(args[:2])][:args[2]]
+        if "COUNT(*)" in sql:
+            return len(rows)
+        if "ANY($1" in sql:
+            return [r for r in rows if r["id"] in args[0]]
+        if "created_at >= $1" in sql:
+            return [r for r in rows if r["created_at"] >= args[0]]
+        if "id > $1" in sql:
+            if self.fail_after is not None and self.pages >= self.fail_after:
+                raise RuntimeError("simulated crash")
+            self.pages += 1
+            return sorted((r for r in rows if r["id"] > args[0]), key=lambda r: r["id"])[:args[1]]
+        return None
+
+
+@pytest.fixture
+def fake_pg(monkeypatch):
+    """
+    Point get_pool() at a FakePool everywhere it was imported and empty the
+    indexing outbox. Returns the pool's FakeConnection (set .handler).
+    """
+    from core import database, indexer, reindex, search, search_snapshot
+
+    pool = FakePool()
+
+    async def get_pool():
+        return pool
+
+    for module in (database, indexer, reindex, search, search_snapshot):
+        monkeypatch.setattr(module, "get_pool", get_pool)
+    monkeypatch.setattr(indexer, "_pending", {})
+    return pool.conn
+
+
+# ── Embedding double ──────────────────────────────────────────────────────────
+
+class FakeEncoder:
+    """
+    fastembed.TextEmbedding stand-in: a seeded random vector per text, so
+    the vector path runs without model cost. Records each call's batch size.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.batches: list[int] = []
+
+    def embed(self, texts, batch_size=256, **kwargs):
+        import numpy as np
+
+        self.batches.append(len(texts))
+        for text in texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+            yield np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+
+
+# ── Real Postgres (tests marked db; skipped unless TEST_DATABASE_URL is set) ──
+
+@pytest.fixture
+def pg():
+    """
+    `async with pg() as conn:` — a raw asyncpg connection on a throwaway
+    schema holding the base tables with every migration applied; the
+    schema is dropped on exit.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    @asynccontextmanager
+    async def connect():
+        from core.database import _CREATE_TABLES
+        from core.migrations import migrate
+
+        schema = f"mojify_test_{uuid.uuid4().hex[:12]}"
+        admin = await asyncpg.connect(url)
+        await admin.execute(f"CREATE SCHEMA {schema}")
+        conn = await asyncpg.connect(url, server_settings={"search_path": schema})
+        try:
+            for stmt in _CREATE_TABLES:
+                await conn.execute(stmt)
+            await migrate(conn)
+            yield conn
+        finally:
+            await conn.close()
+            await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+            await admin.close()
+
+    return connect
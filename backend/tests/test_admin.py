@@ -141,3 +141,18 @@ def test_admin_close_requires_auth(client):
     prompt_id = create.json()["id"]
     resp = client.patch(f"/api/admin/prompts/{prompt_id}/close")
     assert resp.status_code == 401
+
+
+# ── Search stats ──────────────────────────────────────────────────────────────
+
+def test_admin_search_stats(client):
+    token = _login(client)
+    resp = client.get("/api/admin/search/stats", headers=_auth(token))
+    assert resp.status_code == 200
+    conns = resp.json()["connections"]
+    assert {"opened", "reused", "reopened", "open"} <= set(conns)
+
+
+def test_admin_search_stats_requires_auth(client):
+    resp = client.get("/api/admin/search/stats")
+    assert resp.status_code == 401
@@ -0,0 +1,49 @@
+"""
+Smoke tests for the search benchmark suite (benchmarks/search_bench.py).
+"""
+import pytest
+
+from benchmarks import corpus, search_bench
+from core import search
+
+
+def test_small_run_reports_every_metric(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(search, "_get_encoder", search._get_encoder)
+    monkeypatch.setattr(search, "_SHARDED", search._SHARDED)
+    monkeypatch.setattr(search, "get_pool", search.get_pool)
+
+    report = search_bench.run(300, str(tmp_path), encoder="fake", n_queries=20, warmup=2)
+
+    results = report["results"]
+    assert report["corpus"]["prompts"] == 300
+    assert results["build"]["rows"] == 300 + 300 + report["corpus"]["agents"]
+    assert results["incremental_sync"]["rows"] >= 6  # 3 new prompts + 3 proposals, plus retitles
+    for mode in ("bm25", "hybrid"):
+        latency = results["query"][mode]
+        assert latency["queries"] == 20
+        assert latency["p50_ms"] <= latency["p95_ms"] <= latency["p99_ms"]
+    assert results["query"]["bm25"]["hit_rate"] > 0.5
+
+
+def test_corpus_is_deterministic(tmp_path):
+    import sqlite3
+
+    rows = []
+    for name in ("a.db", "b.db"):
+        corpus.create(str(tmp_path / name), 50)
+        conn = sqlite3.connect(tmp_path / name)
+        rows.append(conn.execute("SELECT * FROM proposals ORDER BY id").fetchall())
+        conn.close()
+    assert rows[0] == rows[1]
+    assert corpus.queries(30) == corpus.queries(30)
+
+
+def test_compare_flags_slowdowns_beyond_tolerance():
+    baseline = {"results": {"build": {"seconds": 10.0}, "query": {"bm25": {"p95_ms": 2.0, "p99_ms": 3.0}}}}
+    current = {"results": {"build": {"seconds": 11.0}, "query": {"bm25": {"p95_ms": 3.0, "p99_ms": 3.1}}}}
+
+    assert search_bench.compare(baseline, current, tolerance=0.2) == ["BM25 p95: 2.0 -> 3.0 (+50%)"]
+    assert search_bench.compare(baseline, baseline) == []
+    assert search_bench.parse_size("100k") == 100_000
+    assert search_bench.parse_size("1m") == 1_000_000
@@ -0,0 +1,43 @@
+"""
+Tests for the vote counter reconciliation in core/counters.py against a
+fake asyncpg connection (no Postgres needed).
+"""
+import asyncio
+
+import asyncpg
+import pytest
+
+from core import counters
+from tests.conftest import FakeConnection
+
+
+def _statuses(statuses, conflicts=0):
+    """A handler answering UPDATEs with statuses, after `conflicts` serialization failures."""
+    statuses = list(statuses)
+    left = [conflicts]
+
+    def handler(method, sql, args):
+        if left[0]:
+            left[0] -= 1
+            raise asyncpg.SerializationError("could not serialize access due to concurrent update")
+        return statuses.pop(0)
+
+    return handler
+
+
+def test_reconcile_reports_repaired_rows():
+    conn = FakeConnection(_statuses(["UPDATE 3", "UPDATE 1"]))
+    assert asyncio.run(counters.reconcile(conn)) == {"proposals": 3, "prompts": 1}
+    assert conn.isolation == ["repeatable_read"]
+
+
+def test_reconcile_retries_when_a_vote_lands_mid_recount(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(counters.asyncio, "sleep", lambda _: sleep(0))
+    conn = FakeConnection(_statuses(["UPDATE 0", "UPDATE 0"], conflicts=1))
+    assert asyncio.run(counters.reconcile(conn)) == {"proposals": 0, "prompts": 0}
+    assert len(conn.isolation) == 2
+
+    conn = FakeConnection(_statuses([], conflicts=counters._RETRIES))
+    with pytest.raises(asyncpg.SerializationError):
+        asyncio.run(counters.reconcile(conn))
@@ -0,0 +1,186 @@
+"""
+Tests for the asyncpg wrapper in core/database.py: statement translation
+cache, per-connection prepared statements, transactions and batches, and
+pool accounting (no Postgres needed).
+"""
+import asyncio
+
+import pytest
+
+from core import database
+from core.database import _Conn, _to_pg, _translate
+from tests.conftest import FakeConnection, FakePool
+
+
+def _rows(method, sql, args):
+    return [{"n": len(args)}] if method in ("fetch", "prepared") else None
+
+
+def _conn():
+    raw = FakeConnection(_rows)
+    return raw, _Conn(raw)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches(monkeypatch):
+    _translate.cache_clear()
+    monkeypatch.setattr(database, "PREPARE_AFTER", 3)
+    monkeypatch.setattr(database, "_prepared_stats", {"hits": 0, "prepared": 0, "invalidated": 0})
+    monkeypatch.setattr(database, "_hot", {})
+
+
+def test_translation_is_cached():
+    sql = "SELECT * FROM votes WHERE proposal_id = ? AND user_fingerprint = ?"
+    assert _to_pg(sql, ("p", "f")) == ("SELECT * FROM votes WHERE proposal_id = $1 AND user_fingerprint = $2", ["p", "f"])
+    _to_pg(sql, ("q", "g"))
+    stats = database.statement_stats()["translations"]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert _translate("  with x AS (SELECT 1) SELECT * FROM x").returns_rows
+    assert not _translate("UPDATE prompts SET status = ?").returns_rows
+
+
+def test_hot_statement_is_prepared_once_per_connection():
+    raw, conn = _conn()
+    sql = "SELECT id FROM agents WHERE api_key = ?"
+
+    async def run():
+        for _ in range(5):
+            cursor = await conn.execute(sql, ("key",))
+            assert await cursor.fetchone() == {"n": 1}
+
+    asyncio.run(run())
+    assert raw.kinds() == ["fetch", "fetch", "prepared", "prepared", "prepared"]
+    assert len(raw.prepared) == 1
+    stats = database.statement_stats()["prepared"]
+    assert (stats["prepared"], stats["hits"]) == (1, 2)
+
+
+def test_write_statements_return_no_rows_and_skip_parameterless():
+    raw, conn = _conn()
+
+    async def run():
+        for _ in range(4):
+            cursor = await conn.execute("UPDATE prompts SET status = ? WHERE id = ?", ("closed", "p1"))
+            assert await cursor.fetchall() == []
+            await conn.execute("DELETE FROM votes")
+
+    asyncio.run(run())
+    assert raw.calls[-2][0] == "prepared"
+    assert all(kind == "execute" for kind, sql, _ in raw.calls if sql.startswith("DELETE"))
+
+
+def test_invalidated_plan_falls_back_to_text():
+    raw, conn = _conn()
+    sql = "SELECT * FROM proposals WHERE id = ?"
+
+    async def run():
+        for _ in range(3):
+            await conn.execute(sql, ("r1",))
+        raw.prepared[0].stale = True  # e.g. a migration added a column
+        return await (await conn.execute(sql, ("r1",))).fetchall()
+
+    assert asyncio.run(run()) == [{"n": 1}]
+    assert raw.calls[-1][0] == "fetch"
+    assert database.statement_stats()["prepared"]["invalidated"] == 1
+
+
+def test_batch_sends_runs_through_executemany_in_one_transaction():
+    raw, conn = _conn()
+
+    async def run():
+        async with conn.batch() as batch:
+            batch.execute("INSERT INTO prompts (id) VALUES (?)", ("p1",))
+            for i in range(3):
+                batch.execute("INSERT INTO votes (id, value) VALUES (?, ?)", (f"v{i}", 1))
+            assert raw.calls == []  # nothing is sent until the block exits
+
+    asyncio.run(run())
+    assert raw.kinds() == ["begin", "execute", "executemany", "commit"]
+    _, sql, rows = raw.calls[2]
+    assert sql == "INSERT INTO votes (id, value) VALUES ($1, $2)"
+    assert rows == [("v0", 1), ("v1", 1), ("v2", 1)]
+
+
+def test_batch_is_discarded_when_the_block_raises():
+    raw, conn = _conn()
+
+    async def run():
+        async with conn.batch() as batch:
+            batch.execute("INSERT INTO prompts (id) VALUES (?)", ("p1",))
+            raise ValueError("validation failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    assert raw.calls == []
+
+
+def test_transaction_rolls_back_on_error():
+    raw, conn = _conn()
+
+    async def run():
+        async with conn.transaction():
+            await conn.execute("UPDATE prompts SET status = ? WHERE id = ?", ("closed", "p1"))
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert raw.kinds() == ["begin", "execute", "rollback"]
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    pool = FakePool(size=1)
+    monkeypatch.setattr(database, "_pool", None)
+    monkeypatch.setattr(database, "_pool_stats", {
+        "acquired": 0, "timeouts": 0, "in_use": 0, "waiting": 0, "connections_opened": 0,
+    })
+    monkeypatch.setattr(database, "_acquire_waits", database.deque(maxlen=8))
+
+    async def get_pool():
+        return pool
+
+    monkeypatch.setattr(database, "get_pool", get_pool)
+    return pool
+
+
+def test_acquire_tracks_in_use_and_timeouts(fake_pool):
+    async def run():
+        async with database._acquire(fake_pool):
+            assert database.pool_stats()["in_use"] == 1
+            with pytest.raises(asyncio.TimeoutError):
+                async with database._acquire(fake_pool):
+                    pass
+
+    asyncio.run(run())
+    stats = database.pool_stats()
+    assert (stats["acquired"], stats["timeouts"], stats["in_use"], stats["waiting"]) == (1, 1, 0, 0)
+    assert len(fake_pool.free) == 1
+    assert stats["wait_ms"]["max"] >= stats["wait_ms"]["p50"] >= 0
+
+
+def test_get_db_answers_503_when_pool_is_exhausted(fake_pool):
+    from fastapi import HTTPException
+
+    fake_pool.free.clear()
+
+    async def run():
+        async for _ in database.get_db():
+            pass
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "1"}
+
+
+def test_new_connections_prepare_hot_statements():
+    sql = database.hot_statement("SELECT id, name FROM agents WHERE api_key = ?")
+    raw, conn = _conn()
+
+    async def run():
+        await database._init_connection(raw)
+        await conn.execute(sql, ("key",))
+
+    asyncio.run(run())
+    assert [s.sql for s in raw.prepared] == ["SELECT id, name FROM agents WHERE api_key = $1"]
+    assert raw.calls[0][0] == "prepared"  # first use is already prepared
@@ -0,0 +1,75 @@
+"""
+Tests for the shared embedding server (core/embed_server.py).
+"""
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core import embed_server, search
+
+
+class _Encoder:
+    def __init__(self):
+        self.batches = []
+
+    def embed(self, texts, batch_size=256, **kwargs):
+        self.batches.append(len(texts))
+        for text in texts:
+            yield np.full(4, float(len(text)), dtype="float32")
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    encoder = _Encoder()
+    monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+    path = str(tmp_path / "embed.sock")
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(embed_server.serve(path, max_wait=0.01))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if (tmp_path / "embed.sock").exists():
+            break
+        time.sleep(0.01)
+    yield path, encoder
+    loop.call_soon_threadsafe(task.cancel)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=2)
+
+
+def test_embed_remote_roundtrip(server):
+    path, _ = server
+    vectors = embed_server.embed_remote(["a", "abc"], path)
+    assert [v.tolist() for v in vectors] == [[1.0] * 4, [3.0] * 4]
+
+
+def test_search_uses_socket_when_configured(server, monkeypatch):
+    path, encoder = server
+    monkeypatch.setattr(search, "_EMBED_SOCKET", path)
+    monkeypatch.setattr(search, "_get_encoder", lambda: None)  # no local model in the worker
+    assert search._embed_batch(["hello"])[0].tolist() == [5.0] * 4
+    assert encoder.batches  # served by the server's encoder
+
+
+def test_unreachable_server_raises(tmp_path):
+    with pytest.raises(embed_server.EmbedServerError):
+        embed_server.embed_remote(["x"], str(tmp_path / "missing.sock"))
+
+
+def test_failed_connect_closes_the_socket(tmp_path, monkeypatch):
+    opened = []
+
+    class Recording(socket.socket):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    monkeypatch.setattr(embed_server.socket, "socket", Recording)
+    with pytest.raises(embed_server.EmbedServerError):
+        embed_server.embed_remote(["x"], str(tmp_path / "missing.sock"))
+    assert opened and all(sock.fileno() == -1 for sock in opened)
@@ -0,0 +1,56 @@
+"""
+Tests for the search indexing outbox (core/indexer.py).
+"""
+import asyncio
+
+import pytest
+
+from core import indexer
+from core.search import hybrid_search, init_search_tables
+from tests.conftest import SourceTables
+
+
+@pytest.fixture
+def fake_source(fake_pg, tmp_path):
+    db_path = str(tmp_path / "search.db")
+    init_search_tables(db_path)
+    source = fake_pg.handler = SourceTables()
+    return db_path, source
+
+
+def test_drain_indexes_enqueued_rows(fake_source):
+    db_path, source = fake_source
+    source.add("prompts", id="p1", title="Pizza night", context_text="cheese")
+    indexer.enqueue("prompt", "p1")
+
+    assert asyncio.run(indexer.drain(db_path)) == 1
+    assert indexer.pending_count() == 0
+    assert any(r["entity_id"] == "p1" for r in hybrid_search("pizza", db_path=db_path))
+
+
+def test_burst_is_coalesced(fake_source, fake_pg):
+    """Repeated events for one entity collapse into a single load."""
+    db_path, source = fake_source
+    source.add("agents", id="a1", name="BurstAgent")
+    for _ in range(5):
+        indexer.enqueue("agent", "a1")
+
+    assert asyncio.run(indexer.drain(db_path)) == 1
+    assert fake_pg.kinds() == ["fetch"]
+
+
+def test_delete_and_missing_rows_are_removed(fake_source):
+    db_path, source = fake_source
+    source.add("prompts", id="p2", title="Sunset walk", context_text="")
+    indexer.enqueue("prompt", "p2")
+    asyncio.run(indexer.drain(db_path))
+
+    indexer.enqueue("prompt", "p2", op="delete")
+    indexer.enqueue("prompt", "ghost")  # not in the source DB
+    asyncio.run(indexer.drain(db_path))
+    assert not any(r["entity_id"] == "p2" for r in hybrid_search("sunset", db_path=db_path))
+
+
+def test_enqueue_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        indexer.enqueue("vote", "v1")
@@ -0,0 +1,136 @@
+"""
+Tests for the migration runner in core/migrations.py against a fake
+asyncpg connection (no Postgres needed).
+"""
+import asyncio
+
+import pytest
+
+from core import migrations
+from tests.conftest import FakeConnection
+
+
+class _Schema:
+    """FakeConnection handler tracking schema_migrations rows, the advisory lock and INVALID indexes."""
+
+    def __init__(self, applied=(), invalid=()):
+        self.rows = [{"version": v} for v in applied]
+        self.invalid = set(invalid)
+        self.locked = False
+        self.log = []  # (sql, in_transaction) of every execute
+        self.conn = FakeConnection(self)
+
+    def __call__(self, method, sql, args):
+        if method == "execute":
+            self.log.append((" ".join(sql.split()), self.conn.in_transaction))
+        if sql.startswith("INSERT INTO schema_migrations"):
+            self.rows.append({"version": args[0]})
+        if method == "fetch":
+            return list(self.rows)
+        if "pg_try_advisory_lock" in sql:
+            self.locked = True
+            return True
+        if "pg_advisory_unlock" in sql:
+            self.locked = False
+            return True
+        if method == "fetchval":
+            return 1 if args and args[0] in self.invalid else None
+        return None
+
+
+def _connect(**kwargs):
+    schema = _Schema(**kwargs)
+    return schema.conn, schema, schema.log
+
+
+@pytest.fixture
+def two_migrations(monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        (2, "add column", ["ALTER TABLE prompts ADD COLUMN IF NOT EXISTS x INTEGER", "UPDATE prompts SET x = 0"]),
+        (1, "index", ["CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON a (b)"]),
+    ])
+
+
+def test_pending_migrations_apply_in_order(two_migrations):
+    conn, schema, log = _connect()
+    assert asyncio.run(migrations.migrate(conn)) == [1, 2]
+    assert [r["version"] for r in schema.rows] == [1, 2]
+    assert not schema.locked
+    statements = dict(log)
+    # concurrent index builds must run outside a transaction; everything else inside one
+    assert statements["CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON a (b)"] is False
+    assert statements["UPDATE prompts SET x = 0"] is True
+
+    assert asyncio.run(migrations.migrate(conn)) == []
+
+
+def test_applied_versions_are_skipped(two_migrations):
+    conn, _, log = _connect(applied=[1])
+    assert asyncio.run(migrations.migrate(conn)) == [2]
+    assert not any("CREATE INDEX" in sql for sql, _ in log)
+
+
+def test_invalid_index_from_failed_build_is_dropped(two_migrations):
+    conn, _, log = _connect(invalid={"idx_a"})
+    asyncio.run(migrations.migrate(conn))
+    sqls = [sql for sql, _ in log]
+    drop = sqls.index("DROP INDEX CONCURRENTLY IF EXISTS idx_a")
+    assert drop < sqls.index("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON a (b)")
+
+
+def test_migration_versions_are_unique():
+    versions = [v for v, _, _ in migrations.MIGRATIONS]
+    assert len(versions) == len(set(versions))
+
+
+def test_callable_steps_run_between_short_transactions(monkeypatch):
+    conn, schema, log = _connect()
+    seen = []
+
+    async def backfill(c):
+        seen.append((c is conn, c.in_transaction))
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        (1, "column and backfill", ["ALTER TABLE a ADD COLUMN IF NOT EXISTS b INTEGER", backfill]),
+    ])
+    assert asyncio.run(migrations.migrate(conn)) == [1]
+    assert seen == [(True, False)]
+    statements = dict(log)
+    assert statements["ALTER TABLE a ADD COLUMN IF NOT EXISTS b INTEGER"] is True
+    assert log[-1][0].startswith("INSERT INTO schema_migrations") and log[-1][1] is False
+    assert [kind for kind in conn.kinds() if kind in ("begin", "commit")] == ["begin", "commit"]
+
+
+def test_backfill_commits_one_keyset_batch_at_a_time():
+    pages = {"": "p2", "p2": "p4", "p4": None}
+    conn = FakeConnection(lambda method, sql, args: pages[args[0]])
+
+    asyncio.run(migrations._backfill_batches(conn, migrations._BACKFILL_PROPOSALS, 2))
+    fetches = [args for method, _, args in conn.calls if method == "fetchval"]
+    assert fetches == [("", 2), ("p2", 2), ("p4", 2)]
+    assert conn.kinds().count("commit") == 3
+    assert conn.isolation == ["repeatable_read"] * 3
+
+
+def test_check_current_names_pending_versions(two_migrations):
+    conn, _, _ = _connect(applied=[1])
+    with pytest.raises(migrations.MigrationsPending, match=r"\[2\].*python -m core.migrations"):
+        asyncio.run(migrations.check_current(conn))
+
+    conn, _, _ = _connect(applied=[1, 2])
+    asyncio.run(migrations.check_current(conn))
+
+
+def test_lock_wait_is_bounded_and_names_the_holder(monkeypatch, caplog):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(migrations.asyncio, "sleep", lambda _: sleep(0))
+    monkeypatch.setattr(migrations, "LOCK_TIMEOUT", 0)
+
+    def held(method, sql, args):
+        return 4242 if "pg_locks" in sql else False
+
+    conn = FakeConnection(held)
+    with pytest.raises(migrations.MigrationLockTimeout, match="pid 4242"):
+        asyncio.run(migrations.migrate(conn))
+    assert "4242" in caplog.text
+    assert not any("pg_advisory_unlock" in sql for _, sql, _ in conn.calls)
@@ -0,0 +1,145 @@
+"""
+SQL that only Postgres can check: the migrations, the search change-log
+triggers and the data-modifying CTEs behind votes, proposals, Telegram and
+the house agents, run against a real database. Marked db; skipped unless TEST_DATABASE_URL is set.
+"""
+import asyncio
+
+import asyncpg
+import pytest
+
+from core import counters, migrations
+from core.database import INSERT_PROPOSAL, _Conn
+from core.house_agents import _INSERT_HOUSE_PROPOSAL
+from routers.telegram import _INSERT_PROMPT_WITH_PROPOSAL
+from routers.votes import _CAST_VOTE
+
+pytestmark = pytest.mark.db
+
+_NOW = "2026-01-01T00:00:00+00:00"
+
+
+async def _round(conn, prompt_id="p1", agent_id="a1", status="open"):
+    """An agent and a prompt to hang proposals on."""
+    await conn.execute(
+        "INSERT INTO agents (id, name, api_key, created_at) VALUES ($1, $1, 'key', $2) ON CONFLICT DO NOTHING",
+        agent_id, _NOW,
+    )
+    await conn.execute(
+        "INSERT INTO prompts (id, title, context_text, status, created_at) VALUES ($1, 'Round', '', $2, $3)",
+        prompt_id, status, _NOW,
+    )
+
+
+async def _counters(conn, prompt_id="p1"):
+    row = await conn.fetchrow("SELECT total_votes, proposal_count FROM prompts WHERE id = $1", prompt_id)
+    return row["total_votes"], row["proposal_count"]
+
+
+def test_migrations_apply_once(pg):
+    async def run():
+        async with pg() as conn:
+            assert await migrations.applied_versions(conn) == {v for v, _, _ in migrations.MIGRATIONS}
+            assert await migrations.migrate(conn) == []
+
+    asyncio.run(run())
+
+
+def test_insert_proposal_and_votes_keep_counters(pg):
+    async def run():
+        async with pg() as conn:
+            await _round(conn)
+            await conn.execute(INSERT_PROPOSAL, "r1", "p1", "a1", "🔥", None, _NOW)
+            assert await _counters(conn) == (0, 1)
+
+            db = _Conn(conn)
+
+            async def vote(fingerprint, value):
+                cursor = await db.execute(_CAST_VOTE, (f"v-{fingerprint}-{value}", "r1", fingerprint, value, _NOW, "r1", "r1"))
+                return (await cursor.fetchone())["net"]
+
+            assert await vote("u1", 1) == 1
+            assert await vote("u1", 1) == 1  # repeat: no-op
+            assert await vote("u1", -1) == -1  # flip counts double
+            assert await vote("u2", 1) == 0
+            assert await _counters(conn) == (0, 1)
+
+            with pytest.raises(asyncpg.ForeignKeyViolationError):
+                await db.execute(_CAST_VOTE, ("v-x", "missing", "u1", 1, _NOW, "missing", "missing"))
+
+    asyncio.run(run())
+
+
+def test_telegram_prompt_and_proposal_in_one_statement(pg):
+    async def run():
+        async with pg() as conn:
+            await _round(conn, prompt_id="unused")
+            await conn.execute(_INSERT_PROMPT_WITH_PROPOSAL, "tg1", "a1", "Telegram", "ctx", _NOW, "tr1", "😂", "lol")
+            assert await _counters(conn, "tg1") == (0, 1)
+            assert await conn.fetchval("SELECT prompt_id FROM proposals WHERE id = 'tr1'") == "tg1"
+
+    asyncio.run(run())
+
+
+def test_house_proposal_only_once_per_open_round(pg):
+    async def run():
+        async with pg() as conn:
+            await _round(conn)
+            await _round(conn, prompt_id="p2", status="closed")
+
+            row = await conn.fetchrow(_INSERT_HOUSE_PROPOSAL, "h1", "p1", "a1", "✨", "why", _NOW)
+            assert (row["status"], row["inserted"]) == ("open", True)
+            row = await conn.fetchrow(_INSERT_HOUSE_PROPOSAL, "h2", "p1", "a1", "✨", "again", _NOW)
+            assert (row["status"], row["inserted"]) == ("open", False)
+            row = await conn.fetchrow(_INSERT_HOUSE_PROPOSAL, "h3", "p2", "a1", "✨", "closed", _NOW)
+            assert (row["status"], row["inserted"]) == ("closed", False)
+            assert await _counters(conn) == (0, 1)
+            assert await _counters(conn, "p2") == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_reconcile_repairs_drift(pg):
+    async def run():
+        async with pg() as conn:
+            await _round(conn)
+            await conn.execute(INSERT_PROPOSAL, "r1", "p1", "a1", "🔥", None, _NOW)
+            await conn.execute("UPDATE proposals SET net_votes = 5")
+            assert await counters.reconcile(conn) == {"proposals": 1, "prompts": 0}
+            assert await counters.reconcile(conn) == {"proposals": 0, "prompts": 0}
+
+    asyncio.run(run())
+
+
+def test_search_sync_replays_the_change_log(pg, tmp_path, monkeypatch):
+    from core import search
+    from tests.conftest import FakePool
+
+    db = str(tmp_path / "search.db")
+    monkeypatch.setattr(search, "_get_encoder", lambda: None)
+    search.init_search_tables(db)
+
+    async def run():
+        async with pg() as conn:
+            pool = FakePool(conn)
+
+            async def get_pool():
+                return pool
+
+            monkeypatch.setattr(search, "get_pool", get_pool)
+            await _round(conn)
+            await conn.execute(INSERT_PROPOSAL, "r1", "p1", "a1", "🌮", "taco", _NOW)
+            assert await search.sync_search_index(db) == 3
+
+            await conn.execute("UPDATE prompts SET title = 'Sushi night' WHERE id = 'p1'")
+            await conn.execute("UPDATE prompts SET status = 'closed' WHERE id = 'p1'")  # not indexed, not logged
+            # three inserts, then the retitled prompt and its proposal
+            assert await conn.fetchval("SELECT COUNT(*) FROM search_changes") == 5
+            assert await search.sync_search_index(db) == 2
+
+            await conn.execute("DELETE FROM proposals WHERE id = 'r1'")
+            assert await search.sync_search_index(db) == 1
+            assert await search.sync_search_index(db) == 0
+
+    asyncio.run(run())
+    assert [r["entity_id"] for r in search.hybrid_search("sushi", db_path=db)] == ["p1"]
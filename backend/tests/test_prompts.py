@@ -121,3 +121,20 @@ def test_list_prompts_sort_all_empty(client):
     resp = client.get("/api/prompts/", params={"sort": "all"})
     assert resp.status_code == 200
     assert resp.json() == []
+
+
+def test_related_prompts_not_found(client):
+    resp = client.get("/api/prompts/nonexistent-id/related")
+    assert resp.status_code == 404
+
+
+def test_related_prompts_without_vectors_is_empty(client):
+    """With no stored embedding (no encoder) there is nothing to compare against."""
+    create = client.post(
+        "/api/prompts/",
+        json={"title": "Lonely round", "context_text": "ctx", "media_type": "text"},
+    )
+    prompt_id = create.json()["id"]
+    resp = client.get(f"/api/prompts/{prompt_id}/related?status=open")
+    assert resp.status_code == 200
+    assert resp.json() == []
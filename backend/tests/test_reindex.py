@@ -0,0 +1,106 @@
+"""
+Tests for the resumable full reindex job (core/reindex.py).
+"""
+import asyncio
+
+import pytest
+
+from core import reindex
+from core.search import hybrid_search, index_one, init_search_tables
+from tests.conftest import SourceTables
+
+
+@pytest.fixture
+def source(fake_pg, monkeypatch, tmp_path):
+    db_path = str(tmp_path / "search.db")
+    init_search_tables(db_path)
+    tables = fake_pg.handler = SourceTables()
+    for i in range(7):
+        tables.add("prompts", id=f"p{i:02d}", title=f"Round {i} tacos", context_text="")
+    monkeypatch.setattr(reindex, "REINDEX_PAGE", 3)
+    return db_path, tables
+
+
+def _indexed(db_path):
+    return {r["entity_id"] for r in hybrid_search("tacos", limit=50, db_path=db_path)}
+
+
+def test_rebuild_swaps_in_shadow(source):
+    db_path, _ = source
+    index_one("prompt", "stale", "Old tacos", "Old tacos", db_path)
+
+    assert asyncio.run(reindex.run_reindex(db_path, workers=0)) == 7
+    assert _indexed(db_path) == {f"p{i:02d}" for i in range(7)}
+    assert reindex.reindex_progress()["status"] == "done"
+
+
+def test_swap_is_seen_by_other_workers(source):
+    """Another worker's in-memory state for the file is dropped on its next read."""
+    from core import search
+
+    db_path, _ = source
+    index_one("prompt", "stale", "Old tacos", "Old tacos", db_path)
+    assert _indexed(db_path) == {"stale"}
+    seen = search._shared_seen[db_path]
+
+    asyncio.run(reindex.run_reindex(db_path, workers=0))
+
+    # Put this process back where a worker that didn't run the job would be
+    search._shared_seen[db_path] = seen
+    search._shared_own.pop(db_path, None)
+    stale = search._vector_stores[db_path] = {}
+    search._check_shared(db_path)
+    assert search._vector_stores.get(db_path) is not stale
+    assert _indexed(db_path) == {f"p{i:02d}" for i in range(7)}
+
+
+def test_crash_keeps_live_index_and_resumes(source):
+    db_path, tables = source
+    index_one("prompt", "stale", "Old tacos", "Old tacos", db_path)
+
+    tables.fail_after = 2
+    with pytest.raises(RuntimeError):
+        asyncio.run(reindex.run_reindex(db_path, workers=0))
+    assert _indexed(db_path) == {"stale"}  # searches still served by the old tables
+
+    tables.fail_after, tables.pages = None, 0
+    asyncio.run(reindex.run_reindex(db_path, workers=0))
+    # third prompt page plus the empty terminators (prompts, agents, proposals) —
+    # the first two prompt pages were checkpointed
+    assert tables.pages == 4
+    assert _indexed(db_path) == {f"p{i:02d}" for i in range(7)}
+
+
+def test_sharded_rebuild_swaps_each_file(source, monkeypatch):
+    import sqlite3
+    from core import search
+
+    db_path, _ = source
+    monkeypatch.setattr(search, "_SHARDED", True)
+    asyncio.run(reindex.run_reindex(db_path, workers=0))
+    assert _indexed(db_path) == {f"p{i:02d}" for i in range(7)}
+
+    conn = sqlite3.connect(search.shard_path(db_path, "prompt"))
+    assert conn.execute("SELECT COUNT(*) FROM search_fts").fetchone()[0] == 7
+    conn.close()
+
+
+def test_stop_cancels_a_running_job(monkeypatch):
+    started = []
+
+    async def hang(db_path, resume, workers):
+        started.append(True)
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(reindex, "run_reindex", hang)
+    monkeypatch.setattr(reindex, "_task", None)
+
+    async def run():
+        assert reindex.start_reindex("unused.db")
+        await asyncio.sleep(0)
+        await reindex.stop_reindex()
+        assert reindex._task.done()
+        await reindex.stop_reindex()  # nothing left to stop
+
+    asyncio.run(run())
+    assert started and reindex.reindex_progress()["status"] == "interrupted"
@@ -1,6 +1,9 @@
 """
 Tests for hybrid search: BM25 (FTS5) + vector similarity.
 """
+import asyncio
+import json
+
 import pytest
 
 from core.search import (
@@ -10,6 +13,7 @@ from core.search import (
     index_one,
     delete_one,
 )
+from tests.conftest import FakeEncoder, SourceTables
 
 
 class TestSearchIndex:
@@ -31,12 +35,11 @@ class TestSearchIndex:
         assert "search_fts" in tables
         assert "search_embeddings" in tables
 
-    def test_sync_search_index_empty_db(self):
-        """sync_search_index with empty DB indexes nothing."""
-        from tests.test_utils import TEST_DB_PATH
-
-        init_search_tables(TEST_DB_PATH)
-        count = sync_search_index(TEST_DB_PATH, incremental=True)
+    def test_sync_search_index_empty_db(self, tmp_path, fake_pg):
+        """sync_search_index with empty source tables indexes nothing."""
+        fake_pg.handler = SourceTables()
+        db = _search_db(tmp_path / "empty.db")
+        count = asyncio.run(sync_search_index(db, incremental=True))
         assert count == 0
 
     def test_sync_and_search_prompt(self, client):
@@ -56,7 +59,7 @@ class TestSearchIndex:
         prompt_id = r.json()["id"]
 
         # Sync search index (full rebuild to ensure prompt is indexed)
-        sync_search_index(TEST_DB_PATH, incremental=False)
+        asyncio.run(sync_search_index(TEST_DB_PATH, incremental=False))
 
         # Search
         results = hybrid_search("code compiles", limit=10, db_path=TEST_DB_PATH)
@@ -74,7 +77,7 @@ class TestSearchIndex:
             "/api/prompts/",
             json={"title": "Happy birthday party", "context_text": "Celebration with cake", "media_type": "text"},
         )
-        sync_search_index(TEST_DB_PATH, incremental=False)
+        asyncio.run(sync_search_index(TEST_DB_PATH, incremental=False))
 
         r = client.get("/api/search", params={"q": "birthday"})
         assert r.status_code == 200
@@ -119,7 +122,7 @@ class TestSearchIndex:
         """Partial word 'age' should match 'agents' via FTS5 prefix query."""
         from tests.test_utils import TEST_DB_PATH
         client.post("/api/agents/register", json={"name": "PrefixSearchAgent"})
-        sync_search_index(TEST_DB_PATH, incremental=False)
+        asyncio.run(sync_search_index(TEST_DB_PATH, incremental=False))
         r = client.get("/api/search", params={"q": "age"})
         assert r.status_code == 200
         results = r.json()["results"]
@@ -140,3 +143,874 @@ class TestSearchIndex:
         delete_one("prompt", "test-123", db_path=TEST_DB_PATH)
         results_after = hybrid_search("Test content", limit=5, db_path=TEST_DB_PATH)
         assert not any(r["entity_id"] == "test-123" for r in results_after)
+
+
+class TestVectorMatrix:
+    """In-memory numpy matrix used by the vector leg of hybrid_search."""
+
+    def test_top_k_matches_pure_python_cosine(self):
+        """Matrix scoring ranks rows the same way as _cosine_similarity."""
+        pytest.importorskip("numpy")
+        import random
+        from core.search import _VectorMatrix, _cosine_similarity, _normalise
+
+        rng = random.Random(7)
+        rows = {f"id-{i}": [rng.uniform(-1, 1) for _ in range(16)] for i in range(200)}
+        matrix = _VectorMatrix(16)
+        for eid, vec in rows.items():
+            matrix.upsert(eid, eid, vec)
+        query = [rng.uniform(-1, 1) for _ in range(16)]
+
+        got = [eid for eid, _, _ in matrix.top_k(_normalise(query), 10, -1.0)]
+        expected = sorted(rows, key=lambda eid: -_cosine_similarity(query, rows[eid]))[:10]
+        assert got == expected
+
+    def test_remove_keeps_remaining_rows(self):
+        """Tombstoned rows drop out of the results; the rest stay aligned."""
+        pytest.importorskip("numpy")
+        from core.search import _VectorMatrix, _normalise
+
+        matrix = _VectorMatrix(2)
+        matrix.upsert("a", "a", [1.0, 0.0])
+        matrix.upsert("b", "b", [0.0, 1.0])
+        matrix.upsert("c", "c", [0.7, 0.7])
+        matrix.remove("a")
+
+        assert len(matrix) == 2
+        best = matrix.top_k(_normalise([0.0, 1.0]), 1, 0.0)
+        assert best[0][0] == "b"
+
+
+    def test_view_is_unaffected_by_later_writes(self, monkeypatch):
+        """A view scored outside the lock keeps its rows through updates, deletes and compaction."""
+        pytest.importorskip("numpy")
+        from core import search
+        from core.search import _VectorMatrix, _normalise
+
+        monkeypatch.setattr(search, "_COMPACT_MIN", 2)
+        matrix = _VectorMatrix(2)
+        matrix.upsert("a", "a", [1.0, 0.0])
+        matrix.upsert("b", "b", [0.0, 1.0])
+        matrix.upsert("c", "c", [0.7, 0.7])
+        view = matrix.view()
+
+        matrix.upsert("a", "a2", [0.0, 1.0])
+        matrix.remove("b")
+        matrix.remove("c")  # compacts
+        assert matrix.epoch == 1 and len(matrix) == 1
+
+        assert [eid for eid, _, _ in view.top_k(_normalise([1.0, 0.0]), 3, 0.0)] == ["a", "c"]
+        assert matrix.top_k(_normalise([0.0, 1.0]), 3, 0.0) == [("a", "a2", pytest.approx(1.0))]
+
+
+class TestQuantizedVectors:
+    """SEARCH_VECTOR_QUANT=int8: compact rows, asymmetric scoring, exact re-rank."""
+
+    def test_int8_matrix_is_smaller_and_close(self):
+        np = pytest.importorskip("numpy")
+        from core.search import _VectorMatrix, _normalise
+
+        rng = np.random.default_rng(3)
+        rows = rng.normal(size=(500, 64)).astype("float32")
+        exact, quant = _VectorMatrix(64, quantized=False), _VectorMatrix(64, quantized=True)
+        for i, vec in enumerate(rows):
+            exact.upsert(f"r{i}", "", vec)
+            quant.upsert(f"r{i}", "", vec)
+
+        assert quant.nbytes() * 3 < exact.nbytes()
+        query = _normalise(rng.normal(size=64))
+        assert np.abs(quant._scores(query, None) - exact._scores(query, None)).max() < 0.02
+
+    def test_rerank_restores_exact_order(self, tmp_path, monkeypatch):
+        np = pytest.importorskip("numpy")
+        from core import search
+
+        monkeypatch.setattr(search, "_get_encoder", lambda: FakeEncoder(dim=32))
+        db = str(tmp_path / "quant.db")
+        init_search_tables(db)
+        search.index_many([("prompt", f"p{i}", f"t{i}", f"doc {i}") for i in range(300)], db)
+        query = np.random.default_rng(1).normal(size=32)
+
+        with search._connect(db) as conn:
+            monkeypatch.setattr(search, "_QUANTIZE_INT8", False)
+            search.invalidate_vector_cache(db)
+            exact = search._vector_search(conn, db, query, None, 10)
+            monkeypatch.setattr(search, "_QUANTIZE_INT8", True)
+            search.invalidate_vector_cache(db)
+            quant = search._vector_search(conn, db, query, None, 10)
+        search.invalidate_vector_cache(db)
+
+        assert quant == exact
+
+
+class TestEmbeddingFormat:
+    """Binary float32 embedding blobs and migration from legacy JSON."""
+
+    def test_pack_unpack_roundtrip(self):
+        from core.search import _pack_embedding, _unpack_embedding
+
+        raw = _pack_embedding([0.5, -1.25, 3.0])
+        assert isinstance(raw, bytes)
+        assert len(raw) == 1 + 3 * 4
+        assert list(_unpack_embedding(raw)) == [0.5, -1.25, 3.0]
+
+    def test_unpack_reads_legacy_json(self):
+        from core.search import _unpack_embedding
+
+        assert _unpack_embedding("[0.5, 1.0]") == [0.5, 1.0]
+        assert _unpack_embedding(b"[0.5, 1.0]") == [0.5, 1.0]
+
+    def test_migrate_embeddings_rewrites_json_rows(self):
+        """Legacy JSON rows are rewritten as binary blobs."""
+        import sqlite3
+        from core.search import migrate_embeddings, _unpack_embedding
+        from tests.test_utils import TEST_DB_PATH
+
+        init_search_tables(TEST_DB_PATH)
+        conn = sqlite3.connect(TEST_DB_PATH)
+        conn.execute(
+            "INSERT INTO search_embeddings (entity_type, entity_id, content, embedding) VALUES (?, ?, ?, ?)",
+            ("prompt", "legacy-1", "legacy", "[0.25, 0.75]"),
+        )
+        conn.commit()
+
+        assert migrate_embeddings(TEST_DB_PATH, batch_size=1, pause=0) == 1
+        kind, raw = conn.execute(
+            "SELECT typeof(embedding), embedding FROM search_embeddings WHERE entity_id = 'legacy-1'"
+        ).fetchone()
+        conn.close()
+        assert kind == "blob"
+        assert list(_unpack_embedding(raw)) == [0.25, 0.75]
+
+
+class TestIVFIndex:
+    """Approximate nearest-neighbour index (core/ann.py)."""
+
+    def _clustered(self, n=3000, dim=32, seed=3):
+        np = pytest.importorskip("numpy")
+        from core.search import _VectorMatrix
+
+        rng = np.random.default_rng(seed)
+        centers = rng.normal(size=(30, dim))
+        data = centers[rng.integers(0, 30, n)] + 0.6 * rng.normal(size=(n, dim))
+        matrix = _VectorMatrix(dim)
+        for i, vec in enumerate(data):
+            matrix.upsert(f"row-{i}", "", vec)
+        return np, rng, data, matrix
+
+    def test_recall_vs_exhaustive(self):
+        """With a moderate nprobe the IVF top-k matches the exhaustive top-k closely."""
+        from core import ann
+        from core.search import _normalise
+
+        np, rng, data, matrix = self._clustered()
+        matrix.attach_ivf(ann.IVFIndex.train(matrix.vectors(), nlist=64))
+
+        recalls = []
+        for q in range(50):
+            query = _normalise(data[q] + 0.3 * rng.normal(size=data.shape[1]))
+            exact = {eid for eid, _, _ in matrix.top_k(query, 10, -1.0, nprobe=0)}
+            approx = {eid for eid, _, _ in matrix.top_k(query, 10, -1.0, nprobe=8)}
+            recalls.append(len(exact & approx) / 10)
+        assert sum(recalls) / len(recalls) >= 0.9
+
+    def test_incremental_upsert_and_remove(self):
+        """Rows added after training are assigned a cell and found; removed rows are not."""
+        from core import ann
+        from core.search import _normalise
+
+        np, _, data, matrix = self._clustered(n=500)
+        matrix.attach_ivf(ann.IVFIndex.train(matrix.vectors(), nlist=16))
+        matrix.upsert("late", "", data[3])
+        matrix.remove("row-3")
+
+        hits = [eid for eid, _, _ in matrix.top_k(_normalise(data[3]), 3, 0.0, nprobe=2)]
+        assert hits[0] == "late"
+        assert "row-3" not in hits
+
+    def test_training_runs_outside_the_vector_lock(self, tmp_path, monkeypatch):
+        """IVF training happens in a background thread that doesn't hold _vector_lock."""
+        from core import ann, search
+
+        np, _, _, matrix = self._clustered(n=300)
+        db = str(tmp_path / "search.db")
+        store = {"proposal": matrix}
+        monkeypatch.setattr(ann, "ANN_ENABLED", True)
+        monkeypatch.setattr(ann, "ANN_MIN_ROWS", 100)
+        monkeypatch.setattr(ann, "ANN_NLIST", 8)
+        train = ann.IVFIndex.train
+        held = []
+
+        def spy(vectors, nlist=0, **kwargs):
+            held.append(search._vector_lock.locked())
+            return train(vectors, nlist, **kwargs)
+
+        monkeypatch.setattr(ann.IVFIndex, "train", staticmethod(spy))
+        with search._vector_lock:
+            thread = search._schedule_ann(db, store)
+            assert search._schedule_ann(db, store) is None  # already in flight
+            matrix.upsert("late", "", np.ones(matrix.dim))
+        thread.join()
+
+        assert held == [False]
+        assert matrix.ivf is not None and matrix.ivf.nlist == 8
+        assert matrix.top_k(search._normalise(np.ones(matrix.dim)), 1, 0.0, nprobe=1)[0][0] == "late"
+        assert "proposal" in ann.load(ann.sidecar_path(db))
+
+    def test_sidecar_roundtrip(self, tmp_path):
+        from core import ann
+
+        np, _, _, matrix = self._clustered(n=200)
+        index = ann.IVFIndex.train(matrix.vectors(), nlist=8)
+        path = ann.sidecar_path(str(tmp_path / "search.db"))
+        ann.save(path, {"proposal": index})
+
+        loaded = ann.load(path)["proposal"]
+        assert loaded.nlist == 8
+        assert loaded.trained_rows == 200
+        assert np.allclose(loaded.centroids, index.centroids)
+
+
+def _search_db(path) -> str:
+    """Empty standalone search index file."""
+    init_search_tables(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def source(fake_pg):
+    """Postgres prompts/agents/proposals (and the search_changes log) behind get_pool()."""
+    fake_pg.handler = SourceTables()
+    return fake_pg.handler
+
+
+class TestBatchedSync:
+    """sync_search_index embeds pending rows in batches."""
+
+    def test_full_rebuild_embeds_in_batches(self, tmp_path, monkeypatch, source):
+        import sqlite3
+        from core import search
+
+        db = _search_db(tmp_path / "batch.db")
+        for i in range(25):
+            source.add("prompts", id=f"p{i:02d}", title=f"Round {i}", context_text="context")
+        encoder = FakeEncoder(dim=8)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        monkeypatch.setattr(search, "_SYNC_PAGE", 20)
+
+        assert asyncio.run(sync_search_index(db, incremental=False, batch_size=10)) == 25
+        assert encoder.batches == [10, 10, 5]  # pages of 20 and 5 rows
+        conn = sqlite3.connect(db)
+        count = conn.execute("SELECT COUNT(*) FROM search_embeddings").fetchone()[0]
+        conn.close()
+        assert count == 25
+
+
+class TestWatermarkSync:
+    """The initial build pages past a high-water mark; later syncs replay the Postgres change log."""
+
+    def _db(self, tmp_path, source):
+        db = _search_db(tmp_path / "wm.db")
+        source.add("prompts", id="p1", title="Pizza night", context_text="")
+        assert asyncio.run(sync_search_index(db)) == 1
+        return db
+
+    def _meta(self, db, key):
+        import sqlite3
+
+        conn = sqlite3.connect(db)
+        row = conn.execute("SELECT value FROM search_meta WHERE key = ?", (key,)).fetchone()
+        conn.close()
+        return row[0]
+
+    def test_new_rows_come_from_the_log_after_the_build(self, tmp_path, fake_pg, source):
+        db = self._db(tmp_path, source)
+        assert asyncio.run(sync_search_index(db)) == 0
+        pages = len([sql for _, sql, _ in fake_pg.calls if ".created_at, " in sql])
+        source.add("agents", id="a1", name="Tacobot", created_at="2026-01-02T00:00:00+00:00")
+        assert asyncio.run(sync_search_index(db)) == 1
+        assert len([sql for _, sql, _ in fake_pg.calls if ".created_at, " in sql]) == pages  # no keyset pass
+        assert self._meta(db, "changes:inserts") == "1"
+
+    def test_row_stamped_before_the_mark_is_not_lost(self, tmp_path, source):
+        """A row whose created_at predates rows already synced (late commit, clock skew) is still indexed."""
+        db = self._db(tmp_path, source)
+        source.add("prompts", id="p3", title="Ramen night", context_text="",
+                   created_at="2026-01-03T00:00:00+00:00")
+        assert asyncio.run(sync_search_index(db)) == 1
+        source.add("prompts", id="p2", title="Taco night", context_text="",
+                   created_at="2026-01-02T00:00:00+00:00")
+        assert asyncio.run(sync_search_index(db)) == 1
+        assert [r["entity_id"] for r in hybrid_search("taco", db_path=db)] == ["p2"]
+
+    def test_interrupted_build_resumes_from_its_pinned_cursor(self, tmp_path, monkeypatch, source):
+        from core import search
+
+        db = _search_db(tmp_path / "resume.db")
+        for i in range(3):
+            source.add("prompts", id=f"p{i}", title=f"Round {i}", context_text="")
+        monkeypatch.setattr(search, "_SYNC_PAGE", 2)
+        pinned = source.txid
+        apply_sync = search._apply_sync
+        calls = []
+
+        def flaky(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("simulated crash")
+            return apply_sync(*args)
+
+        monkeypatch.setattr(search, "_apply_sync", flaky)
+        with pytest.raises(RuntimeError):
+            asyncio.run(sync_search_index(db))
+        assert json.loads(self._meta(db, "changes:cursor")) == [pinned, 0]
+
+        source.update("prompts", "p0", title="Sushi night")  # committed between the attempts
+        monkeypatch.setattr(search, "_apply_sync", apply_sync)
+        asyncio.run(sync_search_index(db))
+        assert [r["entity_id"] for r in hybrid_search("sushi", db_path=db)] == ["p0"]
+        assert {r["entity_id"] for r in hybrid_search("round", db_path=db)} == {"p1", "p2"}
+
+    def test_rows_the_outbox_already_indexed_are_skipped_by_the_build(self, tmp_path, source):
+        db = _search_db(tmp_path / "outbox.db")
+        source.add("prompts", id="p1", title="Pizza night", context_text="")
+        source.add("prompts", id="p2", title="Taco night", context_text="")
+        index_one("prompt", "p2", "Taco night", "Taco night", db_path=db)
+        assert asyncio.run(sync_search_index(db)) == 1
+        assert [r["entity_id"] for r in hybrid_search("taco", db_path=db)] == ["p2"]
+
+    def test_update_and_delete_are_replayed(self, tmp_path, source):
+        db = self._db(tmp_path, source)
+        source.update("prompts", "p1", title="Sushi night")
+        assert asyncio.run(sync_search_index(db)) == 1
+        assert any(r["entity_id"] == "p1" for r in hybrid_search("sushi", db_path=db))
+        assert not hybrid_search("pizza", db_path=db)
+
+        source.delete("prompts", "p1")
+        assert asyncio.run(sync_search_index(db)) == 1
+        assert not hybrid_search("sushi", db_path=db)
+        assert asyncio.run(sync_search_index(db)) == 0  # the cursor moved past both changes
+
+    def test_change_from_a_running_transaction_waits_for_it(self, tmp_path, source):
+        db = self._db(tmp_path, source)
+        source.update("prompts", "p1", title="Sushi night")
+        source.horizon = source.txid - 1  # that transaction hasn't committed yet
+        assert asyncio.run(sync_search_index(db)) == 0
+        source.horizon = None
+        assert asyncio.run(sync_search_index(db)) == 1
+        assert any(r["entity_id"] == "p1" for r in hybrid_search("sushi", db_path=db))
+
+    def test_index_older_than_the_change_log_is_rebuilt(self, tmp_path, monkeypatch, source):
+        import sqlite3
+        from datetime import timedelta
+        from core import search
+
+        db = self._db(tmp_path, source)
+        monkeypatch.setattr(search, "CHANGE_RETENTION", timedelta(seconds=-1))
+        assert asyncio.run(sync_search_index(db)) == 1  # full rebuild
+        conn = sqlite3.connect(db)
+        assert conn.execute("SELECT COUNT(*) FROM search_fts").fetchone()[0] == 1
+        conn.close()
+
+
+class TestConnectionCache:
+    """Per-thread persistent search DB connections."""
+
+    def test_connection_reused_and_configured(self, tmp_path):
+        from core.search import _connect, search_pool_stats
+
+        db = str(tmp_path / "conn.db")
+        with _connect(db) as first:
+            pass
+        before = search_pool_stats()["reused"]
+        with _connect(db) as second:
+            assert second is first
+            assert second.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+            assert second.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert search_pool_stats()["reused"] == before + 1
+
+    def test_reopens_when_file_replaced(self, tmp_path):
+        import os
+        from core.search import _connect, close_search_connections
+
+        db = str(tmp_path / "replaced.db")
+        with _connect(db) as conn:
+            conn.execute("CREATE TABLE t (x)")
+        os.remove(db)
+        with _connect(db) as conn:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE name = 't'").fetchall()
+        assert tables == []
+        close_search_connections()
+
+    def test_finished_threads_connections_are_closed(self, tmp_path):
+        import sqlite3
+        import threading
+        from core import search
+
+        db = str(tmp_path / "threads.db")
+        opened = []
+
+        def work():
+            with search._connect(db) as conn:
+                opened.append(conn)
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        assert thread in search._conns_by_thread  # still referenced, so not yet finalized
+
+        search.search_pool_stats()  # prunes threads that are no longer alive
+        assert thread not in search._conns_by_thread
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened[0].execute("SELECT 1")
+
+
+class TestQueryCaches:
+    """Query-embedding LRU and generation-invalidated result cache."""
+
+    def test_lru_evicts_oldest_and_counts(self):
+        from core.search import _LRUCache
+
+        cache = _LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)  # evicts "b", the least recently used
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_results_cached_until_index_write(self, tmp_path, monkeypatch):
+        from core import search
+
+        encoder = FakeEncoder(dim=8)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        search.clear_search_caches()
+        db = _search_db(tmp_path / "cache.db")
+        index_one("prompt", "c1", "Rainy day", "Rainy day blues", db_path=db)
+        embeds_after_index = len(encoder.batches)
+
+        first = hybrid_search("rainy day", db_path=db)
+        first[0]["prompt_id"] = "mutated by caller"
+        second = hybrid_search("Rainy   DAY", db_path=db)
+        assert "prompt_id" not in second[0]
+        assert len(encoder.batches) == embeds_after_index + 1  # query embedded once
+
+        index_one("prompt", "c2", "Rainy day again", "Rainy day again", db_path=db)
+        third = hybrid_search("rainy day", db_path=db)
+        assert {r["entity_id"] for r in third} == {"c1", "c2"}
+        assert search.search_cache_stats()["query_embeddings"]["hits"] >= 1
+
+    @staticmethod
+    def _foreign_write(db, *statements, log=()):
+        """Run statements as a second worker would, logging (entity_type, entity_id, op, title) rows."""
+        import sqlite3
+
+        other = sqlite3.connect(db)
+        for sql, args in statements:
+            other.execute(sql, args)
+        other.execute("UPDATE search_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+        (generation,) = other.execute("SELECT value FROM search_meta WHERE key = 'generation'").fetchone()
+        other.executemany(
+            "INSERT INTO search_log (generation, entity_type, entity_id, op, title) VALUES (?, ?, ?, ?, ?)",
+            [(int(generation), *entry) for entry in log],
+        )
+        other.commit()
+        other.close()
+
+    def test_write_from_another_process_is_replayed(self, tmp_path, monkeypatch):
+        """Another worker's logged writes are applied to this process's vectors, not a reload."""
+        from core import search, suggest
+
+        encoder = FakeEncoder(dim=8)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        db = _search_db(tmp_path / "shared.db")
+        index_one("prompt", "c1", "Rainy day", "Rainy day blues", db_path=db)
+        assert [r["entity_id"] for r in hybrid_search("rainy", db_path=db)] == ["c1"]
+        hits = search._results.stats()["hits"]
+        assert [r["entity_id"] for r in hybrid_search("rainy", db_path=db)] == ["c1"]
+        assert search._results.stats()["hits"] == hits + 1  # own writes don't look foreign
+        suggest.warm(db)
+        index = suggest._indexes[db]
+        store = search._vector_stores.get(db)
+
+        emb = search._pack_embedding(next(iter(encoder.embed(["Rainy night"]))))
+        self._foreign_write(
+            db,
+            *[(f"DELETE FROM {table} WHERE entity_id = 'c1'", ())
+              for table in ("search_fts", "search_embeddings", "search_emoji")],
+            ("INSERT INTO search_fts (entity_type, entity_id, title, content) VALUES (?, ?, ?, ?)",
+             ("prompt", "c2", "Rainy night", "Rainy night")),
+            ("INSERT INTO search_embeddings (entity_type, entity_id, content, embedding) VALUES (?, ?, ?, ?)",
+             ("prompt", "c2", "Rainy night", emb)),
+            log=[("prompt", "c1", "delete", None), ("prompt", "c2", "upsert", "Rainy night")],
+        )
+
+        assert [r["entity_id"] for r in hybrid_search("rainy", db_path=db)] == ["c2"]
+        assert suggest._indexes[db] is index  # updated in place, not dropped
+        assert [s.get("entity_id") for s in suggest.suggest("rai", db_path=db) if s["type"] != "query"] == ["c2"]
+        if search.np is not None:
+            assert search._vector_stores[db] is store
+            matrix = store["prompt"]
+            assert matrix.vector("c1") is None
+            assert matrix.vector("c2") is not None
+
+    def test_rebuild_in_another_process_drops_cached_state(self, tmp_path, monkeypatch):
+        """A logged reset, or a gap the log no longer covers, reloads from the file."""
+        from core import search, suggest
+
+        monkeypatch.setattr(search, "_get_encoder", lambda: FakeEncoder(dim=8))
+        db = _search_db(tmp_path / "shared.db")
+        index_one("prompt", "c1", "Rainy day", "Rainy day blues", db_path=db)
+        hybrid_search("rainy", db_path=db)
+        suggest.warm(db)
+        store = search._vector_stores.get(db)
+
+        self._foreign_write(
+            db,
+            *[(f"DELETE FROM {table}", ()) for table in ("search_fts", "search_embeddings", "search_emoji")],
+            log=[("", "", "reset", None)],
+        )
+        assert hybrid_search("rainy", db_path=db) == []
+        assert not suggest.is_loaded(db)
+        if search.np is not None:
+            assert search._vector_stores[db] is not store
+            assert "prompt" not in search._vector_stores[db]
+
+        hybrid_search("rainy", db_path=db)
+        suggest.warm(db)
+        self._foreign_write(db)  # bumped without a log entry, e.g. already pruned
+        hybrid_search("rainy", db_path=db)
+        assert not suggest.is_loaded(db)
+
+
+class TestEmbedBatcher:
+    """Micro-batching of concurrent query embeddings."""
+
+    def test_concurrent_calls_share_batches(self, monkeypatch):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from core import search
+
+        encoder = FakeEncoder(dim=8)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        batcher = search._EmbedBatcher(max_batch=8, max_wait=0.05)
+        barrier = threading.Barrier(16)
+
+        def embed(text):
+            barrier.wait()
+            return batcher.submit(text)
+
+        with ThreadPoolExecutor(16) as pool:
+            vectors = list(pool.map(embed, [f"query {i}" for i in range(16)]))
+
+        expected = [list(v) for v in FakeEncoder(dim=8).embed([f"query {i}" for i in range(16)])]
+        assert [pytest.approx(v) for v in vectors] == expected
+        assert batcher.items == 16
+        assert batcher.batches < 16
+        assert max(encoder.batches) <= 8
+
+    def test_encoder_error_reaches_caller(self, monkeypatch):
+        from core import search
+
+        class Broken:
+            def embed(self, texts, **kwargs):
+                raise RuntimeError("onnx failure")
+
+        monkeypatch.setattr(search, "_get_encoder", lambda: Broken())
+        with pytest.raises(RuntimeError):
+            search._EmbedBatcher(max_batch=4, max_wait=0.001).submit("boom")
+
+    def test_timed_out_request_is_dropped_unembedded(self, monkeypatch):
+        import threading
+        from concurrent.futures import TimeoutError as FutureTimeout
+        from core import search
+
+        gate = threading.Event()
+
+        class Slow(FakeEncoder):
+            def embed(self, texts, **kwargs):
+                gate.wait(5)
+                return super().embed(texts, **kwargs)
+
+        encoder = Slow(dim=8)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        batcher = search._EmbedBatcher(max_batch=8, max_wait=0.001)
+        first = threading.Thread(target=batcher.submit, args=("busy",))
+        first.start()
+        while batcher.items == 0:
+            threading.Event().wait(0.001)  # the batcher is now stuck on "busy"
+
+        with pytest.raises(FutureTimeout):
+            batcher.submit("late", timeout=0.05)
+        gate.set()
+        first.join()
+        assert batcher.submit("next") is not None
+        assert batcher.cancelled == 1
+        assert batcher.items == 2  # "busy" and "next"; "late" never reached the encoder
+
+
+class TestParallelLegs:
+    """BM25 and vector legs run concurrently under a shared deadline."""
+
+    def test_slow_vector_leg_falls_back_to_bm25(self, tmp_path, monkeypatch):
+        import time
+        from core import search
+
+        encoder = FakeEncoder(dim=8)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        db = _search_db(tmp_path / "legs.db")
+        index_one("prompt", "l1", "Thunderstorm", "Thunderstorm warning", db_path=db)
+
+        def slow_leg(*args):
+            time.sleep(0.5)
+            return [[("prompt", "never", "")]]
+
+        monkeypatch.setattr(search, "_vector_leg", slow_leg)
+        monkeypatch.setattr(search, "_LEG_TIMEOUT", 0.05)
+        search.clear_search_caches()
+
+        started = time.monotonic()
+        results = hybrid_search("thunderstorm", db_path=db)
+        assert time.monotonic() - started < 0.4
+        assert [r["entity_id"] for r in results] == ["l1"]
+        assert search.search_cache_stats()["results"]["size"] == 0  # degraded answers aren't cached
+
+    def test_late_leg_is_cancelled_and_vector_leg_stops_at_deadline(self, tmp_path, monkeypatch):
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from core import search
+
+        gate = threading.Event()
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(gate.wait, 5)  # the only worker is busy
+            queued = pool.submit(lambda: "never")
+            assert search._leg_result(queued, time.monotonic() + 0.02, "Vector", "q") is None
+            assert queued.cancelled()
+            gate.set()
+
+        monkeypatch.setattr(search, "_embed_query", lambda q, deadline=None: [1.0, 0.0])
+        db = _search_db(tmp_path / "late.db")
+        assert search._vector_leg({db: None}, "q", 10, time.monotonic() - 1) is None
+
+    def test_bm25_leg_honours_deadline(self, tmp_path):
+        import time
+        from core.search import _bm25_leg
+
+        import sqlite3
+
+        db = _search_db(tmp_path / "deadline.db")
+        conn = sqlite3.connect(db)
+        conn.executemany(
+            "INSERT INTO search_fts (entity_type, entity_id, title, content) VALUES ('prompt', ?, ?, ?)",
+            [(f"d{i}", f"Deadline {i}", f"deadline content {i}") for i in range(3000)],
+        )
+        conn.commit()
+        conn.close()
+
+        assert _bm25_leg(db, "deadline*", "", [], 10, time.monotonic() - 1) is None
+        rows = _bm25_leg(db, "deadline*", "", [], 10, time.monotonic() + 5)
+        assert len(rows) == 10
+
+
+class TestFusion:
+    """Bounded top-k selection in RRF fusion and the numpy-free vector scan."""
+
+    def test_fuse_matches_full_sort(self):
+        import random
+        from core.search import _fuse
+
+        rng = random.Random(11)
+        ids = [f"e{i}" for i in range(60)]
+        bm25 = [
+            {"entity_type": "prompt", "entity_id": eid, "title": eid, "snippet": None}
+            for eid in rng.sample(ids, 40)
+        ]
+        vector = [("prompt", eid, f"content {eid}") for eid in rng.sample(ids, 40)]
+
+        rrf: dict = {}
+        for rank, row in enumerate(bm25):
+            key = (row["entity_type"], row["entity_id"])
+            rrf[key] = rrf.get(key, 0.0) + 1.0 / (60 + rank + 1)
+        for rank, (etype, eid, _) in enumerate(vector):
+            rrf[(etype, eid)] = rrf.get((etype, eid), 0.0) + 1.0 / (60 + rank + 1)
+        expected = [eid for (_, eid), _ in sorted(rrf.items(), key=lambda x: -x[1])[:10]]
+
+        assert [r["entity_id"] for r in _fuse([bm25], [vector], 10)] == expected
+
+    def test_fuse_single_leg_and_empty(self):
+        from core.search import _fuse
+
+        vector = [("agent", f"a{i}", f"Agent {i}") for i in range(5)]
+        assert [r["entity_id"] for r in _fuse([], [vector], 3)] == ["a0", "a1", "a2"]
+        assert _fuse([], [], 3) == []
+
+    def test_vector_scan_keeps_best_in_order(self, tmp_path, monkeypatch):
+        from core import search
+
+        monkeypatch.setattr(search, "_get_encoder", lambda: FakeEncoder(dim=8))
+        db = str(tmp_path / "scan.db")
+        init_search_tables(db)
+        search.index_many([("prompt", f"p{i}", "", f"doc {i}") for i in range(50)], db)
+        query = search._embed_batch(["doc 7"])[0]
+
+        with search._connect(db) as conn:
+            got = search._vector_scan(conn, list(query), None, 5)
+            rows = conn.execute("SELECT entity_id, embedding FROM search_embeddings").fetchall()
+        sims = sorted(
+            ((search._cosine_similarity(list(query), search._unpack_embedding(r["embedding"])), r["entity_id"])
+             for r in rows),
+            reverse=True,
+        )
+        assert got[0][1] == "p7"
+        assert [eid for _, eid, _ in got] == [eid for sim, eid in sims[:5] if sim > search._MIN_SIMILARITY]
+
+
+class TestEmojiIndex:
+    """search_emoji inverted index and the emoji leg of hybrid_search."""
+
+    def test_tokens_normalise_clusters_and_emoticons(self):
+        from core.emoji_tokens import tokens
+
+        assert tokens("love ❤️ it") == ["❤"]
+        assert tokens("👍🏽") == ["👍🏽", "👍"]
+        assert tokens("👨\u200d👩\u200d👧 🇫🇷") == ["👨\u200d👩\u200d👧", "🇫🇷"]
+        assert tokens("yay \\o/ :-) nice.") == ["\\o/", ":)"]
+        assert tokens("no emoji here") == []
+
+    def test_tokens_cover_seed_and_house_agent_strings(self):
+        """The Live Battle Example seeds and the emoticons house agents are told to use."""
+        from core.emoji_tokens import tokens
+
+        assert tokens(":'D \\o/ ^_^") == [":'D", "\\o/", "^_^"]
+        assert tokens("😂🎉🙌🔥") == ["😂", "🎉", "🙌", "🔥"]
+        assert tokens(":), ;), :'-D, >_<") == [":)", ";)", ":'D", ">_<"]
+
+    def test_emoji_query_finds_proposals(self, tmp_path):
+        db = str(tmp_path / "emoji.db")
+        init_search_tables(db)
+        index_one("proposal", "hot", "Spicy", "🔥🔥 🌶️ Spicy take", db)
+        index_one("proposal", "cold", "Chilly", "🧊 ❄️ Brr", db)
+        index_one("agent", "smiley", "Smiley :)", "Smiley :)", db)
+
+        assert [r["entity_id"] for r in hybrid_search("🔥", db_path=db)] == ["hot"]
+        assert [r["entity_id"] for r in hybrid_search("❄", db_path=db)] == ["cold"]
+        assert [r["entity_id"] for r in hybrid_search(":-)", db_path=db)] == ["smiley"]
+        assert hybrid_search("🔥", entity_types=["agent"], db_path=db) == []
+
+        delete_one("proposal", "hot", db)
+        assert hybrid_search("🔥", db_path=db) == []
+
+    def test_backfill_existing_index(self, tmp_path):
+        import sqlite3
+
+        db = str(tmp_path / "legacy.db")
+        init_search_tables(db)
+        index_one("prompt", "p1", "Party 🎉", "Party 🎉", db)
+        conn = sqlite3.connect(db)
+        conn.execute("DELETE FROM search_emoji")
+        conn.execute("DELETE FROM search_meta WHERE key = 'emoji_index'")
+        conn.commit()
+        conn.close()
+
+        init_search_tables(db)
+        assert [r["entity_id"] for r in hybrid_search("🎉", db_path=db)] == ["p1"]
+
+
+class TestRelated:
+    """Nearest neighbours from stored vectors, cached per entity."""
+
+    def _db(self, tmp_path, monkeypatch):
+        pytest.importorskip("numpy")
+        from core import search
+
+        encoder = FakeEncoder(dim=16)
+        monkeypatch.setattr(search, "_get_encoder", lambda: encoder)
+        db = str(tmp_path / "related.db")
+        init_search_tables(db)
+        search.index_many([("prompt", f"p{i}", f"t{i}", f"doc {i}") for i in range(30)], db)
+        return search, db, encoder
+
+    def test_neighbours_match_exhaustive_cosine(self, tmp_path, monkeypatch):
+        search, db, encoder = self._db(tmp_path, monkeypatch)
+        calls = len(encoder.batches)
+        got = search.related("prompt", "p3", limit=5, db_path=db)
+        assert len(encoder.batches) == calls  # no encoder call at request time
+
+        vecs = {f"p{i}": search._embed_batch([f"doc {i}"])[0] for i in range(30)}
+        sims = sorted(
+            ((search._cosine_similarity(list(vecs["p3"]), list(v)), eid) for eid, v in vecs.items() if eid != "p3"),
+            reverse=True,
+        )
+        assert [eid for eid, _ in got] == [eid for sim, eid in sims if sim > search._MIN_SIMILARITY][:5]
+
+    def test_cache_invalidated_by_same_type_write(self, tmp_path, monkeypatch):
+        search, db, _ = self._db(tmp_path, monkeypatch)
+        search.related("prompt", "p3", limit=5, db_path=db)
+        before = search._related.stats()["hits"]
+        search.related("prompt", "p3", limit=5, db_path=db)
+        assert search._related.stats()["hits"] == before + 1
+
+        top = search.related("prompt", "p3", limit=1, db_path=db)[0][0]
+        delete_one("prompt", top, db)
+        assert top not in [eid for eid, _ in search.related("prompt", "p3", limit=5, db_path=db)]
+
+
+class TestShardedIndex:
+    """SEARCH_SHARDED: one index file per entity type, searched in parallel."""
+
+    def _db(self, tmp_path, monkeypatch, fake_pg):
+        from core import search
+
+        monkeypatch.setattr(search, "_SHARDED", True)
+        db = _search_db(tmp_path / "sharded.db")
+        fake_pg.handler = source = SourceTables()
+        source.add("prompts", id="p1", title="Taco night", context_text="")
+        source.add("agents", id="a1", name="Taco scout")
+        source.add("proposals", id="r1", prompt_id="p1", agent_id="a1", emoji_string="🌮", rationale="taco emoji")
+        assert asyncio.run(sync_search_index(db)) == 3
+        return search, db
+
+    def test_each_type_lives_in_its_own_file(self, tmp_path, monkeypatch, fake_pg):
+        import sqlite3
+
+        search, db = self._db(tmp_path, monkeypatch, fake_pg)
+        for etype, eid in (("prompt", "p1"), ("agent", "a1"), ("proposal", "r1")):
+            path = search.shard_path(db, etype)
+            assert path == str(tmp_path / f"sharded.{etype}.db")
+            conn = sqlite3.connect(path)
+            assert conn.execute("SELECT entity_type, entity_id FROM search_fts").fetchall() == [(etype, eid)]
+            conn.close()
+        conn = sqlite3.connect(db)  # bookkeeping only
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_fts'").fetchone()
+        conn.close()
+
+        assert {r["entity_id"] for r in hybrid_search("taco", db_path=db)} == {"p1", "a1", "r1"}
+        assert [r["entity_id"] for r in hybrid_search("taco", entity_types=["agent"], db_path=db)] == ["a1"]
+        assert [r["entity_id"] for r in hybrid_search("🌮", db_path=db)] == ["r1"]
+
+    def test_locked_shard_does_not_block_other_types(self, tmp_path, monkeypatch, fake_pg):
+        import sqlite3
+
+        search, db = self._db(tmp_path, monkeypatch, fake_pg)
+        writer = sqlite3.connect(search.shard_path(db, "proposal"), timeout=0)
+        writer.execute("BEGIN IMMEDIATE")  # a long proposal indexing transaction
+        try:
+            index_one("prompt", "p2", "Burrito night", "Burrito night", db)
+            assert [r["entity_id"] for r in hybrid_search("burrito", db_path=db)] == ["p2"]
+        finally:
+            writer.rollback()
+            writer.close()
+
+    def test_write_keeps_other_shards_cached(self, tmp_path, monkeypatch, fake_pg):
+        search, db = self._db(tmp_path, monkeypatch, fake_pg)
+        search.clear_search_caches()
+        hybrid_search("taco", entity_types=["prompt"], db_path=db)
+        index_one("proposal", "r2", "More tacos", "More tacos", db)
+        hits = search._results.stats()["hits"]
+        hybrid_search("taco", entity_types=["prompt"], db_path=db)
+        assert search._results.stats()["hits"] == hits + 1
+
+        delete_one("prompt", "p1", db)
+        assert not hybrid_search("taco", entity_types=["prompt"], db_path=db)
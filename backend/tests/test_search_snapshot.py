@@ -0,0 +1,142 @@
+"""
+Tests for search index snapshot / restore (core/search_snapshot.py).
+"""
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core import search_snapshot
+from core.search import hybrid_search, index_one, init_search_tables
+from tests.conftest import SourceTables
+
+
+@pytest.fixture
+def live_index(tmp_path):
+    db_path = str(tmp_path / "live.db")
+    init_search_tables(db_path)
+    index_one("prompt", "p1", "Pizza night", "cheese and tomato", db_path)
+    return db_path
+
+
+def test_snapshot_round_trip(live_index, tmp_path):
+    target = str(tmp_path / "volume" / "snapshot.db")
+    (tmp_path / "volume").mkdir()
+    meta = asyncio.run(search_snapshot.save_snapshot(live_index, target))
+    assert meta["format"] == search_snapshot.SNAPSHOT_FORMAT
+
+    fresh = str(tmp_path / "fresh.db")
+    watermark = asyncio.run(search_snapshot.restore_snapshot(fresh, target))
+    assert watermark == meta["watermark"]
+    assert any(r["entity_id"] == "p1" for r in hybrid_search("pizza", db_path=fresh))
+
+
+def test_restore_skipped_when_index_populated(live_index, tmp_path):
+    target = str(tmp_path / "snapshot.db")
+    asyncio.run(search_snapshot.save_snapshot(live_index, target))
+    assert asyncio.run(search_snapshot.restore_snapshot(live_index, target)) is None
+
+
+def test_incompatible_snapshot_ignored(live_index, tmp_path):
+    target = str(tmp_path / "snapshot.db")
+    asyncio.run(search_snapshot.save_snapshot(live_index, target))
+    conn = sqlite3.connect(target)
+    conn.execute("UPDATE search_meta SET value = '999' WHERE key = 'snapshot_format'")
+    conn.commit()
+    conn.close()
+
+    fresh = str(tmp_path / "fresh.db")
+    assert asyncio.run(search_snapshot.restore_snapshot(fresh, target)) is None
+
+
+def test_unconfigured_target_is_noop(live_index):
+    assert asyncio.run(search_snapshot.save_snapshot(live_index, "")) is None
+    assert asyncio.run(search_snapshot.restore_snapshot(live_index, "")) is None
+
+
+def test_one_worker_owns_snapshots(tmp_path, monkeypatch):
+    import fcntl
+    import os
+
+    monkeypatch.setattr(search_snapshot, "_owner_locks", {})
+    db_path = str(tmp_path / "live.db")
+    other = os.open(db_path + ".snapshot.lock", os.O_RDWR | os.O_CREAT)  # a second worker's claim
+    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    assert not search_snapshot.claim_snapshots(db_path)
+
+    os.close(other)  # that worker exited
+    assert search_snapshot.claim_snapshots(db_path)
+    assert search_snapshot.claim_snapshots(db_path)  # kept, not re-taken
+    os.close(search_snapshot._owner_locks[db_path])
+
+
+def test_startup_lock_serialises_workers(tmp_path):
+    db_path = str(tmp_path / "live.db")
+    order = []
+
+    async def worker(name):
+        async with search_snapshot.startup_lock(db_path):
+            order.append(f"{name} in")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} out")
+
+    async def run():
+        await asyncio.gather(worker("a"), worker("b"))
+
+    asyncio.run(run())
+    assert order in (["a in", "a out", "b in", "b out"], ["b in", "b out", "a in", "a out"])
+
+
+def test_snapshot_round_trip_through_postgres(live_index, tmp_path, fake_pg):
+    rows = {}
+
+    def snapshots(method, sql, args):
+        if sql.lstrip().startswith("INSERT INTO search_snapshots"):
+            rows[args[0]] = {"id": args[0], "format": args[1], "data": args[4]}
+        elif "FROM search_snapshots" in sql:
+            return [rows[i] for i in args[0] if i in rows]
+
+    fake_pg.handler = snapshots
+    meta = asyncio.run(search_snapshot.save_snapshot(live_index, "postgres"))
+    assert meta["bytes"] == len(rows[1]["data"])
+
+    fresh = str(tmp_path / "fresh.db")
+    assert asyncio.run(search_snapshot.restore_snapshot(fresh, "postgres")) == meta["watermark"]
+    assert any(r["entity_id"] == "p1" for r in hybrid_search("pizza", db_path=fresh))
+
+
+def _ago(**delta) -> str:
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat()
+
+
+def test_apply_delta_reindexes_rows_after_watermark(live_index, fake_pg):
+    source = fake_pg.handler = SourceTables()
+    source.add("agents", id="a0", name="EarlyAgent", created_at=_ago(days=1))
+    source.add("agents", id="a9", name="LateAgent", created_at=_ago(minutes=1))
+
+    assert asyncio.run(search_snapshot.apply_delta(_ago(hours=1), live_index)) == 1
+    assert any(r["entity_id"] == "a9" for r in hybrid_search("LateAgent", db_path=live_index))
+
+
+def test_apply_delta_past_log_retention_rebuilds(live_index, fake_pg):
+    source = fake_pg.handler = SourceTables()
+    source.add("agents", id="a0", name="EarlyAgent", created_at=_ago(days=30))
+
+    assert asyncio.run(search_snapshot.apply_delta(_ago(days=30), live_index)) == 1
+    assert not hybrid_search("pizza", db_path=live_index)  # p1 is gone from Postgres
+    assert any(r["entity_id"] == "a0" for r in hybrid_search("EarlyAgent", db_path=live_index))
+
+
+def test_apply_delta_replays_updates_and_deletes(live_index, fake_pg):
+    source = fake_pg.handler = SourceTables()
+    index_one("agent", "a1", "Tacobot", "Tacobot", live_index)
+    source.add("prompts", id="p1", title="Pizza night", context_text="cheese and tomato",
+               created_at="2025-12-01T00:00:00+00:00")
+    source.update("prompts", "p1", title="Sushi night")
+    source.delete("agents", "a1")
+
+    assert asyncio.run(search_snapshot.apply_delta(_ago(minutes=5), live_index)) == 2
+    assert [r["entity_id"] for r in hybrid_search("sushi", db_path=live_index)] == ["p1"]
+    assert not hybrid_search("pizza", db_path=live_index)
+    assert not hybrid_search("tacobot", db_path=live_index)
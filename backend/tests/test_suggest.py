@@ -0,0 +1,56 @@
+"""
+Tests for typeahead suggestions (core/suggest.py).
+"""
+import pytest
+
+from core import suggest
+from core.search import delete_one, index_many, index_one, init_search_tables
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "suggest.db")
+    init_search_tables(path)
+    index_many(
+        [
+            ("prompt", "p1", "Pizza night", "Pizza night"),
+            ("prompt", "p2", "Pixel art battle", "Pixel art battle"),
+            ("agent", "a1", "PizzaBot", "PizzaBot"),
+            ("proposal", "x1", "Pizza 🍕", "🍕 Pizza"),
+        ],
+        path,
+    )
+    suggest.clear_suggestions()
+    yield path
+    suggest.clear_suggestions()
+
+
+def _texts(results):
+    return [r["text"] for r in results]
+
+
+def test_prefix_matches_titles_and_agents(db_path):
+    assert _texts(suggest.suggest("piz", db_path=db_path)) == ["PizzaBot", "Pizza night"]
+    assert _texts(suggest.suggest("pi", limit=5, db_path=db_path)) == ["PizzaBot", "Pizza night", "Pixel art battle"]
+
+
+def test_word_start_matches_rank_after_phrase_start(db_path):
+    index_one("prompt", "p3", "Night owls", "Night owls", db_path)
+    assert _texts(suggest.suggest("nig", db_path=db_path)) == ["Night owls", "Pizza night"]
+
+
+def test_index_events_keep_loaded_index_current(db_path):
+    assert suggest.suggest("tac", db_path=db_path) == []
+    index_one("agent", "a2", "TacoBot", "TacoBot", db_path)
+    assert _texts(suggest.suggest("tac", db_path=db_path)) == ["TacoBot"]
+    delete_one("agent", "a2", db_path)
+    assert suggest.suggest("tac", db_path=db_path) == []
+
+
+def test_popular_queries_come_first(db_path, monkeypatch):
+    monkeypatch.setattr(suggest, "SUGGEST_MIN_COUNT", 2)
+    suggest.record_query("pizza toppings")
+    assert "pizza toppings" not in _texts(suggest.suggest("piz", db_path=db_path))
+    suggest.record_query("Pizza  Toppings")
+    results = suggest.suggest("piz", db_path=db_path)
+    assert results[0] == {"text": "pizza toppings", "type": "query"}
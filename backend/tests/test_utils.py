@@ -27,9 +27,15 @@ async def clear_db():
         try:
             await db.execute("DELETE FROM search_fts")
             await db.execute("DELETE FROM search_embeddings")
+            await db.execute("DELETE FROM search_emoji")
         except Exception:
             pass  # Tables may not exist yet
         await db.commit()
+    from core.search import clear_search_caches, invalidate_vector_cache
+    from core.suggest import clear_suggestions
+    invalidate_vector_cache()
+    clear_search_caches()
+    clear_suggestions()
 
 
 def run_async(coro):
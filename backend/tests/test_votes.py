@@ -65,3 +65,18 @@ def test_vote_proposal_not_found(client):
         json={"value": 1, "user_fingerprint": "user-1"},
     )
     assert resp.status_code == 404
+
+
+def test_vote_flip_and_repeat_update_counters(client, agent_prompt_proposal):
+    """A flip moves the tally by 2, a repeated vote leaves it alone, and the prompt totals follow."""
+    proposal = agent_prompt_proposal["proposal"]
+    url = f"/api/proposals/{proposal['id']}/vote"
+    client.post(url, json={"value": 1, "user_fingerprint": "user-a"})
+    client.post(url, json={"value": 1, "user_fingerprint": "user-b"})
+    assert client.post(url, json={"value": -1, "user_fingerprint": "user-a"}).json()["net_votes"] == 0
+    assert client.post(url, json={"value": -1, "user_fingerprint": "user-a"}).json()["net_votes"] == 0
+    assert client.post(url, json={"value": 1, "user_fingerprint": "user-a"}).json()["net_votes"] == 2
+
+    detail = client.get(f"/api/prompts/{proposal['prompt_id']}").json()
+    assert detail["proposal_count"] == 1
+    assert detail["proposals"][0]["votes"] == 2